@@ -0,0 +1,94 @@
+"""
+Per-call CPU of a decorated function over the OpenAI SDK and over the raw httpx transport (`LLMFunc(transport="httpx")`).
+
+A local OpenAI compatible endpoint answers instantly, and only the CPU time of the calling thread is measured
+(time.thread_time), so the numbers are the framework and client overhead, without the network or the server.
+
+    python -m benchmarks.transport_overhead [calls]
+
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pydantic import BaseModel, Field
+
+from llm_as_function import LLMFunc
+
+RESPONSE = json.dumps(
+    {
+        "id": "bench",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-3.5-turbo-1106",
+        "choices": [{"index": 0, "finish_reason": "stop", "logprobs": None, "message": {"role": "assistant", "content": json.dumps({"label": "positive", "reason": "It is great"}), "refusal": None}}],
+        "usage": {"prompt_tokens": 120, "completion_tokens": 20, "total_tokens": 140, "prompt_tokens_details": {"cached_tokens": 0}},
+    }
+).encode()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real endpoints
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+class Sentiment(BaseModel):
+    label: str = Field(description="positive or negative")
+    reason: str = Field(description="Why, in one sentence")
+
+
+class Lookup(BaseModel):
+    word: str
+
+
+def lookup(query: Lookup) -> str:
+    """Looks up the sentiment of a word in the lexicon"""
+    return "positive"
+
+
+def measure(transport: str, base_url: str, calls: int) -> float:
+    """Mean CPU seconds of the calling thread per call"""
+    llm = LLMFunc(openai_api_key="sk-bench", openai_base_url=base_url, has_tool_support=True, transport=transport)  # type: ignore
+
+    @llm.func(lookup)
+    def classify(text) -> Sentiment:  # type: ignore
+        """Classify the sentiment of {text}"""
+
+    for _ in range(20):  # Warm the connection pool and the caches
+        classify(text="I love it")
+
+    start = time.thread_time()
+    for _ in range(calls):
+        classify(text="I love it")
+    return (time.thread_time() - start) / calls
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    try:
+        sdk = measure("sdk", base_url, calls)
+        raw = measure("httpx", base_url, calls)
+    finally:
+        server.shutdown()
+
+    print(f"sdk:   {sdk * 1e6:8.0f} us CPU per call")
+    print(f"httpx: {raw * 1e6:8.0f} us CPU per call ({(1 - raw / sdk) * 100:.0f}% less)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import os
 import sys
+import asyncio
 from dotenv import load_dotenv
 from rich import print
 
@@ -7,29 +8,24 @@ sys.path.append("../")
 load_dotenv()
 
 from pydantic import BaseModel, Field
-from llm_as_function import llama3_1_func, Final
-
-
-from time import sleep
+from llm_as_function import llama3_1_func, Final, fan_out
 
 
 class Result(BaseModel):
     value: int = Field(description="斐波那契数列计算的值")
 
 
-@llama3_1_func
-def f(x: int) -> Result:
+@llama3_1_func.async_call
+async def f(x: int) -> Result:
     """You need to calculate the {x}th term of the Fibonacci sequence.
     Given that you have the values of the two preceding terms, which are {a} and {b}. You calculate the {x}th term by adding the values of the two preceding terms. Please compute the value of the {x}th term.
     """
     if x == 1 or x == 0:
         return Final({"value": x})  # type: ignore
 
-    print(f"Running {x-1}")
-    a = f(x=x - 1)
-
-    print(f"Running {x-2}")
-    b = f(x=x - 2)
+    # f(x-1) and f(x-2) run concurrently, and f(x-2) is shared with the f(x-1) branch that also needs it
+    print(f"Running {x-1} and {x-2}")
+    a, b = await fan_out((f, {"x": x - 1}), (f, {"x": x - 2}))
 
     # if a.ok it means the unpack is a dict so ignore the type error
     a_value = a.unpack()["value"] if a.ok() else a.unpack()  # type: ignore
@@ -38,4 +34,4 @@ def f(x: int) -> Result:
     return {"a": a_value, "b": b_value}  # type: ignore
 
 
-print(f(x=3))
+print(asyncio.run(f(x=3)))
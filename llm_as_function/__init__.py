@@ -1,18 +1,35 @@
-from .llm_func import LLMFunc, Final
-import os
+from .llm_func import LLMFunc, Final, warmup_all, async_warmup_all
+from .cache import ToolCache
+from .cassette import use_cassette
+from .deadline import deadline
+from .fanout import fan_out
+from .metrics import metrics
+from .scheduler import AdaptiveLimit, Scheduler, call_priority
+from .profiler import Profiler, profile
+from .usage import Quota, Usage
 
-# OpenAI LLMFuncs
-gpt35_func = LLMFunc(temperature=0.1, has_tool_support=True)
-gpt4_func = LLMFunc(temperature=0.1, model="gpt-4o", has_tool_support=True)
+# The shared LLMFuncs, made on first use so importing the package doesn't import the SDKs of their providers
+_SHARED_LLM_FUNCS = {
+    # OpenAI LLMFuncs
+    "gpt35_func": dict(temperature=0.1, has_tool_support=True),
+    "gpt4_func": dict(temperature=0.1, model="gpt-4o", has_tool_support=True),
+    # Ollama LLMFuncs
+    "llama2_func": dict(temperature=0.1, model="llama2", has_structured_output=True),
+    "llama3_func": dict(temperature=0.1, model="llama3", has_structured_output=True),
+    "llama3_1_func": dict(temperature=0.1, model="llama3.1", has_tool_support=True, has_structured_output=True),
+    "llama3_3_func": dict(temperature=0.1, model="llama3.3", has_tool_support=True, has_structured_output=True),
+    "llama3_2_1b_func": dict(temperature=0.1, model="llama3.2.1b", has_tool_support=True, has_structured_output=True),
+    "qwq_func": dict(temperature=0.1, model="krtkygpta/qwq", has_tool_support=True, has_structured_output=True),
+    "qwen2_1_5b_func": dict(temperature=0.1, model="qwen2:1.5b", has_tool_support=True, has_structured_output=True),  # This has tool support but i haven't be able to relabily use it
+}
+
+
+def __getattr__(name: str) -> LLMFunc:
+    if name not in _SHARED_LLM_FUNCS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    llm_func = globals()[name] = LLMFunc(**_SHARED_LLM_FUNCS[name])
+    return llm_func
 
-# Ollama LLMFuncs
-llama2_func = LLMFunc(temperature=0.1, model="llama2", has_structured_output=True)
-llama3_func = LLMFunc(temperature=0.1, model="llama3", has_structured_output=True)
-llama3_1_func = LLMFunc(temperature=0.1, model="llama3.1", has_tool_support=True, has_structured_output=True)
-llama3_3_func = LLMFunc(temperature=0.1, model="llama3.3", has_tool_support=True, has_structured_output=True)
-llama3_2_1b_func = LLMFunc(temperature=0.1, model="llama3.2.1b", has_tool_support=True, has_structured_output=True)
-qwq_func = LLMFunc(temperature=0.1, model="krtkygpta/qwq", has_tool_support=True, has_structured_output=True)
-qwen2_1_5b_func = LLMFunc(temperature=0.1, model="qwen2:1.5b", has_tool_support=True, has_structured_output=True)  # This has tool support but i haven't be able to relabily use it
 
 __author__ = "Jianbai Ye"
 __version__ = "0.0.2"
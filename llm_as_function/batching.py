@@ -0,0 +1,126 @@
+import asyncio
+import contextvars
+import json
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Generic, Hashable, TypeVar
+
+from pydantic import BaseModel, Field, create_model
+
+from .utils import fill_placeholders
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+BATCH_PROMPT = """Do the following task for each of the {count} inputs below, independently of the others.
+
+Task:
+{task}
+
+Inputs, the values of the <placeholders> in the task:
+{inputs}
+
+Answer with the {count} results in the order of the inputs, under "results"."""
+
+
+@dataclass(frozen=True)
+class BatchPolicy:
+    """
+    Packs concurrent calls of an async decorated function into one request.
+
+    The calls made within window seconds of the first one are sent together, max_size at most.
+
+    """
+
+    max_size: int = 8
+    window: float = 0.01
+
+    def __post_init__(self):
+        assert self.max_size >= 1, f"The batch max_size must be at least 1, not {self.max_size}"
+
+
+def batch_output_schema(output_schema: type[BaseModel]) -> type[BaseModel]:
+    """The output schema of a batch: the results of every input, in order, under "results" """
+    return create_model(
+        f"{output_schema.__name__}Batch",
+        results=(list[output_schema], Field(description="One result per input, in the order of the inputs")),  # type: ignore
+    )
+
+
+def batch_prompt(prompt_template: str, variables: list[dict[str, Any]]) -> str:
+    """
+    One prompt for every input: the template once, with <placeholders> instead of the values, then the values of each input.
+    Raises the template's formatting error when the template is malformed.
+
+    """
+    task = fill_placeholders(prompt_template)
+    inputs = "\n".join(f"{index}. {json.dumps(item, ensure_ascii=False, default=str)}" for index, item in enumerate(variables, start=1))
+    return BATCH_PROMPT.format(count=len(variables), task=task, inputs=inputs)
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collects the items submitted concurrently and runs them by batches with run_batch(items, contexts) -> results (same order),
+    contexts being the context of each submitter. Only the items submitted with the same group() are batched together.
+
+    A batch is sent when it has max_size items or window seconds after its first item, whichever comes first.
+
+    """
+
+    def __init__(
+        self,
+        policy: BatchPolicy,
+        run_batch: Callable[[list[T], list[contextvars.Context]], Awaitable[list[R]]],
+        group: Callable[[], Hashable] | None = None,
+    ) -> None:
+        self.policy = policy
+        self.run_batch = run_batch
+        self.group = group
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._pending: dict[Hashable, list[tuple[T, contextvars.Context, asyncio.Future]]] = {}
+        self._timers: dict[Hashable, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, item: T) -> R:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # The batches never outlive their event loop
+            self._loop, self._pending, self._timers = loop, {}, {}
+
+        key = self.group() if self.group is not None else None
+        future = loop.create_future()
+        pending = self._pending.setdefault(key, [])
+        pending.append((item, contextvars.copy_context(), future))
+        if len(pending) >= self.policy.max_size:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.policy.window, self._flush, key)
+
+        return await future
+
+    def _flush(self, key: Hashable):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, [])
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[T, contextvars.Context, asyncio.Future]]):
+        try:
+            results = await self.run_batch([item for item, _, _ in batch], [context for _, context, _ in batch])
+        except BaseException as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            # run_batch can fail some items only, by returning their exception
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,69 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from pydantic import BaseModel
+
+
+def tool_cache_key(function_name: str, function_args: BaseModel) -> str:
+    """The canonical JSON of the validated arguments, so equivalent calls share a key whatever the argument order"""
+    return f"{function_name}:{json.dumps(function_args.model_dump(mode='json'), sort_keys=True, ensure_ascii=False)}"
+
+
+class ToolCache:
+    """
+    A thread-safe LRU cache of tool results, with an optional time to live (seconds).
+
+    One cache can be shared by several tools and several decorated functions, the keys include the tool name.
+
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float | None = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def count_hit(self):
+        """Counts a hit served without a lookup, e.g. a duplicate call deduplicated within one model turn"""
+        with self._lock:
+            self.hits += 1
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
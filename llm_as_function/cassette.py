@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Literal, TypeVar
+
+from pydantic import BaseModel
+
+from .errors import CassetteMiss
+from .utils import logger
+
+T = TypeVar("T", bound=BaseModel)
+
+# File layout: MAGIC, the zlib compressed JSON entries back to back, the zlib compressed JSON index
+# {request key: [[offset, length], ...]}, then the FOOTER with the offset and length of the index
+MAGIC = b"LLMCASSETTE1\n"
+FOOTER = struct.Struct("<QQ")
+
+
+def _jsonable(value: Any):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", exclude_none=True)
+    return repr(value)
+
+
+def request_key(provider: str, payload: dict) -> str:
+    """The key of a request: the hash of its provider and payload (the messages of the tool loop included)"""
+    canonical = json.dumps([provider, payload], sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=_jsonable)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+class Cassette:
+    """
+    Recorded provider responses, served back by request key, see `use_cassette`.
+
+    A request recorded several times (samples, or the same call made again) is replayed in the recorded order,
+    starting over once every recording was served.
+
+    """
+
+    def __init__(self, path: str, mode: Literal["record", "replay", "auto"] = "auto", latency_scale: float | None = None) -> None:
+        assert mode in ["record", "replay", "auto"], f"Cassette mode must in ['record', 'replay', 'auto'], not {mode}"
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale  # Replays sleep the recorded latency times this, None to answer at once
+        self._lock = threading.Lock()
+        self._entries: dict[str, list[bytes]] = {}  # The compressed entries of every request key
+        self._served: dict[str, int] = {}
+        self._recorded = 0
+
+        if mode != "record" and os.path.exists(path):
+            self._load()
+        elif mode == "replay":
+            raise FileNotFoundError(f"No cassette to replay at {path}")
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{self.path} is not a cassette")
+        index_offset, index_length = FOOTER.unpack_from(data, len(data) - FOOTER.size)
+        index = json.loads(zlib.decompress(data[index_offset : index_offset + index_length]))
+        self._entries = {key: [data[offset : offset + length] for offset, length in spans] for key, spans in index.items()}
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    def lookup(self, key: str) -> dict | None:
+        """The next recorded entry {"response", "latency"} of the request, None when it wasn't recorded"""
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+            return json.loads(zlib.decompress(entries[served % len(entries)]))
+
+    def record(self, key: str, response: BaseModel, latency: float):
+        entry = zlib.compress(json.dumps({"response": response.model_dump(mode="json"), "latency": latency}, separators=(",", ":")).encode())
+        with self._lock:
+            self._entries.setdefault(key, []).append(entry)
+            self._recorded += 1
+
+    def save(self):
+        """Writes every entry and the index, the file is replaced at once so a failed save keeps the previous cassette"""
+        with self._lock:
+            chunks, index, offset = [MAGIC], {}, len(MAGIC)
+            for key, entries in self._entries.items():
+                index[key] = []
+                for entry in entries:
+                    chunks.append(entry)
+                    index[key].append([offset, len(entry)])
+                    offset += len(entry)
+            compressed_index = zlib.compress(json.dumps(index, separators=(",", ":")).encode())
+            chunks += [compressed_index, FOOTER.pack(offset, len(compressed_index))]
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "wb") as f:
+                f.writelines(chunks)
+            os.replace(temp_path, self.path)
+        logger.debug(f"Saved {self._recorded} new responses to the cassette {self.path}")
+
+    def _replay(self, provider: str, payload: dict) -> tuple[str, dict | None]:
+        key = request_key(provider, payload)
+        entry = self.lookup(key) if self.mode != "record" else None
+        if entry is None and self.mode == "replay":
+            raise CassetteMiss(f"No recorded {provider} response for the request {key} in {self.path}: {str(payload)[:200]}")
+        return key, entry
+
+    def _latency(self, entry: dict) -> float:
+        return 0.0 if self.latency_scale is None else entry["latency"] * self.latency_scale
+
+    def play(self, provider: str, payload: dict, response_type: type[T], send: Callable[[], T]) -> T:
+        """Replays the recorded response of the request, or sends it and records the response"""
+        key, entry = self._replay(provider, payload)
+        if entry is not None:
+            if self._latency(entry):
+                time.sleep(self._latency(entry))
+            return response_type.model_validate(entry["response"])
+
+        start = time.perf_counter()
+        response = send()
+        self.record(key, response, time.perf_counter() - start)
+        return response
+
+    async def aplay(self, provider: str, payload: dict, response_type: type[T], send: Callable[[], Awaitable[T]]) -> T:
+        key, entry = self._replay(provider, payload)
+        if entry is not None:
+            if self._latency(entry):
+                await asyncio.sleep(self._latency(entry))
+            return response_type.model_validate(entry["response"])
+
+        start = time.perf_counter()
+        response = await send()
+        self.record(key, response, time.perf_counter() - start)
+        return response
+
+
+# The cassette serving the requests of the current context
+_cassette: ContextVar[Cassette | None] = ContextVar("llm_as_function_cassette", default=None)
+
+
+@contextmanager
+def use_cassette(path: str, mode: Literal["record", "replay", "auto"] = "auto", latency_scale: float | None = None):
+    """
+    Records the provider responses of the calls made in this context to the file at path, or replays them without a network:
+        * "record": sends every request and records the responses, over the previous cassette
+        * "replay": only serves recorded responses, a request that wasn't recorded fails with `CassetteMiss`
+        * "auto": replays the recorded requests and records the others
+    latency_scale=1.0 makes the replays take as long as the recorded requests did, 0.5 half as long.
+
+    ```
+    with use_cassette("tests/cassettes/summarize.cassette"):
+        summarize(text="...")
+    ```
+
+    """
+    cassette = Cassette(path, mode, latency_scale)
+    token = _cassette.set(cassette)
+    try:
+        yield cassette
+    finally:
+        _cassette.reset(token)
+        if cassette._recorded:
+            cassette.save()
+
+
+def play(provider: str, payload: dict, response_type: type[T], send: Callable[[], T]) -> T:
+    """Sends the request, through the cassette of the context if any"""
+    cassette = _cassette.get()
+    if cassette is None:
+        return send()
+    return cassette.play(provider, payload, response_type, send)
+
+
+async def aplay(provider: str, payload: dict, response_type: type[T], send: Callable[[], Awaitable[T]]) -> T:
+    cassette = _cassette.get()
+    if cassette is None:
+        return await send()
+    return await cassette.aplay(provider, payload, response_type, send)
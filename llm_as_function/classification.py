@@ -0,0 +1,93 @@
+import math
+from dataclasses import dataclass
+from enum import Enum
+from typing import TYPE_CHECKING, Any, Literal, get_args, get_origin
+
+from pydantic import BaseModel
+
+if TYPE_CHECKING:
+    from .llm_func import Final
+
+# The most likely first tokens asked for, the most OpenAI returns
+TOP_LOGPROBS = 20
+
+
+@dataclass(frozen=True)
+class Classification:
+    """The output of a classifier: a model with a single Literal or Enum field of strings, see `LLMFunc.fast_classification`"""
+
+    field: str
+    labels: tuple[str, ...]
+
+    def prompt(self, prompt: str) -> str:
+        return f"{prompt}\n\nAnswer with exactly one of these labels and nothing else: {', '.join(self.labels)}"
+
+
+def classification_labels(output_schema: type[BaseModel]) -> Classification | None:
+    """The field and labels of the output schema when it is a classifier, None otherwise"""
+    if len(output_schema.model_fields) != 1:
+        return None
+
+    field, info = next(iter(output_schema.model_fields.items()))
+    annotation: Any = info.annotation
+    if get_origin(annotation) is Literal:
+        labels = get_args(annotation)
+    elif isinstance(annotation, type) and issubclass(annotation, Enum):
+        labels = tuple(member.value for member in annotation)
+    else:
+        return None
+
+    if not labels or not all(isinstance(label, str) and label.strip() for label in labels):
+        return None
+    if len({label.strip().lower() for label in labels}) != len(labels):
+        return None
+    return Classification(field, labels)
+
+
+def _matches(token: str, labels: tuple[str, ...]) -> list[str]:
+    """The labels a first token can start, the label itself when the token is a whole label"""
+    text = token.strip().strip("\"'").lower()
+    if not text:
+        return []
+    exact = [label for label in labels if label.lower() == text]
+    return exact or [label for label in labels if label.lower().startswith(text) or text.startswith(label.lower())]
+
+
+def label_probabilities(top_logprobs: list[tuple[str, float]], labels: tuple[str, ...]) -> dict[str, float] | None:
+    """
+    The probability of every label from the top first tokens of the answer. A token starting more than one label
+    doesn't count, and when the most likely token is one of them the answer is undecided (None).
+
+    """
+    if not top_logprobs:
+        return None
+
+    top_logprobs = sorted(top_logprobs, key=lambda token: token[1], reverse=True)
+    if len(_matches(top_logprobs[0][0], labels)) != 1:
+        return None
+
+    mass = dict.fromkeys(labels, 0.0)
+    for token, logprob in top_logprobs:
+        matches = _matches(token, labels)
+        if len(matches) == 1:
+            mass[matches[0]] += math.exp(logprob)
+    total = sum(mass.values())
+    return {label: probability / total for label, probability in mass.items()}
+
+
+def classification_final(choice, classification: Classification, output_schema: type[BaseModel]) -> "Final | None":
+    """The result of a classification request from the logprobs of its first token, None when they don't decide it"""
+    from .llm_func import Final
+
+    logprobs = choice.logprobs
+    if logprobs is None or not logprobs.content:
+        return None
+
+    top_logprobs = [(top.token, top.logprob) for top in logprobs.content[0].top_logprobs or []]
+    probabilities = label_probabilities(top_logprobs, classification.labels)
+    if probabilities is None:
+        return None
+
+    label = max(probabilities, key=probabilities.__getitem__)
+    pack = output_schema(**{classification.field: label}).model_dump()
+    return Final(pack, raw_response=choice.message.content, probabilities=probabilities)
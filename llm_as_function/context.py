@@ -0,0 +1,83 @@
+from dataclasses import dataclass
+from typing import Literal
+
+from .tokens import Tokenizer, approx_token_count, count_message_tokens, truncate_text
+
+
+@dataclass(frozen=True)
+class ContextPolicy:
+    """
+    Bounds the tool loop history (the assistant tool calls and the tool outputs) resent on every turn.
+
+    When the history is over max_tokens, the older turns are compacted, oldest first, with the strategy:
+        * "truncate": older tool outputs are cut to truncated_tokens
+        * "elide": older tool outputs are replaced by a short placeholder
+        * "drop": older turns (the assistant tool calls and their outputs) are removed
+
+    The user prompt is not part of the history and the last keep_last_turns turns are never compacted,
+    so the model always sees the task and the latest tool results.
+
+    """
+
+    max_tokens: int
+    strategy: Literal["truncate", "elide", "drop"] = "truncate"
+    truncated_tokens: int = 64
+    keep_last_turns: int = 1
+
+    def __post_init__(self):
+        assert self.strategy in ["truncate", "elide", "drop"], f"Context strategy must in ['truncate', 'elide', 'drop'], not {self.strategy}"
+
+
+TRUNCATED_MARKER = " ...[truncated]"
+ELIDED_MARKER = "[elided: "
+
+
+def _is_tool_output(message) -> bool:
+    return isinstance(message, dict) and message.get("role") == "tool"
+
+
+def split_turns(function_messages: list) -> list[list]:
+    """Splits the history into turns, each turn is an assistant message followed by its tool outputs"""
+    turns: list[list] = []
+    for message in function_messages:
+        if _is_tool_output(message) and turns:
+            turns[-1].append(message)
+        else:
+            turns.append([message])
+    return turns
+
+
+def _compact_turn(turn: list, policy: ContextPolicy, tokenizer: Tokenizer) -> list:
+    compacted = [turn[0]]
+    for message in turn[1:]:
+        content = message["content"]
+        if content.endswith(TRUNCATED_MARKER) or content.startswith(ELIDED_MARKER):
+            # Already compacted on a previous turn, kept as is so the history prefix stays stable
+            pass
+        elif policy.strategy == "truncate":
+            short = truncate_text(content, policy.truncated_tokens, tokenizer)
+            if short != content:
+                content = short + TRUNCATED_MARKER
+        else:
+            content = f"{ELIDED_MARKER}the output of {message.get('name', 'the tool')} is no longer in context]"
+        compacted.append({**message, "content": content})
+    return compacted
+
+
+def compact_history(function_messages: list, policy: ContextPolicy, tokenizer: Tokenizer = approx_token_count) -> list:
+    """Compacts the older turns of the tool loop history until it fits policy.max_tokens (or nothing is left to compact)"""
+    turns = split_turns(function_messages)
+    total = sum(count_message_tokens(turn, tokenizer) for turn in turns)
+
+    index = 0
+    while total > policy.max_tokens and index < len(turns) - policy.keep_last_turns:
+        before = count_message_tokens(turns[index], tokenizer)
+        if policy.strategy == "drop":
+            turns[index] = []
+            total -= before
+        else:
+            turns[index] = _compact_turn(turns[index], policy, tokenizer)
+            total += count_message_tokens(turns[index], tokenizer) - before
+        index += 1
+
+    return [message for turn in turns for message in turn]
@@ -0,0 +1,89 @@
+import time
+from contextlib import contextmanager
+from contextvars import Context, ContextVar
+from typing import TYPE_CHECKING, Iterable
+
+from .errors import DeadlineExceeded
+
+if TYPE_CHECKING:
+    import httpx
+
+# The time.monotonic() by which the current call must be done, shared by the nested calls and their tools
+_deadline: ContextVar[float | None] = ContextVar("llm_as_function_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float | None):
+    """
+    Bounds everything run in this context (provider requests, retries, tools, nested calls) to seconds from now,
+    the errors raised once it's over become DeadlineExceeded. A nested deadline can only be shorter than the one around it.
+
+    """
+    if seconds is None:
+        yield
+        return
+
+    current = _deadline.get()
+    token = _deadline.set(time.monotonic() + seconds if current is None else min(current, time.monotonic() + seconds))
+    try:
+        yield
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        # A request or tool cut by the deadline fails with its own timeout or connection error
+        if expired():
+            raise DeadlineExceeded(f"The call didn't finish within {seconds}s") from e
+        raise
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def latest_deadline(contexts: Iterable[Context]):
+    """
+    Sets the deadline of work done for several calls at once (e.g. a batched request) to the latest of their deadlines,
+    no deadline when one of them has none, so the call with the shortest deadline doesn't cut it for the others.
+
+    """
+    deadlines = [context.get(_deadline) for context in contexts]
+    token = _deadline.set(None if None in deadlines else max(deadlines))  # type: ignore
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """Seconds left before the deadline of the current call, None without a deadline. Raises DeadlineExceeded when none is left"""
+    current = _deadline.get()
+    if current is None:
+        return None
+    left = current - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("The call deadline is exceeded")
+    return left
+
+
+def bounded(timeout: float | None) -> float | None:
+    """The timeout, shortened to the time left before the deadline"""
+    left = remaining()
+    if left is None:
+        return timeout
+    return left if timeout is None else min(timeout, left)
+
+
+def expired() -> bool:
+    current = _deadline.get()
+    return current is not None and time.monotonic() >= current
+
+
+def apply_deadline(request: "httpx.Request"):
+    """httpx request hook bounding the request's timeouts to the time left before the deadline, the request is closed when it's over"""
+    left = remaining()
+    if left is not None:
+        timeouts = request.extensions.get("timeout") or dict.fromkeys(["connect", "read", "write", "pool"])
+        request.extensions["timeout"] = {key: left if value is None else min(value, left) for key, value in timeouts.items()}
+
+
+async def async_apply_deadline(request: "httpx.Request"):
+    apply_deadline(request)
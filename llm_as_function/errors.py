@@ -24,3 +24,31 @@ class ModelDoesNotSupportToolUse(Exception):
     def __init__(self, model_name: str):
         super().__init__(f"The model {model_name} does not support tool use")
         self.model_name = model_name
+
+
+class LoadShedError(Exception):
+    """
+    The request was not sent because it would have waited for a slot longer than its max_queue_wait
+
+    """
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    The call didn't finish before its deadline, its in-flight requests and tools were cancelled
+
+    """
+
+
+class QuotaExceeded(Exception):
+    """
+    The request was not sent because the spend quota of the function (or of its LLMFunc) is exhausted
+
+    """
+
+
+class CassetteMiss(Exception):
+    """
+    The cassette being replayed has no recorded response for the request
+
+    """
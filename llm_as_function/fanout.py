@@ -0,0 +1,60 @@
+import asyncio
+import json
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable
+
+# The calls already started in the current call tree, shared by every task spawned under the outermost `fan_out`
+_inflight_calls: ContextVar[dict | None] = ContextVar("llm_as_function_inflight_calls", default=None)
+# The keys of the calls the current task runs under, a call can't wait for the execution of one of its ancestors
+_ancestor_calls: ContextVar[frozenset] = ContextVar("llm_as_function_ancestor_calls", default=frozenset())
+
+
+def call_key(fn: Callable, kwargs: dict) -> tuple:
+    """Two calls with the same key are the same call and only run once"""
+    return (fn, json.dumps(kwargs, sort_keys=True, default=repr))
+
+
+async def _run_call(key: tuple, fn: Callable[..., Awaitable[Any]], kwargs: dict):
+    # The task has its own copy of the context, the key is only an ancestor of the calls it makes
+    _ancestor_calls.set(_ancestor_calls.get() | {key})
+    return await fn(**kwargs)
+
+
+async def fan_out(*calls: tuple[Callable[..., Awaitable[Any]], dict]) -> list:
+    """
+    Runs several decorated async functions concurrently and returns their results in order.
+
+    Meant to be awaited inside the body of an `async_call` function:
+
+    ```
+    a, b = await fan_out((f, {"x": x - 1}), (f, {"x": x - 2}))
+    ```
+
+    Identical calls (same function, same kwargs) made anywhere under the outermost `fan_out` share a
+    single execution, so a recursive call tree only evaluates each distinct node once. A call identical to
+    one of its ancestors runs on its own instead, since the ancestor waits for it. The requests
+    sent to the provider are still bounded by the scheduler (`async_max_time`) of each LLMFunc.
+
+    """
+    inflight = _inflight_calls.get()
+    token = None
+    if inflight is None:
+        inflight = {}
+        token = _inflight_calls.set(inflight)
+
+    try:
+        tasks = []
+        for fn, kwargs in calls:
+            key = call_key(fn, kwargs)
+            if key in _ancestor_calls.get():
+                tasks.append(asyncio.ensure_future(_run_call(key, fn, kwargs)))
+                continue
+            if key not in inflight:
+                # The task copies the current context, so nested fan_outs see the same inflight calls
+                inflight[key] = asyncio.ensure_future(_run_call(key, fn, kwargs))
+            tasks.append(inflight[key])
+
+        return list(await asyncio.gather(*tasks))
+    finally:
+        if token is not None:
+            _inflight_calls.reset(token)
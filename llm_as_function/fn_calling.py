@@ -1,15 +1,53 @@
 # this file is adapted from gpt_json: https://github.com/piercefreeman/gpt-json
-from inspect import getdoc, signature
+from dataclasses import dataclass
+from inspect import getdoc, iscoroutinefunction, signature
 from types import UnionType
-from typing import Any, Callable, Dict, Optional, Type, Union, get_args, get_origin
+from typing import Any, Callable, Dict, Literal, Optional, Type, Union, get_args, get_origin
 
 from pydantic import BaseModel
 
+from .cache import ToolCache
+
 
 def function_to_name(fn: Callable) -> str:
     return fn.__name__
 
 
+@dataclass(frozen=True)
+class ToolPolicy:
+    """
+    How a tool is executed.
+
+    executor="thread" runs the tool on the calling thread in sync calls, and in the LLMFunc's thread pool in async calls.
+    executor="process" runs it in the LLMFunc's process pool, for CPU-bound tools that would otherwise hold the GIL.
+    timeout (seconds) raises a TimeoutError when the tool takes longer.
+    cache memoizes the tool results by validated arguments, duplicate calls within one model turn run once.
+
+    """
+
+    executor: Literal["thread", "process"] = "thread"
+    timeout: float | None = None
+    cache: ToolCache | None = None
+
+    def validate(self, fn: Callable):
+        if self.executor not in ["thread", "process"]:
+            raise ValueError(f"Tool executor must be in ['thread', 'process'], not {self.executor}")
+
+        if self.executor == "process":
+            if iscoroutinefunction(fn):
+                raise ValueError(f"Async tool {function_to_name(fn)} can't run in a process pool")
+            if "<locals>" in fn.__qualname__:
+                raise ValueError(f"Tool {function_to_name(fn)} must be defined at module level to run in a process pool")
+
+
+def tool_name(tool: dict) -> str:
+    """The function name of a registered tool, `LLMFunc.func` nests the output of parse_function in the tool"""
+    function = tool["function"]
+    while "function" in function:
+        function = function["function"]
+    return function["name"]
+
+
 def parse_function(fn: Callable) -> Dict[str, Any]:
     """
     Parse a python function into a JSON schema that can be used by OpenAPI. We use
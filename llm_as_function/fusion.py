@@ -0,0 +1,29 @@
+from typing import Any
+
+from pydantic import BaseModel, Field, create_model
+
+from .utils import fill_placeholders
+
+FUSION_PROMPT = """Do the following {count} tasks on the same inputs, and answer each task under its name.
+
+{tasks}
+
+Inputs, the values of the <placeholders> in the tasks:
+{inputs}"""
+
+
+def fused_output_schema(schemas: dict[str, type[BaseModel]]) -> type[BaseModel]:
+    """One output schema with the output schema of every function under its name"""
+    fields: dict[str, Any] = {name: (schema, Field(description=f"The answer of the task {name}")) for name, schema in schemas.items()}
+    return create_model("FusedOutput", **fields)
+
+
+def fused_prompt(templates: dict[str, str], kwargs: dict[str, Any], local_vars: dict[str, dict]) -> str:
+    """
+    One prompt for every task: each template with <placeholders> instead of the shared kwargs, then the kwargs once.
+    The variables a function body returns are specific to its task and filled in its template.
+
+    """
+    tasks = "\n\n".join(f"### {name}\n{fill_placeholders(template, local_vars.get(name, {}))}" for name, template in templates.items())
+    inputs = "\n\n".join(f"<{name}>:\n{value}" for name, value in kwargs.items())
+    return FUSION_PROMPT.format(count=len(templates), tasks=tasks, inputs=inputs)
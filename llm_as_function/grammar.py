@@ -0,0 +1,163 @@
+import json
+import re
+from functools import lru_cache
+from typing import Any, Literal, Mapping
+
+# The request field of the grammar, by server
+GRAMMAR_FIELDS: dict[str, str] = {"llama.cpp": "grammar", "vllm": "guided_grammar"}
+
+# The JSON primitives, the whitespace is bounded so a model can't loop on it
+PRIMITIVES = {
+    "ws": r'| " " | "\n" [ \t]{0,20}',
+    "string": r'"\"" ( [^"\\\x7F\x00-\x1F] | "\\" ( ["\\/bfnrt] | "u" [0-9a-fA-F]{4} ) )* "\"" ws',
+    "number": r'"-"? ( [0-9] | [1-9] [0-9]{0,15} ) ( "." [0-9]+ )? ( [eE] [-+]? [0-9]{1,4} )? ws',
+    "integer": r'"-"? ( [0-9] | [1-9] [0-9]{0,15} ) ws',
+    "boolean": r'( "true" | "false" ) ws',
+    "null": r'"null" ws',
+    "value": r"object | array | string | number | boolean | null",
+    "object": r'"{" ws ( string ":" ws value ( "," ws string ":" ws value )* )? "}" ws',
+    "array": r'"[" ws ( value ( "," ws value )* )? "]" ws',
+}
+# The primitives each primitive uses
+_USES = {
+    "string": ["ws"],
+    "number": ["ws"],
+    "integer": ["ws"],
+    "boolean": ["ws"],
+    "null": ["ws"],
+    "value": ["object", "array", "string", "number", "boolean", "null"],
+    "object": ["ws", "string", "value"],
+    "array": ["ws", "value"],
+}
+
+
+def gbnf_literal(text: str) -> str:
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r") + '"'
+
+
+class _GrammarCompiler:
+    """Compiles a JSON schema (the subset pydantic generates) to GBNF rules, the rules are named after the schema's fields"""
+
+    def __init__(self, schema: Mapping[str, Any]):
+        self.schema = schema
+        self.rules: dict[str, str] = {}
+        self.refs: dict[str, str] = {}
+
+    def compile(self) -> str:
+        root = self.visit(self.schema, "root")
+        if root != "root":
+            self.rules["root"] = root
+        self.rules = {"root": self.rules.pop("root"), **self.rules}
+        return "\n".join(f"{name} ::= {body}" for name, body in self.rules.items()) + "\n"
+
+    def primitive(self, name: str) -> str:
+        if name not in self.rules:
+            self.rules[name] = PRIMITIVES[name]
+            for used in _USES.get(name, []):
+                self.primitive(used)
+        return name
+
+    def add(self, name: str, body: str) -> str:
+        name = re.sub(r"[^a-zA-Z0-9-]+", "-", name).strip("-") or "rule"
+        if name in PRIMITIVES:
+            name = f"{name}-def"
+        unique, i = name, 1
+        while unique in self.rules and self.rules[unique] != body:
+            unique, i = f"{name}-{i}", i + 1
+        self.rules[unique] = body
+        return unique
+
+    def reserve(self, name: str) -> str:
+        return self.add(name, "")
+
+    def visit(self, schema: Mapping[str, Any], name: str) -> str:
+        """The rule of a schema"""
+        if "$ref" in schema:
+            return self.ref(schema["$ref"])
+
+        for key in ["anyOf", "oneOf"]:
+            if key in schema:
+                return self.add(name, " | ".join(self.visit(option, f"{name}-{i}") for i, option in enumerate(schema[key])))
+        if "allOf" in schema and len(schema["allOf"]) == 1:
+            return self.visit(schema["allOf"][0], name)
+        if "const" in schema:
+            return self.add(name, f"{gbnf_literal(json.dumps(schema['const']))} {self.primitive('ws')}")
+        if "enum" in schema:
+            self.primitive("ws")
+            return self.add(name, "( " + " | ".join(gbnf_literal(json.dumps(value)) for value in schema["enum"]) + " ) ws")
+
+        schema_type = schema.get("type")
+        if isinstance(schema_type, list):
+            return self.add(name, " | ".join(self.visit({**schema, "type": option}, f"{name}-{option}") for option in schema_type))
+        if schema_type == "object" or (schema_type is None and "properties" in schema):
+            return self.object(schema, name)
+        if schema_type == "array":
+            return self.array(schema, name)
+        if schema_type in ["string", "number", "integer", "boolean", "null"]:
+            return self.primitive(schema_type)
+        return self.primitive("value")
+
+    def ref(self, ref: str) -> str:
+        if ref not in self.refs:
+            path = ref.removeprefix("#/").split("/")
+            target: Any = self.schema
+            for part in path:
+                target = target[part]
+            # Named before it is visited, so a recursive model refers to its own rule
+            name = self.refs[ref] = self.reserve(path[-1])
+            self.rules[name] = self.visit(target, f"{name}-def")
+        return self.refs[ref]
+
+    def object(self, schema: Mapping[str, Any], name: str) -> str:
+        self.primitive("ws")
+        properties: Mapping[str, Any] = schema.get("properties", {})
+        if not properties:
+            additional = schema.get("additionalProperties")
+            if not isinstance(additional, Mapping):
+                return self.primitive("object")
+            value = self.visit(additional, f"{name}-value")
+            string = self.primitive("string")
+            return self.add(name, f'"{{" ws ( {string} ":" ws {value} ( "," ws {string} ":" ws {value} )* )? "}}" ws')
+
+        required = set(schema.get("required", []))
+        members = [(key, f'{gbnf_literal(json.dumps(key))} ":" ws {self.visit(value, f"{name}-{key}")}') for key, value in properties.items()]
+        # The required members come first, in order, then any ordered subset of the optional ones
+        body = ' "," ws '.join(member for key, member in members if key in required)
+        optional = [member for key, member in members if key not in required]
+        if optional:
+            rest = None
+            for i in reversed(range(len(optional))):
+                rest = self.add(f"{name}-rest-{i}", optional[i] if rest is None else f'{optional[i]} ( "," ws {rest} )? | {rest}')
+            body = f'{body} ( "," ws {rest} )?' if body else f"( {rest} )?"
+        return self.add(name, f'"{{" ws {body} "}}" ws')
+
+    def array(self, schema: Mapping[str, Any], name: str) -> str:
+        self.primitive("ws")
+        if "prefixItems" in schema:
+            items = [self.visit(item, f"{name}-{i}") for i, item in enumerate(schema["prefixItems"])]
+            return self.add(name, '"[" ws ' + ' "," ws '.join(items) + ' "]" ws')
+        item = self.visit(schema.get("items") or {}, f"{name}-item")
+        return self.add(name, f'"[" ws ( {item} ( "," ws {item} )* )? "]" ws')
+
+
+@lru_cache(maxsize=256)
+def _compile(canonical_schema: str) -> str:
+    return _GrammarCompiler(json.loads(canonical_schema)).compile()
+
+
+def compile_grammar(schema: Mapping[str, Any]) -> str:
+    """
+    The GBNF grammar of the JSON documents valid against a JSON schema, for the constrained decoding of llama.cpp
+    (and compatible) servers. Grammars are cached by schema, a function compiles its schemas once.
+
+    Patterns, formats and length bounds are not compiled, the output is still validated against the schema.
+
+    """
+    # Not sorted, the members are generated in the order of the schema
+    return _compile(json.dumps(schema, separators=(",", ":")))
+
+
+def grammar_body(grammar: Literal["llama.cpp", "vllm"], schema: Mapping[str, Any]) -> dict[str, str]:
+    """The request fields that constrain a generation to a schema on the given server"""
+    assert grammar in GRAMMAR_FIELDS, f"grammar must in {list(GRAMMAR_FIELDS)}, not {grammar}"
+    return {GRAMMAR_FIELDS[grammar]: compile_grammar(schema)}
@@ -1,46 +1,66 @@
+import asyncio
+import contextvars
 import inspect
 import json
-from copy import copy
-from dataclasses import dataclass, field
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from copy import copy, deepcopy
+from dataclasses import dataclass, field, replace
 from functools import wraps
-import os
-from typing import Literal
+from types import MappingProxyType, SimpleNamespace
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Iterable, Literal, Mapping
 
-import ollama
-from openai import AsyncOpenAI, OpenAI
-from openai.types.chat import ChatCompletion, ChatCompletionMessage
-from ollama import Client as OllamaClient, AsyncClient as OllamaAsyncClient
 from pydantic import BaseModel, ValidationError
 
 from llm_as_function.types import LLMFuncConfig, RuntimeOptions, empty_runtime_options, Tool
 
-from .errors import InvalidFunctionParameters, InvalidLLMResponse, ModelDoesNotSupportToolUse
-from .fn_calling import function_to_name, get_argument_for_function, parse_function
-from .models import (
-    get_json_schema_prompt,
-    openai_single_acreate,
-    openai_single_create,
-    ollama_single_acreate,
-    ollama_single_create,
+from .batching import BatchPolicy, MicroBatcher, batch_output_schema, batch_prompt
+from .cache import ToolCache, tool_cache_key
+from .classification import TOP_LOGPROBS, Classification, classification_final, classification_labels
+from .fusion import fused_output_schema, fused_prompt
+from .grammar import compile_grammar
+from .context import ContextPolicy, compact_history
+from .cassette import _cassette
+from .deadline import bounded, deadline, latest_deadline, remaining
+from .errors import DeadlineExceeded, InvalidFunctionParameters, InvalidLLMResponse, ModelDoesNotSupportToolUse
+from .fn_calling import ToolPolicy, function_to_name, get_argument_for_function, get_function_description, parse_function, tool_name
+from .metrics import metrics
+from .profiler import _profiler, profiled, record_node, span
+from .providers import Provider, get_provider, model_factory
+from .models import get_json_schema_prompt
+from .tokens import (
+    DryRunReport,
+    DryRunStats,
+    Tokenizer,
+    approx_token_count,
+    count_payload_tokens,
+    estimate_schema_tokens,
+    max_schema_tokens,
+    truncate_kwargs,
 )
-from .utils import LimitAPICalling, clean_output_parse, generate_schema_prompt, logger
+from .sampling import Reducer, get_reducer
+from .scheduler import DEFAULT_PRIORITIES, AdaptiveLimit, SchedulePolicy, Scheduler, _call_priority
+from .tool_selection import ToolIndex, ToolScorer, ToolSelector
+from .usage import Quota, Usage, function_usage, ollama_usage, openai_usage, record_usage, track_usage
+from .utils import LazyProcessPool, clean_output_parse, generate_schema_prompt, logger, run_in_executor, run_sync
 
+if TYPE_CHECKING:
+    # The SDKs are imported by their providers, when an LLMFunc uses them
+    import ollama
+    from openai.types.chat import ChatCompletion, ChatCompletionMessage
 
-def model_factory(model_name: str) -> Literal["openai", "ollama"]:
-    OPENAI_STARTS_WITH = ["gpt"]
-    OLLAMA_STARTS_WITH = ["llama", "krtkygpta/qwq", "qwen"]
-
-    if any(model_name.startswith(prefix) for prefix in OPENAI_STARTS_WITH):
-        return "openai"
-    elif any(model_name.startswith(prefix) for prefix in OLLAMA_STARTS_WITH):
-        return "ollama"
-    raise NotImplementedError(f"llm-as-function currently supports OpenAI and some Ollama models, not {model_name}")
+# Every LLMFunc that decorated at least one function, used by `warmup_all`
+_decorating_llm_funcs: "weakref.WeakValueDictionary[int, LLMFunc]" = weakref.WeakValueDictionary()
 
 
 @dataclass
 class Final:
     pack: dict | None = None
     raw_response: str | None = None
+    usage: Usage | None = field(default=None, compare=False)  # The tokens and cost of the requests that made this result
+    probabilities: dict[str, float] | None = field(default=None, compare=False)  # The probability of every label, see `LLMFunc.fast_classification`
 
     def ok(self):
         return self.pack is not None
@@ -51,6 +71,55 @@ class Final:
         return self.raw_response
 
 
+@dataclass(frozen=True)
+class LLMFuncSpec:
+    """
+    Everything a decorated function needs to run, compiled once at decoration time.
+
+    The spec is never mutated after decoration, so a decorated function can be called from many
+    threads at once, and decorating with a shared LLMFunc can't leak tools into other functions.
+
+    """
+
+    name: str  # module.qualname, the key of the function's usage, metrics, quotas and scheduling flow
+    prompt_template: str
+    output_schema: type[BaseModel]
+    output_json: str
+    tools: tuple[Tool, ...]
+    tool_choice: Literal["none", "auto", "required"]
+    json_schema: Mapping[str, Any]
+    max_tokens: int | None
+    stop: tuple[str, ...]
+    fn_callings: Mapping[str, Callable]
+    validators: Mapping[str, type[BaseModel]]  # The pydantic argument of every tool, by tool name
+    tool_policies: Mapping[str, ToolPolicy]
+    context_policy: ContextPolicy | None
+    tool_index: ToolIndex | None  # Set when only the most relevant tools are sent, see `LLMFunc.select_tools`
+    samples: int
+    reducer: Reducer
+    batch: BatchPolicy | None  # Set when concurrent async calls are packed into one request, see `LLMFunc.batch`
+    schedule: SchedulePolicy
+    quota: Quota | None  # The spend limit of the function, see `LLMFunc.quota`
+    classification: Classification | None  # Set when the output is answered from the logprobs of one token, see `LLMFunc.fast_classification`
+    provider: str
+    client: Any
+    async_client: Any
+    members: tuple["LLMFuncSpec", ...] = ()  # The functions a fused request answers, their quotas are checked and their usage recorded
+
+    def runtime_options(self, prompt: str | None = None) -> RuntimeOptions:
+        """A fresh copy of the runtime options for one request, with only the tools relevant to the prompt when selecting tools"""
+        tools = self.tool_index.select(prompt) if self.tool_index is not None and prompt is not None else list(self.tools)
+        return RuntimeOptions(
+            tools=tools,
+            tool_choice=self.tool_choice,
+            output_schema=dict(self.json_schema),
+            max_tokens=self.max_tokens,
+            stop=list(self.stop),
+            n=self.samples,
+            top_logprobs=None,
+        )
+
+
 @dataclass
 class LLMFunc:
     """Use LLM as a function"""
@@ -60,6 +129,7 @@ class LLMFunc:
     output_json: str | None = None  # The string generated from the output schema to be embedded into the prompt payload
     prompt_template: str = ""  # The actual prompt of the llmfunc i.e. core logic
     model: str = "gpt-3.5-turbo-1106"
+    provider: str | None = None  # A registered provider (e.g. "openai_compatible" for vLLM or llama.cpp), found from the model name when not set
     temperature: float = 0.1
     openai_api_key: str | None = None
     openai_base_url: str | None = None
@@ -67,11 +137,24 @@ class LLMFunc:
     async_max_time: int | None = None
     has_tool_support: bool = False
     has_structured_output: bool = False
-    async_wait_time: float = 0.1
+    tokenizer: Tokenizer | None = None  # Used for dry runs and kwargs truncation, defaults to a fast local approximation
+    max_kwargs_tokens: int | None = None  # When set, string kwargs are truncated to fit this many tokens before filling the prompt
+    keep_alive: float | str | None = None  # Ollama only, how long the model stays loaded after a request (e.g. "30m", -1 for forever)
+    num_ctx: int | None = None  # Ollama only, a fixed context size so the model (and its prompt cache) isn't reloaded between requests
+    stop_at_json: bool = False  # Ollama only, stream the response and stop as soon as the first JSON object is complete
+    max_workers: int | None = None  # Threads running the sync tools and sync function bodies of async calls, off the event loop
+    max_process_workers: int | None = None  # Processes running the tools registered with executor="process"
+    scheduler: Scheduler | None = None  # Bounds the concurrent async requests, made from async_max_time when not given, can be shared
+    adaptive_concurrency: bool = False  # Adapts the limit of the scheduler made from async_max_time to latency and rate limits
+    transport: Literal["sdk", "httpx"] = "sdk"  # OpenAI only, "httpx" sends the chat requests with a lean client, see `RawChatClient`
+    shared_quota: Quota | None = None  # The spend limit of every function decorated by this LLMFunc, can be shared
+    grammar: Literal["llama.cpp", "vllm"] | None = None  # Local servers only, constrains the generations to the schemas with a GBNF grammar
+    fast_classification: bool = False  # OpenAI api only, an output of one Literal or Enum field is answered in one token from its logprobs
     runtime_options: RuntimeOptions = field(default_factory=empty_runtime_options)
 
     def __post_init__(self):
         assert self.parse_mode in ["error", "accept_raw",], f"Parse mode must in ['error', 'accept_raw'], not {self.parse_mode}"
+        assert self.transport in ["sdk", "httpx"], f"Transport must in ['sdk', 'httpx'], not {self.transport}"
 
         self.config: LLMFuncConfig = LLMFuncConfig(
             model=self.model,
@@ -80,53 +163,83 @@ class LLMFunc:
             has_structured_output=self.has_structured_output,
         )
 
-        self.provider = model_factory(self.config["model"])
+        self.provider = self.provider or model_factory(self.config["model"])
+        self._provider: Provider = get_provider(self.provider)
+        if self.grammar is not None:
+            assert self.grammar in ["llama.cpp", "vllm"], f"Grammar must in ['llama.cpp', 'vllm'], not {self.grammar}"
+            assert "grammar" in self._provider.options, f"Provider [{self.provider}] doesn't take a grammar, use e.g. provider='openai_compatible'"
 
-        self._bp_runtime_options = copy(self.runtime_options)
+        self._bp_runtime_options = deepcopy(self.runtime_options)
+        self._building = False  # Whether this instance is a private copy made by a builder method
+        self._blueprint = self  # The shared LLMFunc the private copies are made from
         self.fn_callings = {}
-        self.async_models = {}
-
-        if self.provider == "openai":
-            if self.openai_api_key is None:
-                logger.warning("OpenAI api key is not set, will try to use OPENAI_API_KEY env variable instead")
-                self.openai_api_key = os.getenv("OPENAI_API_KEY", "")
-
-            # assert self.openai_api_key != "", "You must have OpenAI api key input, or set OPENAI_API_KEY in your environment."
-
-            self.openai_client = OpenAI(api_key=self.openai_api_key, base_url=self.openai_base_url)
-            self.openai_async_client = AsyncOpenAI(api_key=self.openai_api_key, base_url=self.openai_base_url)
-
-        if self.provider == "ollama":
-            if self.ollama_base_url is None:
-                logger.warning("Ollama base url is not set, ollama will use default")
-
-            self.ollama_client = OllamaClient(host=self.ollama_base_url)
-            self.ollama_async_client = OllamaAsyncClient(host=self.ollama_base_url)
-
-        if self.async_max_time is None:
-            self.async_models["openai"] = openai_single_acreate
-            self.async_models["ollama"] = ollama_single_acreate
+        self.tool_policies = {}
+        self.context_policy = None
+        self.tool_selector = None
+        self.sampling = (1, get_reducer("first_valid"))
+        self.batch_policy = None
+        self.schedule_policy = SchedulePolicy()
+        self.function_quota = None
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="llm_as_function")
+        self._process_pool = LazyProcessPool(max_workers=self.max_process_workers)
+
+        if self.scheduler is None and self.async_max_time is not None:
+            adaptive = AdaptiveLimit(max_size=max(self.async_max_time, AdaptiveLimit.max_size)) if self.adaptive_concurrency else None
+            self.scheduler = Scheduler(max_size=self.async_max_time, adaptive=adaptive, name=self.model)
+
+        # The clients are on the fields of the provider's api, so they can be swapped (e.g. for fakes) before decorating
+        client, async_client = self._provider.load().clients(self)
+        if self._provider.api == "openai":
+            self.openai_client, self.openai_async_client = client, async_client
         else:
-            _limiter_decorator = LimitAPICalling(max_size=self.async_max_time, waiting_time=self.async_wait_time)
-            self.async_models["openai"] = _limiter_decorator(openai_single_acreate)
-            self.async_models["ollama"] = _limiter_decorator(ollama_single_acreate)
+            self.ollama_client, self.ollama_async_client = client, async_client
 
     def reset(self):
         """Reset the llmfuncs to the initial (default) state"""
         self.prompt_template = ""
         self.output_schema = None
         self.output_json = None
-        self.runtime_options = copy(self._bp_runtime_options)
+        self.runtime_options = deepcopy(self._bp_runtime_options)
         self.func_callings = []
         self.fn_callings = {}
+        self.tool_policies = {}
+        self.context_policy = None
+        self.tool_selector = None
+        self.sampling = (1, get_reducer("first_valid"))
+        self.batch_policy = None
+        self.schedule_policy = SchedulePolicy()
+        self.function_quota = None
+
+    def _builder(self) -> "LLMFunc":
+        """
+        The instance the builder methods (prompt, func, output) modify. A shared LLMFunc like `gpt35_func` is never
+        modified, the first builder method of a chain returns a private copy that shares its clients.
+
+        """
+        if self._building:
+            return self
+
+        builder = copy(self)
+        builder.runtime_options = deepcopy(self._bp_runtime_options)
+        builder.fn_callings = {}
+        builder.tool_policies = {}
+        builder._building = True
+        return builder
 
     def prompt(self, prompt_template: str):
         """Sets the llmfuncs prompt template"""
-        self.prompt_template = prompt_template.strip("\n ")
+        builder = self._builder()
+        builder.prompt_template = prompt_template.strip("\n ")
 
-        return self
+        return builder
 
-    def func(self, func):
+    def func(
+        self,
+        func,
+        executor: Literal["thread", "process"] = "thread",
+        timeout: float | None = None,
+        cache: ToolCache | bool = False,
+    ):
         """
         Adds function as a 'tool' to be used by the llms.
 
@@ -141,6 +254,14 @@ class LLMFunc:
         These functions are expected to return a string, and the function arguments are expected to be a Pydantic BaseModel.
         i.e. Single argument function that returns a string.
 
+        Tools can also be async functions. In async calls, async tools are awaited and sync tools run in a thread pool
+        (see `max_workers`), so a slow tool doesn't block the event loop.
+
+        CPU-bound tools can run in a process pool with executor="process" (see `max_process_workers`), the tool and
+        its argument model must then be picklable, i.e. defined at module level. timeout (seconds) bounds the tool's run.
+
+        cache=True (or a shared `ToolCache(maxsize, ttl)`) memoizes the tool's results by its validated arguments, for
+        expensive tools without side effects. Duplicate calls within one model turn then run once.
 
         Some LLM's do not support tool architecture, and will raise an error (ModelDoesNotSupportToolUse) if you try to use this feature.
         """
@@ -148,17 +269,122 @@ class LLMFunc:
         if not self.config["has_tool_support"]:
             raise ModelDoesNotSupportToolUse(self.config["model"])
 
-        if self.provider not in ["openai", "ollama"]:
+        if not self._provider.supports_tools:
             raise NotImplementedError(f"Function calling for {self.provider} is not supported yet")
 
-        self.fn_callings[function_to_name(func)] = func
+        if cache is True:
+            cache = ToolCache()
+        policy = ToolPolicy(executor=executor, timeout=timeout, cache=None if cache is False else cache)
+        policy.validate(func)
+
+        builder = self._builder()
+        builder.fn_callings[function_to_name(func)] = func
+        builder.tool_policies[function_to_name(func)] = policy
 
         func_desc = parse_function(func)
         new_tool = Tool(type="function", function=func_desc)
-        self.runtime_options["tools"].append(new_tool)
+        builder.runtime_options["tools"].append(new_tool)
         # self.runtime_options["tool_choice"] = "auto" #  Already default
 
-        return self
+        return builder
+
+    def context(
+        self,
+        max_tokens: int,
+        strategy: Literal["truncate", "elide", "drop"] = "truncate",
+        truncated_tokens: int = 64,
+        keep_last_turns: int = 1,
+    ):
+        """
+        Bounds the tool loop history resent on every turn to about max_tokens, by compacting the older tool outputs.
+        The user prompt and the latest tool results are always kept, see `ContextPolicy` for the strategies.
+
+        """
+        builder = self._builder()
+        builder.context_policy = ContextPolicy(max_tokens, strategy, truncated_tokens, keep_last_turns)
+        return builder
+
+    def select_tools(self, top_k: int, pinned: list[str | Callable] | None = None, scorer: ToolScorer | None = None):
+        """
+        Sends only the top_k tools most relevant to the prompt, for functions with many tools registered. Tools are ranked
+        by BM25 over their names and descriptions, or by scorer(prompt, documents) -> one score per tool. The pinned tools
+        (names or functions) are always sent. The same subset is sent on every turn of the tool loop.
+
+        """
+        builder = self._builder()
+        pinned_names = tuple(name if isinstance(name, str) else function_to_name(name) for name in pinned or [])
+        builder.tool_selector = ToolSelector(top_k=top_k, pinned=pinned_names, scorer=scorer)
+        return builder
+
+    def samples(self, n: int, reducer: Literal["majority", "first_valid", "all"] | Reducer = "majority"):
+        """
+        Self-consistency: samples n answers from one prompt evaluation (`n` choices of one OpenAI request, n concurrent
+        requests to Ollama), parses each with `parse_output` and aggregates them with the reducer:
+            * "majority": the most common value of every field
+            * "first_valid": the first sample that parsed
+            * "all": every valid sample, as {"samples": [...]}
+            * or reducer(finals, output_schema) -> Final
+        Invalid samples are dropped. In a tool loop, the tools called by the first sample are followed.
+
+        """
+        assert n >= 1, f"The number of samples must be at least 1, not {n}"
+        builder = self._builder()
+        builder.sampling = (n, get_reducer(reducer))
+        return builder
+
+    def batch(self, max_size: int = 8, window: float = 0.01):
+        """
+        Micro-batching for async calls: the calls made within window seconds are packed, up to max_size, into one request
+        that shows the prompt template and the output schema once, followed by the inputs. The results come back as one list
+        validated in one pass and are dispatched to each caller. When the batch can't be answered as a whole (invalid output,
+        wrong number of results), every call of the batch falls back to its own request.
+
+        """
+        builder = self._builder()
+        builder.batch_policy = BatchPolicy(max_size=max_size, window=window)
+        return builder
+
+    def schedule(self, priority: str = "default", weight: float = 1.0, max_queue_wait: float | None = None):
+        """
+        How the async requests of the function are scheduled when the LLMFunc has a `scheduler` (or `async_max_time`):
+        its priority class ("interactive", "default" or "batch" by default), its weight in the fair share of the slots
+        between the functions of the same class, and how long a request may wait for a slot before it fails with
+        `LoadShedError`. `call_priority` overrides the priority for the calls made in its context.
+
+        """
+        builder = self._builder()
+        builder.schedule_policy = SchedulePolicy(priority=priority, weight=weight, max_queue_wait=max_queue_wait)
+        return builder
+
+    def quota(
+        self,
+        max_cost: float | Quota | None = None,
+        max_tokens: int | None = None,
+        window: float | None = None,
+        mode: Literal["reject", "throttle"] = "reject",
+    ):
+        """
+        Limits the spend of the function: max_cost (USD, see `usage.PRICES`) and/or max_tokens over the last window seconds
+        (or ever). Once exhausted, its requests fail with `QuotaExceeded` or, with mode="throttle", wait for the window to
+        free up. Pass a `Quota` instead to share one limit between functions. Every turn of the tool loop is charged.
+
+        """
+        builder = self._builder()
+        builder.function_quota = max_cost if isinstance(max_cost, Quota) else Quota(max_cost, max_tokens, window, mode)
+        return builder
+
+    def budget(self, max_tokens: int | Literal["auto"] | None = "auto", stop: list[str] | None = None):
+        """
+        Sets the generation budget of the llmfunc, so a model that rambles or loops is cut early.
+
+        max_tokens="auto" derives the cap from the output schema (and the tools arguments), see `max_schema_tokens`.
+        Bound your schema with `max_length`, `Literal` and list lengths to get a tighter cap.
+
+        """
+        builder = self._builder()
+        builder.runtime_options["max_tokens"] = max_tokens  # type: ignore
+        builder.runtime_options["stop"] = list(stop or [])
+        return builder
 
     def output(self, output_schema: type[BaseModel]):
         """
@@ -166,10 +392,23 @@ class LLMFunc:
         to be embedded into the prompt payload.        
 
         """
-        self.output_schema = output_schema
-        self.runtime_options["output_schema"] = output_schema.model_json_schema()
-        self.output_json = generate_schema_prompt(output_schema)
-        return self
+        builder = self._builder()
+        builder.output_schema = output_schema
+        builder.runtime_options["output_schema"] = output_schema.model_json_schema()
+        builder.output_json = generate_schema_prompt(output_schema)
+        return builder
+
+    @staticmethod
+    def _load_json(output: str) -> dict | None:
+        """The JSON object in the output, None when there is no valid one"""
+        json_str = clean_output_parse(output)
+        if json_str is None:
+            return None
+        try:
+            return json.loads(json_str)
+        except json.JSONDecodeError:
+            # Most likely the output was cut by the generation budget
+            return None
 
     def parse_output(self, output: str, output_schema: type[BaseModel]) -> Final:
         """
@@ -177,9 +416,9 @@ class LLMFunc:
 
         """
         logger.debug(f"Got output: {output}")
-        json_str = clean_output_parse(output)
+        json_dict = self._load_json(output)
 
-        if json_str is None:
+        if json_dict is None:
             logger.error(f"Failed to parse output: {output}")
             if self.parse_mode == "error":
                 raise InvalidLLMResponse(f"Failed to parse output to a valid json: {output}")
@@ -187,34 +426,116 @@ class LLMFunc:
                 return Final(raw_response=output)
             raise InvalidLLMResponse(f"Failed to parse output: {output}")
 
-        output_dict = output_schema(**json.loads(json_str)).model_dump()
+        output_dict = output_schema(**json_dict).model_dump()
 
         return Final(output_dict)
 
-    def _init_setup(self, func):
+    def _parse_samples(self, raw_results: list, spec: LLMFuncSpec) -> Final:
+        """Parses the response, or every sample of it and reduces them to one result"""
+        if spec.samples == 1:
+            raw_result = raw_results[0]
+            if not isinstance(raw_result, str):
+                raise ValueError(f"Expected raw_result to be of type 'str' but it is of type '{type(raw_result)}'")
+            return self.parse_output(raw_result, spec.output_schema)
+
+        finals = []
+        for raw_result in raw_results:
+            if not isinstance(raw_result, str):
+                continue  # A sample that called tools instead of answering
+            try:
+                finals.append(self.parse_output(raw_result, spec.output_schema))
+            except (InvalidLLMResponse, ValidationError) as e:
+                logger.warning(f"Dropped an invalid sample of {spec.name}: {e}")
+        return spec.reducer(finals, spec.output_schema)
+
+    def _clients(self) -> tuple[Any, Any]:
+        """The sync and async clients of the provider"""
+        if self._provider.api == "openai":
+            return self.openai_client, self.openai_async_client
+        return self.ollama_client, self.ollama_async_client
+
+    def _classification(self, builder: "LLMFunc") -> Classification | None:
+        """The labels of the output when the function is answered from the logprobs of one token, see `fast_classification`"""
+        if not self.fast_classification or self._provider.api != "openai":
+            return None
+        if builder.fn_callings or builder.sampling[0] > 1 or builder.batch_policy is not None:
+            return None
+        return classification_labels(builder.output_schema)  # type: ignore
+
+    def _init_setup(self, func) -> LLMFuncSpec:
+        """Compiles the decorated function and the builder state into a frozen spec, then resets the builder"""
+        builder = self._builder()
+
         return_annotation = func.__annotations__.get("return", None)
 
         if return_annotation is not None:
             assert issubclass(return_annotation, BaseModel), "Return must be a Pydantic BaseModel"
-            self.output(return_annotation)
+            builder.output(return_annotation)
 
-        if self.output_schema is None and return_annotation is None:
+        if builder.output_schema is None and return_annotation is None:
             raise ValueError("You must specify the output schema or the function return annotation")
 
-        if self.prompt_template == "":
+        if builder.prompt_template == "":
             if func.__doc__ is None:
                 raise ValueError("You must specify the prompt template or the function docstring")
 
-            self.prompt(func.__doc__)
-
-        return (
-            self.prompt_template,
-            self.output_json,
-            self.output_schema,
-            self.runtime_options,
-            self.fn_callings,
+            builder.prompt(func.__doc__)
+
+        if builder.output_json is None or builder.output_schema is None:
+            raise ValueError("The output_json is None when calling llmfunction. Most likely output_schema isn't supplied so the output_json couldn't be generated")
+
+        client, async_client = self._clients()
+
+        max_tokens = builder.runtime_options.get("max_tokens")
+        if max_tokens == "auto":
+            schemas = [builder.runtime_options["output_schema"]] + [get_argument_for_function(fn).model_json_schema() for fn in builder.fn_callings.values()]
+            max_tokens = max(max_schema_tokens(schema, self.tokenizer or approx_token_count) for schema in schemas)
+
+        tool_index = None
+        if builder.tool_selector is not None:
+            unknown = set(builder.tool_selector.pinned) - set(builder.fn_callings)
+            if unknown:
+                raise ValueError(f"Pinned tools {sorted(unknown)} are not registered with func()")
+            tools = [(tool_name(tool), tool) for tool in builder.runtime_options["tools"]]
+            tool_index = builder.tool_selector.index([(name, get_function_description(builder.fn_callings[name]), deepcopy(tool)) for name, tool in tools])
+
+        validators = {name: get_argument_for_function(fn) for name, fn in builder.fn_callings.items()}
+        if self.grammar is not None:
+            # Compiled once here, the requests find them in the cache
+            for schema in [builder.runtime_options["output_schema"]] + [validator.model_json_schema() for validator in validators.values()]:
+                compile_grammar(schema)
+
+        spec = LLMFuncSpec(
+            name=f"{func.__module__}.{func.__qualname__}",
+            prompt_template=builder.prompt_template,
+            output_schema=builder.output_schema,
+            output_json=builder.output_json,
+            tools=tuple(deepcopy(builder.runtime_options["tools"])),
+            tool_choice=builder.runtime_options["tool_choice"],
+            json_schema=MappingProxyType(deepcopy(builder.runtime_options["output_schema"])),
+            max_tokens=max_tokens,
+            stop=tuple(builder.runtime_options.get("stop", [])),
+            fn_callings=MappingProxyType(dict(builder.fn_callings)),
+            validators=MappingProxyType(validators),
+            tool_policies=MappingProxyType(dict(builder.tool_policies)),
+            context_policy=builder.context_policy,
+            tool_index=tool_index,
+            samples=builder.sampling[0],
+            reducer=builder.sampling[1],
+            batch=builder.batch_policy,
+            schedule=builder.schedule_policy,
+            quota=builder.function_quota,
+            classification=self._classification(builder),
+            provider=self.provider,
+            client=client,
+            async_client=async_client,
         )
 
+        builder.reset()
+        _decorating_llm_funcs[id(self._blueprint)] = self._blueprint
+
+        return spec
+
     def _fill_prompt(self, kwargs: dict, local_var: Final | dict, prompt_template: str) -> Final | str:
         """Fills the prompt template with the given kwargs and local_var, if local_var is a Final object, it will return the object"""
         if local_var is not None:
@@ -229,51 +550,389 @@ class LLMFunc:
 
         return prompt
 
-    def _provider_response(self, prompt, runtime_options={}, fn_callings={}):
+    def _render_prompt(self, kwargs: dict, local_var: Final | dict, spec: LLMFuncSpec) -> Final | str:
+        """Builds the prompt sent to the provider from the kwargs and the function body's result, or returns the body's `Final`"""
+        logger.debug(f"[Variables] function args:{kwargs}, local vars: {local_var}")
+
+        if self.max_kwargs_tokens is not None:
+            kwargs = truncate_kwargs(kwargs, self.max_kwargs_tokens, self.tokenizer or approx_token_count)
+
+        prompt = self._fill_prompt(kwargs, local_var, spec.prompt_template)
+
+        if isinstance(prompt, Final):
+            # Docs say "The `Final` is a class in `llm-as-function`, and returning this class indicates that you do not need the large model to process your output."
+            # So this should just return
+            return prompt
+
+        if spec.classification is not None:
+            prompt = spec.classification.prompt(prompt)
+        elif not self.config["has_structured_output"]:
+            prompt = self._append_json_schema(prompt, spec.output_json)
+
+        logger.debug(prompt)
+
+        return prompt
+
+    def _dry_run_report(
+        self,
+        prompt: Final | str,
+        spec: LLMFuncSpec,
+        tokenizer: Tokenizer | None = None,
+    ) -> DryRunReport:
+        """Renders the payload the provider call would send for this prompt, and estimates its tokens"""
+        if isinstance(prompt, Final):
+            return DryRunReport(provider=self.provider, payload=None)
+
+        tokenizer = tokenizer or self.tokenizer or approx_token_count
+        runtime_options = spec.runtime_options(prompt) if spec.classification is None else self._classification_options(prompt, spec)
+
+        payload = self._provider.load().payload(
+            prompt, self.config["model"], self.config["temperature"], [], runtime_options, **self._provider.request_options(self)
+        )
+
+        return DryRunReport(
+            provider=self.provider,
+            payload=payload,
+            prompt_tokens=count_payload_tokens(payload, tokenizer),
+            completion_tokens=1 if spec.classification is not None else estimate_schema_tokens(dict(spec.json_schema), tokenizer) * spec.samples,
+        )
+
+    def _record_finish(self, spec: LLMFuncSpec, finish_reason: str | None):
+        """Counts the requests, and the ones that stopped because they ran out of their generation budget"""
+        # A fused request is counted once for each function it answers
+        for member in spec.members or (spec,):
+            labels = dict(function=member.name, model=self.config["model"])
+            metrics.inc("llm_requests", **labels)
+            if finish_reason == "length":
+                metrics.inc("llm_budget_exhausted", **labels)
+        if finish_reason == "length":
+            logger.warning(f"{spec.name} ran out of its generation budget ({spec.max_tokens} tokens)")
+
+    def _record_prompt_eval(self, spec: LLMFuncSpec, response: "ollama.ChatResponse"):
+        """
+        Records how many prompt tokens Ollama evaluated and how long it took. With a warm prefix cache only the new
+        part of the prompt is evaluated, so the later turns of a tool loop report far fewer tokens than the first.
+
+        """
+        if response.prompt_eval_count is None:
+            return
+
+        members = spec.members or (spec,)
+        seconds = (response.prompt_eval_duration or 0) / 1e9
+        for member in members:
+            labels = dict(function=member.name, model=self.config["model"])
+            metrics.inc("ollama_prompt_eval_tokens", response.prompt_eval_count / len(members), **labels)
+            metrics.inc("ollama_prompt_eval_seconds", seconds / len(members), **labels)
+            metrics.inc("ollama_load_seconds", (response.load_duration or 0) / 1e9 / len(members), **labels)
+        logger.debug(f"{spec.name} evaluated {response.prompt_eval_count} prompt tokens in {seconds:.3f}s")
+
+    def _quotas(self, spec: LLMFuncSpec) -> list[tuple[str, Quota]]:
+        """The quotas a request of the function must fit in, with the function each one is checked for"""
+        quotas = [(member.name, member.quota) for member in spec.members or (spec,) if member.quota is not None]
+        return quotas + ([(spec.name, self.shared_quota)] if self.shared_quota is not None else [])
+
+    def _record_usage(self, spec: LLMFuncSpec, usage: Usage):
+        """
+        Records the tokens and cost of a request for the call, the function's metrics and its quotas. The usage of a
+        fused request is split evenly between the functions it answers, the shared quota is charged all of it.
+
+        """
+        members = spec.members or (spec,)
+        share = usage.share(len(members)) if spec.members else usage
+        for member in members:
+            record_usage(share, function=member.name, model=self.config["model"])
+            if member.quota is not None:
+                member.quota.charge(share)
+        record_node(usage=usage)
+        if self.shared_quota is not None:
+            self.shared_quota.charge(usage)
+
+    @staticmethod
+    def _finish_reason(chat_completion: "ChatCompletion") -> str | None:
+        """The finish reason of the request, "length" when any of its samples ran out of budget"""
+        reasons = [choice.finish_reason for choice in chat_completion.choices]
+        return "length" if "length" in reasons else reasons[0]
+
+    def _request_options(self, runtime_options: RuntimeOptions, function_messages: list) -> tuple[dict, int]:
+        """The arguments of the provider's create, and how many requests make the samples (one per sample without `n`)"""
+        samples = runtime_options.get("n", 1)
+        if samples > 1 and not self._provider.supports_n:
+            runtime_options, requests = {**runtime_options, "n": 1}, samples
+        else:
+            requests = 1
+        options = dict(
+            runtime_options=runtime_options,
+            function_messages=function_messages,
+            model=self.config["model"],
+            temperature=self.config["temperature"],
+            **self._provider.request_options(self),
+        )
+        return options, requests
+
+    def _read_responses(self, spec: LLMFuncSpec, responses: list, classify: bool = False) -> list:
+        """
+        Records the finish, the usage (and Ollama's prompt eval) of the responses and returns the assistant messages,
+        one per sample. A classification request returns its choices, for their logprobs.
+
+        """
+        if self._provider.api == "openai":
+            chat_completion: ChatCompletion
+            for chat_completion in responses:
+                # A classification request stops at its one token on purpose
+                self._record_finish(spec, None if classify else self._finish_reason(chat_completion))
+                self._record_usage(spec, openai_usage(chat_completion, self.config["model"]))
+            if classify:
+                return [choice for chat_completion in responses for choice in chat_completion.choices]
+            raw_results: list[ChatCompletionMessage] = [choice.message for chat_completion in responses for choice in chat_completion.choices]
+            return raw_results
+
+        chat_response: ollama.ChatResponse
+        for chat_response in responses:
+            self._record_finish(spec, chat_response.done_reason)
+            self._record_prompt_eval(spec, chat_response)
+            self._record_usage(spec, ollama_usage(chat_response, self.config["model"]))
+        return [chat_response.message for chat_response in responses]
+
+    @profiled("request", "request")
+    def _single_create(self, prompt, spec: LLMFuncSpec, runtime_options: RuntimeOptions, function_messages=[], classify: bool = False) -> list:
+        """Sends one request to the provider and returns the assistant messages, one per sample"""
+        for name, quota in self._quotas(spec):
+            quota.check(name)
+
+        options, requests = self._request_options(runtime_options, function_messages)
+        create = self._provider.load().create
+
+        if requests == 1:
+            responses = [create(prompt, spec.client, **options)]
+        else:
+            # The provider has no `n`, the samples are concurrent requests sharing the cached prompt
+            with ThreadPoolExecutor(max_workers=requests, thread_name_prefix="llm_as_function_sample") as pool:
+                futures = [pool.submit(contextvars.copy_context().run, create, prompt, spec.client, **options) for _ in range(requests)]
+                responses = [future.result() for future in futures]
+
+        return self._read_responses(spec, responses, classify)
+
+    def _slot(self, spec: LLMFuncSpec):
+        """A slot of the scheduler for one request of the function, with the priority of the call when set by `call_priority`"""
+        if self.scheduler is None:
+            return nullcontext()
+
+        priority, max_queue_wait = spec.schedule.priority, spec.schedule.max_queue_wait
+        override = _call_priority.get()
+        if override is not None:
+            priority, max_queue_wait = override[0], override[1] if override[1] is not None else max_queue_wait
+        return self.scheduler.slot(spec.name, priority, spec.schedule.weight, bounded(max_queue_wait))
+
+    @profiled("request", "request")
+    async def _single_acreate(self, prompt, spec: LLMFuncSpec, runtime_options: RuntimeOptions, function_messages=[], classify: bool = False) -> list:
+        """Sends one request to the provider through the scheduler and returns the assistant messages, one per sample"""
+        for name, quota in self._quotas(spec):
+            await quota.acheck(name)
+
+        options, requests = self._request_options(runtime_options, function_messages)
+        acreate = self._provider.load().acreate
+
+        async def create():
+            async with self._slot(spec):
+                return await acreate(prompt, spec.async_client, **options)
+
+        responses = await asyncio.gather(*[create() for _ in range(requests)])
+        return self._read_responses(spec, list(responses), classify)
+
+    def _classification_options(self, prompt, spec: LLMFuncSpec) -> RuntimeOptions:
+        runtime_options = spec.runtime_options(prompt)
+        runtime_options.update(max_tokens=1, top_logprobs=TOP_LOGPROBS)
+        return runtime_options
+
+    def _classification_result(self, choice, spec: LLMFuncSpec) -> Final | None:
+        result = classification_final(choice, spec.classification, spec.output_schema)  # type: ignore
+        if result is None:
+            metrics.inc("llm_classification_fallbacks", function=spec.name, model=self.config["model"])
+            logger.debug(f"The logprobs of {spec.name} don't decide its label, asking for JSON")
+        return result
+
+    def _fallback_prompt(self, prompt: str, spec: LLMFuncSpec) -> str:
+        """The prompt of the regular request of a classifier that wasn't answered from its logprobs"""
+        return prompt if self.config["has_structured_output"] else self._append_json_schema(prompt, spec.output_json)
+
+    def _classify(self, prompt, spec: LLMFuncSpec) -> Final | None:
+        """Answers a classifier from the logprobs of a one token request, None when they don't decide its label"""
+        choice = self._single_create(prompt, spec, self._classification_options(prompt, spec), classify=True)[0]
+        return self._classification_result(choice, spec)
+
+    async def _async_classify(self, prompt, spec: LLMFuncSpec) -> Final | None:
+        choice = (await self._single_acreate(prompt, spec, self._classification_options(prompt, spec), classify=True))[0]
+        return self._classification_result(choice, spec)
+
+    def _provider_response(self, prompt, spec: LLMFuncSpec):
+        runtime_options = spec.runtime_options(prompt)
         logger.debug(runtime_options)
 
-        if self.provider == "openai":
-            chat_completion = openai_single_create(
-                prompt,
-                self.openai_client,
-                runtime_options=runtime_options,
-                model=self.config["model"],
-                temperature=self.config["temperature"],
-            )
+        raw_results = self._single_create(prompt, spec, self._turn_options(runtime_options))
+
+        # If there is no tool_calls, return the content of every sample
+        if raw_results[0].tool_calls is None:
+            return self._final_samples(prompt, spec, runtime_options, raw_results)
+
+        # If there is tool_calls, call the functions
+        return self._function_call_branch(prompt, raw_results[0], spec, runtime_options)
+
+    @staticmethod
+    def _turn_options(runtime_options: RuntimeOptions) -> RuntimeOptions:
+        """The options of a turn that may call tools: one sample, only the final answer is sampled (see `_final_samples`)"""
+        return {**runtime_options, "n": 1} if runtime_options["tools"] else runtime_options  # type: ignore
+
+    @staticmethod
+    def _extra_samples_options(runtime_options: RuntimeOptions, raw_results: list) -> RuntimeOptions | None:
+        """The options of the request for the samples a tool turn didn't draw, with the tools off so they all answer"""
+        missing = runtime_options.get("n", 1) - len(raw_results)
+        return {**runtime_options, "n": missing, "tool_choice": "none"} if missing > 0 else None  # type: ignore
+
+    def _final_samples(self, prompt, spec: LLMFuncSpec, runtime_options: RuntimeOptions, raw_results: list, function_messages=[]) -> list:
+        """The content of every sample of the final answer, the first ones are from the turn that answered"""
+        options = self._extra_samples_options(runtime_options, raw_results)
+        if options is not None:
+            raw_results = raw_results + self._single_create(prompt, spec, options, function_messages)
+        return [raw_result.content for raw_result in raw_results]
+
+    async def _async_final_samples(self, prompt, spec: LLMFuncSpec, runtime_options: RuntimeOptions, raw_results: list, function_messages=[]) -> list:
+        options = self._extra_samples_options(runtime_options, raw_results)
+        if options is not None:
+            raw_results = raw_results + await self._single_acreate(prompt, spec, options, function_messages)
+        return [raw_result.content for raw_result in raw_results]
+
+    def _parse_tool_call(self, tool_call, spec: LLMFuncSpec) -> tuple[str, Callable, BaseModel]:
+        """Finds the tool the model called and validates its arguments"""
+        function_name = tool_call.function.name
+
+        try:
+            function_to_call = spec.fn_callings[function_name]
+        except KeyError as e:
+            logger.error(f"function name is never added: {function_name}")
+            raise e
+
+        function_args_json = tool_call.function.arguments  # For ollama this is Mapping[str, Any] and for openai this is str (JSON)
+
+        # Convert (or try to) ollama's Mapping[str, Any] to str
+        if not isinstance(function_args_json, str):
+            try:
+                function_args_json = json.dumps(function_args_json)
+            except Exception as e:
+                raise ValueError(f"Failed to convert function_args_json to str: {function_args_json}. Failed with exception: {e}")
 
-            raw_result: ChatCompletionMessage = chat_completion.choices[0].message
+        logger.debug(f"Calling function {function_name} with args {function_args_json}")
 
-            # If there is no tool_calls, return the content
-            if raw_result.tool_calls is None:
-                return raw_result.content
+        validate_type = spec.validators[function_name]
 
-            # If there is tool_calls, call the functions
-            return self._function_call_branch(prompt, raw_result, runtime_options, fn_callings)
+        try:
+            function_args_parsed = validate_type.model_validate_json(function_args_json)
+        except (ValueError, ValidationError):
+            raise InvalidFunctionParameters(function_name, function_args_json)
 
-        if self.provider == "ollama":
-            chat_response = ollama_single_create(
-                prompt,
-                self.ollama_client,
-                runtime_options=runtime_options,
-                model=self.config["model"],
-                temperature=self.config["temperature"],
-            )
+        return function_name, function_to_call, function_args_parsed
+
+    def _repair_request(self, error: InvalidFunctionParameters, spec: LLMFuncSpec) -> tuple[str, RuntimeOptions]:
+        """
+        A request for the arguments of a tool call that didn't validate. It has no tools, so its generation is
+        constrained to the argument schema of the tool: the call is fixed instead of losing the whole generation.
+
+        """
+        schema = spec.validators[error.invalid_function_name].model_json_schema()
+        prompt = (
+            f"These arguments of the tool {error.invalid_function_name} are invalid:\n{error.invalid_parameters}\n"
+            f"Write its arguments as a JSON object following this schema:\n{json.dumps(schema)}"
+        )
+        runtime_options = empty_runtime_options()
+        runtime_options.update(output_schema=schema, max_tokens=spec.max_tokens)
+        return prompt, runtime_options
+
+    def _repaired_tool_call(self, tool_call, arguments: str):
+        metrics.inc("tool_arguments_repaired", tool=tool_call.function.name)
+        return SimpleNamespace(id=tool_call.id, type="function", function=SimpleNamespace(name=tool_call.function.name, arguments=arguments))
+
+    def _parse_or_repair_tool_call(self, tool_call, spec: LLMFuncSpec) -> tuple[str, Callable, BaseModel]:
+        try:
+            return self._parse_tool_call(tool_call, spec)
+        except InvalidFunctionParameters as e:
+            if self.grammar is None:
+                raise e
+            logger.warning(f"Repairing the invalid arguments of {e.invalid_function_name}: {e.invalid_parameters}")
+            prompt, runtime_options = self._repair_request(e, spec)
+            arguments = self._single_create(prompt, spec, runtime_options)[0].content
+            return self._parse_tool_call(self._repaired_tool_call(tool_call, arguments), spec)
+
+    async def _async_parse_or_repair_tool_call(self, tool_call, spec: LLMFuncSpec) -> tuple[str, Callable, BaseModel]:
+        try:
+            return self._parse_tool_call(tool_call, spec)
+        except InvalidFunctionParameters as e:
+            if self.grammar is None:
+                raise e
+            logger.warning(f"Repairing the invalid arguments of {e.invalid_function_name}: {e.invalid_parameters}")
+            prompt, runtime_options = self._repair_request(e, spec)
+            arguments = (await self._single_acreate(prompt, spec, runtime_options))[0].content
+            return self._parse_tool_call(self._repaired_tool_call(tool_call, arguments), spec)
+
+    def _tool_cache_lookup(self, function_name: str, function_args_parsed: BaseModel, policy: ToolPolicy) -> tuple[str | None, str | None]:
+        """Returns the cache key of the call (None when the tool isn't cached) and the cached response if any"""
+        if policy.cache is None:
+            return None, None
+
+        cache_key = tool_cache_key(function_name, function_args_parsed)
+        function_response = policy.cache.get(cache_key)
+        metrics.inc("tool_cache_hits" if function_response is not None else "tool_cache_misses", tool=function_name)
+        return cache_key, function_response
+
+    def _tool_cache_store(self, cache_key: str | None, function_response, policy: ToolPolicy):
+        if policy.cache is not None and cache_key is not None and isinstance(function_response, str):
+            policy.cache.set(cache_key, function_response)
+
+    def _run_tool(self, function_to_call: Callable, function_args_parsed: BaseModel, policy: ToolPolicy):
+        """Runs a tool from the sync tool loop, following its execution policy, within the time left before the call deadline"""
+        timeout = bounded(policy.timeout)
+        if policy.executor == "process":
+            return self._process_pool.get().submit(function_to_call, function_args_parsed).result(timeout=timeout)
 
-            raw_results = chat_response.message
+        if inspect.iscoroutinefunction(function_to_call):
+            return run_sync(asyncio.wait_for(function_to_call(function_args_parsed), timeout))
 
-            # If there is no tool_calls, return the content
-            if raw_results.tool_calls is None:
-                return raw_results.content
+        if timeout is not None:
+            # A sync tool can't be interrupted, the call stops waiting for it
+            return self._executor.submit(contextvars.copy_context().run, function_to_call, function_args_parsed).result(timeout=timeout)
 
-            # If there is tool_calls, call the functions
-            return self._function_call_branch(prompt, raw_results, runtime_options, fn_callings)
+        return function_to_call(function_args_parsed)
 
-        raise NotImplementedError(f"Provider [{self.provider}] is not supported yet")
+    async def _async_run_tool(self, function_to_call: Callable, function_args_parsed: BaseModel, policy: ToolPolicy):
+        """Runs a tool from the async tool loop without blocking the event loop, following its execution policy"""
+        timeout = bounded(policy.timeout)
+        if policy.executor == "process":
+            loop = asyncio.get_running_loop()
+            return await asyncio.wait_for(loop.run_in_executor(self._process_pool.get(), function_to_call, function_args_parsed), timeout)
+
+        if inspect.iscoroutinefunction(function_to_call):
+            return await asyncio.wait_for(function_to_call(function_args_parsed), timeout)
+
+        return await asyncio.wait_for(run_in_executor(self._executor, function_to_call, function_args_parsed), timeout)
+
+    def _tool_response_message(self, tool_call, function_name: str, function_response) -> dict:
+        assert isinstance(function_response, str), f"Expect function [{function_name}] to return str, not {type(function_response)}"
+
+        message = {
+            "role": "tool",
+            "name": function_name,
+            "content": function_response,
+        }
+
+        # openai has id, ollama has tool_call_id
+        if hasattr(tool_call, 'id'):
+            assert self._provider.api == "openai", "tool_call is not expected to be ollama.Message.ToolCall since it has no id"
+            message["tool_call_id"] = tool_call.id
+
+        return message
 
     def _form_function_messages(
         self,
-        tool_message: ChatCompletionMessage | ollama.Message,
-        fn_callings={},
+        tool_message: "ChatCompletionMessage | ollama.Message",
+        spec: LLMFuncSpec,
         history_messages=[],
     ):
         function_messages = history_messages + [tool_message]
@@ -284,191 +943,220 @@ class LLMFunc:
             raise ValueError("tool_calls is None")
 
         for tool_call in tool_calls:
-            function_name = tool_call.function.name
-
-            try:
-                function_to_call = fn_callings[function_name]
-            except KeyError as e:
-                logger.error(f"function name is never added: {function_name}")
-                raise e
+            function_name, function_to_call, function_args_parsed = self._parse_or_repair_tool_call(tool_call, spec)
+            policy = spec.tool_policies[function_name]
 
-            function_args_json = tool_call.function.arguments  # For ollama this is Mapping[str, Any] and for openai this is str (JSON)
+            with span(function_name, "tool"):
+                cache_key, function_response = self._tool_cache_lookup(function_name, function_args_parsed, policy)
 
-            # Convert (or try to) ollama's Mapping[str, Any] to str
-            if not isinstance(function_args_json, str):
-                try:
-                    function_args_json = json.dumps(function_args_json)
-                except Exception as e:
-                    raise ValueError(f"Failed to convert function_args_json to str: {function_args_json}. Failed with exception: {e}")
+                if function_response is None:
+                    try:
+                        function_response = self._run_tool(function_to_call, function_args_parsed, policy)
+                    except Exception as e:
+                        logger.error(f"Occur error when running {function_name}")
+                        raise e
 
-            logger.debug(f"Calling function {function_name} with args {function_args_json}")
+                    self._tool_cache_store(cache_key, function_response, policy)
 
-            validate_type: type[BaseModel] = get_argument_for_function(function_to_call)
-
-            try:
-                function_args_parsed = validate_type.model_validate_json(function_args_json)
-            except (ValueError, ValidationError):
-                raise InvalidFunctionParameters(function_name, function_args_json)
-
-            try:
-                function_response = function_to_call(function_args_parsed)
-            except Exception as e:
-                logger.error(f"Occur error when running {function_name}")
-                raise e
-
-            assert isinstance(function_response, str), f"Expect function [{function_name}] to return str, not {type(function_response)}"
-
-            message = {
-                "role": "tool",
-                "name": function_name,
-                "content": function_response,
-            }
-
-            # openai has id, ollama has tool_call_id
-            if hasattr(tool_call, 'id'):
-                assert not isinstance(tool_call, ollama.Message.ToolCall), "tool_call is not expected to be ollama.Message.ToolCall since it has no id"
-                message["tool_call_id"] = tool_call.id
-
-            function_messages.append(message)
+            function_messages.append(self._tool_response_message(tool_call, function_name, function_response))
 
         return function_messages
 
-    def _function_call_branch(
+    async def _async_form_function_messages(
         self,
-        prompt,
-        tool_message: ChatCompletionMessage | ollama.Message,
-        runtime_options={},
-        fn_callings={},
+        tool_message: "ChatCompletionMessage | ollama.Message",
+        spec: LLMFuncSpec,
         history_messages=[],
     ):
-        """Recursively call the functions in the tool_calls, each time appending the function response to funciton_messages and calling the next function"""
-        function_messages = self._form_function_messages(tool_message, fn_callings, history_messages)
+        """Same as `_form_function_messages`, but the tool calls of a turn run concurrently: async tools are awaited, sync tools run in the executor"""
+        function_messages = history_messages + [tool_message]
 
-        logger.debug(f"Function message {function_messages}")
+        tool_calls = tool_message.tool_calls
 
-        if self.provider == "openai":
-            chat_completion = openai_single_create(
-                prompt,
-                self.openai_client,
-                runtime_options=runtime_options,
-                function_messages=function_messages,
-                model=self.config["model"],
-                temperature=self.config["temperature"],
-            )
+        if tool_calls is None:
+            raise ValueError("tool_calls is None")
 
-            raw_result: ChatCompletionMessage = (chat_completion.choices[0].message)
+        parsed_calls = [await self._async_parse_or_repair_tool_call(tool_call, spec) for tool_call in tool_calls]
 
-            if raw_result.tool_calls is None:
-                return raw_result.content
+        async def run_tool(function_name: str, function_to_call: Callable, function_args_parsed: BaseModel):
+            policy = spec.tool_policies[function_name]
 
-            return self._function_call_branch(prompt, raw_result, runtime_options, fn_callings, function_messages)
+            with span(function_name, "tool"):
+                cache_key, function_response = self._tool_cache_lookup(function_name, function_args_parsed, policy)
+                if function_response is not None:
+                    return function_response
 
-        if self.provider == "ollama":
-            chat_response = ollama_single_create(
-                prompt,
-                self.ollama_client,
-                runtime_options=runtime_options,
-                function_messages=function_messages,
-                model=self.config["model"],
-                temperature=self.config["temperature"],
-            )
+                try:
+                    function_response = await self._async_run_tool(function_to_call, function_args_parsed, policy)
+                except Exception as e:
+                    logger.error(f"Occur error when running {function_name}")
+                    raise e
 
-            raw_results = chat_response.message
+                self._tool_cache_store(cache_key, function_response, policy)
+                return function_response
 
-            if raw_results.tool_calls is None:
-                return raw_results.content
+        # Identical calls of a cached tool within this turn share one execution
+        turn_calls: dict[str, asyncio.Future] = {}
 
-            return self._function_call_branch(prompt, raw_results, runtime_options, fn_callings, function_messages)
+        def schedule(function_name: str, function_to_call: Callable, function_args_parsed: BaseModel):
+            cache = spec.tool_policies[function_name].cache
+            if cache is None:
+                return run_tool(function_name, function_to_call, function_args_parsed)
 
-        raise NotImplementedError(f"Function calling for provider [{self.provider}] is not supported yet")
+            key = tool_cache_key(function_name, function_args_parsed)
+            if key in turn_calls:
+                cache.count_hit()
+                metrics.inc("tool_cache_hits", tool=function_name)
+            else:
+                turn_calls[key] = asyncio.ensure_future(run_tool(function_name, function_to_call, function_args_parsed))
+            return turn_calls[key]
 
-    async def _provider_async_response(
-        self, prompt, runtime_options={}, fn_callings={}
+        function_responses = await asyncio.gather(*[schedule(*parsed_call) for parsed_call in parsed_calls])
+
+        for tool_call, (function_name, _, _), function_response in zip(tool_calls, parsed_calls, function_responses):
+            function_messages.append(self._tool_response_message(tool_call, function_name, function_response))
+
+        return function_messages
+
+    def _compact_history(self, function_messages: list, spec: LLMFuncSpec) -> list:
+        if spec.context_policy is None:
+            return function_messages
+        return compact_history(function_messages, spec.context_policy, self.tokenizer or approx_token_count)
+
+    def _function_call_branch(
+        self,
+        prompt,
+        tool_message: "ChatCompletionMessage | ollama.Message",
+        spec: LLMFuncSpec,
+        runtime_options: RuntimeOptions,
+        history_messages=[],
     ):
-        if self.provider == "openai":
-            chat_completion: ChatCompletion = await self.async_models["openai"](
-                prompt,
-                self.openai_async_client,
-                runtime_options=runtime_options,
-                model=self.config["model"],
-                temperature=self.config["temperature"],
-            )
+        """Recursively call the functions in the tool_calls, each time appending the function response to funciton_messages and calling the next function"""
+        function_messages = self._form_function_messages(tool_message, spec, history_messages)
+        function_messages = self._compact_history(function_messages, spec)
 
-            openai_raw_result: ChatCompletionMessage = chat_completion.choices[0].message
+        logger.debug(f"Function message {function_messages}")
 
-            if openai_raw_result.tool_calls is None:
-                return openai_raw_result.content
+        raw_results = self._single_create(prompt, spec, self._turn_options(runtime_options), function_messages)
 
-            return await self._async_function_call_branch(prompt, openai_raw_result, runtime_options, fn_callings)
+        if raw_results[0].tool_calls is None:
+            return self._final_samples(prompt, spec, runtime_options, raw_results, function_messages)
 
-        if self.provider == "ollama":
-            raw_result: ollama.ChatResponse = await self.async_models["ollama"](
-                prompt,
-                self.ollama_async_client,
-                runtime_options=runtime_options,
-                model=self.config["model"],
-                temperature=self.config["temperature"],
-            )
+        return self._function_call_branch(prompt, raw_results[0], spec, runtime_options, function_messages)
 
-            ollama_raw_result: ollama.Message = raw_result.message
+    async def _provider_async_response(self, prompt, spec: LLMFuncSpec):
+        runtime_options = spec.runtime_options(prompt)
 
-            if ollama_raw_result.tool_calls is None:
-                return ollama_raw_result.content
+        raw_results = await self._single_acreate(prompt, spec, self._turn_options(runtime_options))
 
-            return await self._async_function_call_branch(prompt, ollama_raw_result, runtime_options, fn_callings)
+        if raw_results[0].tool_calls is None:
+            return await self._async_final_samples(prompt, spec, runtime_options, raw_results)
 
-        raise NotImplementedError(f"Provider [{self.provider}] is not supported yet")
+        return await self._async_function_call_branch(prompt, raw_results[0], spec, runtime_options)
 
     async def _async_function_call_branch(
         self,
         prompt,
-        tool_message: ChatCompletionMessage | ollama.Message,
-        runtime_options={},
-        fn_callings={},
+        tool_message: "ChatCompletionMessage | ollama.Message",
+        spec: LLMFuncSpec,
+        runtime_options: RuntimeOptions,
         history_messages=[],
     ):
-        function_messages = self._form_function_messages(
-            tool_message, fn_callings, history_messages
-        )
+        function_messages = await self._async_form_function_messages(tool_message, spec, history_messages)
+        function_messages = self._compact_history(function_messages, spec)
         logger.debug(f"Function message {function_messages}")
 
-        if self.provider == "openai":
-            chat_completion: ChatCompletion = await self.async_models["openai"](
-                prompt,
-                self.openai_async_client,
-                runtime_options=runtime_options,
-                function_messages=function_messages,
-                model=self.config["model"],
-                temperature=self.config["temperature"],
-            )
+        raw_results = await self._single_acreate(prompt, spec, self._turn_options(runtime_options), function_messages)
+
+        if raw_results[0].tool_calls is None:
+            return await self._async_final_samples(prompt, spec, runtime_options, raw_results, function_messages)
 
-            openai_raw_result: ChatCompletionMessage = chat_completion.choices[0].message
+        return await self._async_function_call_branch(prompt, raw_results[0], spec, runtime_options, function_messages)
 
-            if openai_raw_result.tool_calls is None:
-                return openai_raw_result.content
+    def warmup(self):
+        """
+        Takes the cold start off the first call: loads the Ollama model into memory (kept for `keep_alive`),
+        or opens a pooled connection to the OpenAI endpoint.
 
-            return await self._async_function_call_branch(prompt, openai_raw_result, runtime_options, fn_callings, function_messages)
+        """
+        start = time.perf_counter()
+        self._provider.load().warmup(self._clients()[0], self.config["model"], **self._provider.request_options(self))
+        logger.debug(f"Warmed up {self.config['model']} in {time.perf_counter() - start:.2f}s")
 
-        if self.provider == "ollama":
-            raw_result: ollama.ChatResponse = await self.async_models["ollama"](
-                prompt,
-                self.ollama_async_client,
-                runtime_options=runtime_options,
-                function_messages=function_messages,
-                model=self.config["model"],
-                temperature=self.config["temperature"],
-            )
+    async def async_warmup(self, connections: int = 1):
+        """
+        Same as `warmup` for the async client, opens `connections` pooled connections at once.
+        Must be awaited in the event loop that will serve the calls.
 
-            ollama_raw_result: ollama.Message = raw_result.message
+        """
+        start = time.perf_counter()
+        await self._provider.load().awarmup(self._clients()[1], self.config["model"], connections, **self._provider.request_options(self))
+        logger.debug(f"Warmed up {self.config['model']} in {time.perf_counter() - start:.2f}s")
+
+    def _batch_spec(self, spec: LLMFuncSpec) -> LLMFuncSpec:
+        """The spec of the batched requests of a function, its output is the list of the function's outputs"""
+        assert spec.batch is not None
+        output_schema = batch_output_schema(spec.output_schema)
+        return replace(
+            spec,
+            output_schema=output_schema,
+            output_json=generate_schema_prompt(output_schema),
+            json_schema=MappingProxyType(output_schema.model_json_schema()),
+            max_tokens=None if spec.max_tokens is None else spec.max_tokens * spec.batch.max_size,
+            samples=1,
+        )
 
-            if ollama_raw_result.tool_calls is None:
-                return ollama_raw_result.content
+    def _batch_prompt(self, items: list[tuple[dict, dict | None]], batch_spec: LLMFuncSpec) -> str:
+        """The prompt of every call of the batch"""
+        variables = []
+        for kwargs, local_var in items:
+            if self.max_kwargs_tokens is not None:
+                kwargs = truncate_kwargs(kwargs, self.max_kwargs_tokens, self.tokenizer or approx_token_count)
+            variables.append({**kwargs, **(local_var or {})})
+
+        prompt = batch_prompt(batch_spec.prompt_template, variables)
+        if not self.config["has_structured_output"]:
+            prompt = self._append_json_schema(prompt, batch_spec.output_json)
+        return prompt
 
-            return await self._async_function_call_branch(prompt, ollama_raw_result, runtime_options, fn_callings, function_messages)
+    async def _batch_response(self, prompt: str, calls: int, batch_spec: LLMFuncSpec) -> list[Final]:
+        """Answers every call of the batch with one request"""
+        with track_usage() as usage:
+            result = self._parse_samples(await self._provider_async_response(prompt, batch_spec), batch_spec)
+        if not result.ok():
+            raise InvalidLLMResponse(f"The batch response doesn't match its schema: {result.unpack()}")
+        results = result.pack["results"]  # type: ignore
+        if len(results) != calls:
+            raise InvalidLLMResponse(f"Expected {calls} results from the batch, got {len(results)}")
 
-        raise NotImplementedError(
-            f"Function calling for provider [{self.provider}] is not supported yet"
-        )
+        return [Final(pack, usage=usage.share(calls)) for pack in results]
+
+    async def _run_batch(
+        self,
+        items: list[tuple[dict, dict | None]],
+        contexts: list[contextvars.Context],
+        spec: LLMFuncSpec,
+        batch_spec: LLMFuncSpec,
+        respond: Callable[[str], Awaitable[Final]],
+    ) -> list[Final | BaseException]:
+        """
+        Answers a batch of calls with one request, sent with the latest deadline of the calls, or with one request per
+        call when the batch can't be answered as a whole. Each of these requests is sent in the context of its call.
+
+        """
+        if len(items) > 1:
+            try:
+                # A malformed template fails every call, each one gets the error from its own prompt
+                prompt = self._batch_prompt(items, batch_spec)
+                with latest_deadline(contexts):
+                    return await self._batch_response(prompt, len(items), batch_spec)  # type: ignore
+            except (InvalidLLMResponse, ValidationError, DeadlineExceeded, ValueError, KeyError, AttributeError, IndexError, TypeError) as e:
+                logger.warning(f"Batch of {len(items)} calls of {spec.name} failed, falling back to one request per call: {e!r}")
+                metrics.inc("llm_batch_fallbacks", function=spec.name, model=self.config["model"])
+
+        prompts = [self._render_prompt(kwargs, local_var, spec) for kwargs, local_var in items]
+        tasks = [context.run(asyncio.ensure_future, respond(prompt)) for context, prompt in zip(contexts, prompts)]
+        return list(await asyncio.gather(*tasks, return_exceptions=True))  # type: ignore
 
     def _append_json_schema(self, prompt: str, output_json: str):
         """Gets the json schema prompt and appends it to the prompt to make models output json like the schema"""
@@ -477,103 +1165,282 @@ class LLMFunc:
 
     def __call__(self, func):
         # parse input
-        (
-            prompt_template,
-            output_json,
-            output_schema,
-            runtime_options,
-            fn_callings,
-        ) = self._init_setup(func)
+        spec = self._init_setup(func)
+        if spec.batch is not None:
+            raise ValueError("Micro-batching packs concurrent calls, it needs an async function (async_call)")
 
-        self.reset()
+        takes_deadline = "deadline" in inspect.signature(func).parameters
 
         @ wraps(func)
         def new_func(**kwargs):
-            local_var = func(**kwargs)
-            logger.debug(f"[Variables] function args:{kwargs}, local vars: {local_var}")
-
-            prompt = self._fill_prompt(kwargs, local_var, prompt_template)
-
-            if isinstance(prompt, Final):
-                # Docs say "The `Final` is a class in `llm-as-function`, and returning this class indicates that you do not need the large model to process your output."
-                # So this should just return
-                return prompt
+            with deadline(None if takes_deadline else kwargs.pop("deadline", None)), span(spec.name):
+                local_var = func(**kwargs)
 
-            if output_json is None:
-                raise ValueError("The output_json is None when calling llmfunction. Most likely output_schema isn't supplied so the output_json couldn't be generated")
+                prompt = self._render_prompt(kwargs, local_var, spec)
 
-            if not self.config["has_structured_output"]:
-                prompt = self._append_json_schema(prompt, output_json)
+                if isinstance(prompt, Final):
+                    return prompt
 
-            logger.debug(prompt)
+                with track_usage() as usage:
+                    result = self._classify(prompt, spec) if spec.classification is not None else None
+                    if result is None:
+                        prompt = self._fallback_prompt(prompt, spec) if spec.classification is not None else prompt
+                        result = self._parse_samples(self._provider_response(prompt, spec), spec)
 
-            raw_result = self._provider_response(
-                prompt, runtime_options=runtime_options, fn_callings=fn_callings
-            )
+                result.usage = usage
 
-            if not isinstance(raw_result, str):
-                raise ValueError(f"Expected raw_result to be of type 'str' but it is of type '{type(raw_result)}'")
+                return result
 
-            if output_schema is None:
-                raise ValueError("The output_schema is None, it is expected to be a type[BaseModel]")
+        def dry_run(**kwargs) -> DryRunReport:
+            """Runs the function body and renders the request `new_func(**kwargs)` would send, without sending it"""
+            prompt = self._render_prompt(kwargs, func(**kwargs), spec)
+            return self._dry_run_report(prompt, spec)
 
-            result = self.parse_output(raw_result, output_schema)
+        def dry_run_many(dataset: Iterable[dict], tokenizer: Tokenizer | None = None) -> DryRunStats:
+            """Dry runs every kwargs of the dataset and aggregates the token estimations"""
+            reports = []
+            for kwargs in dataset:
+                prompt = self._render_prompt(kwargs, func(**kwargs), spec)
+                reports.append(self._dry_run_report(prompt, spec, tokenizer))
+            return DryRunStats(reports)
 
-            return result
+        new_func.spec = spec  # type: ignore
+        new_func.dry_run = dry_run  # type: ignore
+        new_func.dry_run_many = dry_run_many  # type: ignore
+        new_func.usage = lambda: function_usage(spec.name)  # type: ignore
 
         return new_func
 
     def async_call(self, func):
-        (
-            prompt_template,
-            output_json,
-            output_schema,
-            runtime_options,
-            fn_callings,
-        ) = self._init_setup(func)
-
-        self.reset()
+        spec = self._init_setup(func)
 
-        @ wraps(func)
-        async def new_func(**kwargs):
+        async def call_body(kwargs: dict) -> Final | dict | None:
             if inspect.iscoroutinefunction(func):
-                local_var = await func(**kwargs)
-            else:
-                local_var = func(**kwargs)
-            logger.debug(f"[Variables] function args:{kwargs}, local vars: {local_var}")
+                return await func(**kwargs)
+            # A sync body may block (e.g. calling other sync llm functions), keep it off the event loop
+            return await run_in_executor(self._executor, func, **kwargs)
+
+        async def run_body(kwargs: dict) -> Final | str:
+            return self._render_prompt(kwargs, await call_body(kwargs), spec)
 
-            prompt = self._fill_prompt(kwargs, local_var, prompt_template)
+        async def respond(prompt: str) -> Final:
+            with track_usage() as usage:
+                result = await self._async_classify(prompt, spec) if spec.classification is not None else None
+                if result is None:
+                    prompt = self._fallback_prompt(prompt, spec) if spec.classification is not None else prompt
+                    result = self._parse_samples(await self._provider_async_response(prompt, spec), spec)
+
+            result.usage = usage
+            logger.debug(f"Return {result}")
+
+            return result
+
+        batcher = None
+        if spec.batch is not None:
+            batch_spec = self._batch_spec(spec)
+            batcher = MicroBatcher(
+                spec.batch,
+                lambda items, contexts: self._run_batch(items, contexts, spec, batch_spec, respond),
+                # The calls of different priorities, cassettes or profilers are never answered by one request
+                group=lambda: (_call_priority.get(), id(_cassette.get()), id(_profiler.get())),
+            )
+
+        async def run_call(kwargs: dict) -> Final:
+            if batcher is not None:
+                local_var = await call_body(kwargs)
+                if isinstance(local_var, Final):
+                    return local_var
+                return await batcher.submit((kwargs, local_var))
+
+            prompt = await run_body(kwargs)
 
             if isinstance(prompt, Final):
-                # Docs say "The `Final` is a class in `llm-as-function`, and returning this class indicates that you do not need the large model to process your output."
-                # So this should just return
                 return prompt
 
-            if output_json is None:
-                raise ValueError("The output_json is None when calling llmfunction. Most likely output_schema isn't supplied so the output_json couldn't be generated")
+            return await respond(prompt)
 
-            if not self.config["has_structured_output"]:
-                prompt = self._append_json_schema(prompt, output_json)
+        takes_deadline = "deadline" in inspect.signature(func).parameters
 
-            logger.debug(prompt)
+        @ wraps(func)
+        async def new_func(**kwargs):
+            with deadline(None if takes_deadline else kwargs.pop("deadline", None)), span(spec.name):
+                left = remaining()
+                if left is None:
+                    return await run_call(kwargs)
+                # Cancels the requests and tools still in flight at the deadline
+                return await asyncio.wait_for(run_call(kwargs), left)
+
+        async def dry_run(**kwargs) -> DryRunReport:
+            """Runs the function body and renders the request `new_func(**kwargs)` would send, without sending it"""
+            prompt = await run_body(kwargs)
+            return self._dry_run_report(prompt, spec)
+
+        async def dry_run_many(dataset: Iterable[dict], tokenizer: Tokenizer | None = None) -> DryRunStats:
+            """Dry runs every kwargs of the dataset and aggregates the token estimations"""
+            reports = []
+            for kwargs in dataset:
+                prompt = await run_body(kwargs)
+                reports.append(self._dry_run_report(prompt, spec, tokenizer))
+            return DryRunStats(reports)
+
+        new_func.spec = spec  # type: ignore
+        new_func.dry_run = dry_run  # type: ignore
+        new_func.dry_run_many = dry_run_many  # type: ignore
+        new_func.usage = lambda: function_usage(spec.name)  # type: ignore
 
-            raw_result = await self._provider_async_response(
-                prompt, runtime_options=runtime_options, fn_callings=fn_callings
-            )
+        return new_func
 
-            if not isinstance(raw_result, str):
-                raise ValueError(f"Expected raw_result to be of type 'str' but it is of type '{type(raw_result)}'")
+    def _fused_schedule(self, specs: dict[str, LLMFuncSpec]) -> SchedulePolicy:
+        """The strictest schedule of the fused functions: the most urgent priority, the largest weight and the shortest queue wait"""
+        priorities = self.scheduler.priorities if self.scheduler is not None else DEFAULT_PRIORITIES
+        policies = [spec.schedule for spec in specs.values()]
+        priority = min((policy.priority for policy in policies), key=lambda p: priorities.index(p) if p in priorities else len(priorities))
+        waits = [policy.max_queue_wait for policy in policies if policy.max_queue_wait is not None]
+        return SchedulePolicy(priority=priority, weight=max(policy.weight for policy in policies), max_queue_wait=min(waits) if waits else None)
+
+    def _fused_spec(self, specs: dict[str, LLMFuncSpec]) -> LLMFuncSpec:
+        """The spec of one request answering every function of specs, each under its name, with their quotas and schedules"""
+        output_schema = fused_output_schema({name: spec.output_schema for name, spec in specs.items()})
+        budgets = [spec.max_tokens for spec in specs.values()]
+        client, async_client = self._clients()
+        return LLMFuncSpec(
+            name=f"fuse({', '.join(specs)})",
+            prompt_template="",
+            output_schema=output_schema,
+            output_json=generate_schema_prompt(output_schema),
+            tools=(),
+            tool_choice="auto",
+            json_schema=MappingProxyType(output_schema.model_json_schema()),
+            max_tokens=None if None in budgets else sum(budgets),  # type: ignore
+            stop=(),
+            fn_callings=MappingProxyType({}),
+            validators=MappingProxyType({}),
+            tool_policies=MappingProxyType({}),
+            context_policy=None,
+            tool_index=None,
+            samples=1,
+            reducer=get_reducer("first_valid"),
+            batch=None,
+            schedule=self._fused_schedule(specs),
+            quota=None,
+            classification=None,
+            provider=self.provider,
+            client=client,
+            async_client=async_client,
+            members=tuple(specs.values()),
+        )
 
-            if output_schema is None:
-                raise ValueError("The output_schema is None, it is expected to be a type[BaseModel]")
+    def _fused_request(self, kwargs: dict, local_vars: dict[str, Any], specs: dict[str, LLMFuncSpec]) -> tuple[str, LLMFuncSpec]:
+        """The prompt and spec of the fused request for the functions whose body didn't return a `Final`"""
+        pending = {name: spec for name, spec in specs.items() if not isinstance(local_vars[name], Final)}
+        fused_spec = self._fused_spec(pending)
+
+        if self.max_kwargs_tokens is not None:
+            kwargs = truncate_kwargs(kwargs, self.max_kwargs_tokens, self.tokenizer or approx_token_count)
+        prompt = fused_prompt({name: spec.prompt_template for name, spec in pending.items()}, kwargs, {name: local_vars[name] or {} for name in pending})
+        if not self.config["has_structured_output"]:
+            prompt = self._append_json_schema(prompt, fused_spec.output_json)
+        return prompt, fused_spec
+
+    def _split_fused(self, raw_results: list, local_vars: dict[str, Any], specs: dict[str, LLMFuncSpec], usage: Usage) -> dict[str, Final | None]:
+        """The `Final` of every function, from its body or its key of the fused output, None when its answer is missing or invalid"""
+        json_dict = self._load_json(raw_results[0]) if isinstance(raw_results[0], str) else None
+        share = usage.share(max(1, sum(not isinstance(local_var, Final) for local_var in local_vars.values())))
+        results: dict[str, Final | None] = {}
+        for name, spec in specs.items():
+            if isinstance(local_vars[name], Final):
+                results[name] = local_vars[name]
+                continue
+            try:
+                results[name] = Final(spec.output_schema(**json_dict[name]).model_dump(), usage=share)  # type: ignore
+            except (TypeError, KeyError, ValidationError) as e:
+                logger.warning(f"The fused answer of {name} is invalid, calling it on its own: {e}")
+                results[name] = None
+        return results
 
-            result = self.parse_output(raw_result, output_schema)
-            logger.debug(f"Return {result}")
+    def fuse(self, *functions: Callable):
+        """
+        Fuses decorated functions called on the same kwargs (e.g. summary, tags and sentiment of one document) into one
+        request sent by this LLMFunc: the kwargs are sent once, and the output schema has the schema of every function
+        under its name. The fused function takes the kwargs and returns {function name: Final}. A function whose answer
+        is missing or invalid is called on its own. Functions with tools can't be fused. The request is checked against
+        the quota of every function it answers and scheduled with their most urgent priority, its usage is split between them.
 
-            return result
+        ```
+        views = gpt35_func.fuse(summarize, tag, sentiment)
+        results = views(document=text)  # {"summarize": Final, "tag": Final, "sentiment": Final}
+        ```
 
-        return new_func
+        """
+        named = {fn.__name__: fn for fn in functions}
+        if len(named) != len(functions):
+            raise ValueError("The fused functions must have different names")
+        specs: dict[str, LLMFuncSpec] = {name: fn.spec for name, fn in named.items()}
+        if any(spec.tools for spec in specs.values()):
+            raise ValueError("Functions with tools can't be fused")
+
+        is_async = [inspect.iscoroutinefunction(fn) for fn in functions]
+        if any(is_async) and not all(is_async):
+            raise ValueError("The fused functions must be all sync or all async")
+
+        if not all(is_async):
+
+            def fused(**kwargs) -> dict[str, Final]:
+                local_vars = {name: fn.__wrapped__(**kwargs) for name, fn in named.items()}
+                raw_results = [None]
+                with track_usage() as usage:
+                    if not all(isinstance(local_var, Final) for local_var in local_vars.values()):
+                        prompt, fused_spec = self._fused_request(kwargs, local_vars, specs)
+                        raw_results = self._provider_response(prompt, fused_spec)
+
+                results = self._split_fused(raw_results, local_vars, specs, usage)
+                return {name: result if result is not None else named[name](**kwargs) for name, result in results.items()}
+
+            return fused
+
+        async def call_body(fn: Callable, kwargs: dict):
+            if inspect.iscoroutinefunction(fn):
+                return await fn(**kwargs)
+            return await run_in_executor(self._executor, fn, **kwargs)
+
+        async def async_fused(**kwargs) -> dict[str, Final]:
+            bodies = await asyncio.gather(*[call_body(fn.__wrapped__, kwargs) for fn in named.values()])
+            local_vars = dict(zip(named, bodies))
+            raw_results = [None]
+            with track_usage() as usage:
+                if not all(isinstance(local_var, Final) for local_var in local_vars.values()):
+                    prompt, fused_spec = self._fused_request(kwargs, local_vars, specs)
+                    raw_results = await self._provider_async_response(prompt, fused_spec)
+
+            results = self._split_fused(raw_results, local_vars, specs, usage)
+            missing = [name for name, result in results.items() if result is None]
+            for name, result in zip(missing, await asyncio.gather(*[named[name](**kwargs) for name in missing])):
+                results[name] = result
+            return results  # type: ignore
+
+        return async_fused
 
     def generate_llm_description(self, **kwargs):
         raise NotImplementedError
         # prompt = self.prompt_template.format(input_args)
+
+
+def warmup_all():
+    """Warms up every LLMFunc that decorated a function, a failing warmup is logged and doesn't stop the others"""
+    for llm_func in list(_decorating_llm_funcs.values()):
+        try:
+            llm_func.warmup()
+        except Exception as e:
+            logger.warning(f"Failed to warm up {llm_func.config['model']}: {e}")
+
+
+async def async_warmup_all(connections: int = 1):
+    """Async version of `warmup_all`, every LLMFunc is warmed up concurrently"""
+
+    async def warm(llm_func: LLMFunc):
+        try:
+            await llm_func.async_warmup(connections)
+        except Exception as e:
+            logger.warning(f"Failed to warm up {llm_func.config['model']}: {e}")
+
+    await asyncio.gather(*[warm(llm_func) for llm_func in list(_decorating_llm_funcs.values())])
@@ -0,0 +1,55 @@
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+    """
+    A minimal thread-safe registry of counters and gauges, each identified by a name and labels.
+
+    ```
+    metrics.inc("llm_requests", function="fool", model="gpt-4o")
+    metrics.get("llm_requests", function="fool", model="gpt-4o")  # 1
+    ```
+
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._values: dict[tuple, float] = defaultdict(float)
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increments a counter"""
+        with self._lock:
+            self._values[self._key(name, labels)] += value
+
+    def set(self, name: str, value: float, **labels):
+        """Sets a gauge"""
+        with self._lock:
+            self._values[self._key(name, labels)] = value
+
+    def get(self, name: str, **labels) -> float:
+        """The value for these exact labels, or the sum over every label set when no labels are given"""
+        with self._lock:
+            if labels:
+                return self._values.get(self._key(name, labels), 0)
+            return sum(value for (key, _), value in self._values.items() if key == name)
+
+    def snapshot(self) -> dict[str, list[tuple[dict, float]]]:
+        """Every metric, as a list of (labels, value) per name"""
+        result: dict[str, list[tuple[dict, float]]] = defaultdict(list)
+        with self._lock:
+            for (name, labels), value in self._values.items():
+                result[name].append((dict(labels), value))
+        return dict(result)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+# The default registry every LLMFunc records into
+metrics = Metrics()
@@ -1,15 +1,5 @@
+from importlib import import_module
 from typing import Literal
-import httpx
-import ollama
-
-import openai
-from openai import OpenAI, AsyncOpenAI
-from openai.types.chat import ChatCompletion
-
-from functools import wraps
-
-from llm_as_function.llm_func import RuntimeOptions, empty_runtime_options
-from .utils import logger
 
 # Prompts for different providers
 ERNIE_PROMPT = """
@@ -41,186 +31,13 @@ def get_json_schema_prompt(provider: Literal["ernie", "openai", "ollama"] | str,
             return DEFAULT_PROMPT
 
 
-def openai_max_retry(func, retry_times=3):
-    @wraps(func)
-    def new_func(*args, **kwargs):
-        current_retries = 0
-        while current_retries < retry_times:
-            try:
-                result = func(*args, **kwargs)
-                return result
-            except openai.APIConnectionError as e:
-                current_retries += 1
-                if current_retries >= retry_times:
-                    raise e
-                logger.warning(
-                    f"Connect error for {func.__name__}, retry {current_retries} times"
-                )
-            except Exception as e:
-                raise e
-
-    return new_func
-
-
-def async_openai_max_retry(func, retry_times=3):
-    @wraps(func)
-    async def new_func(*args, **kwargs):
-        current_retries = 0
-        while current_retries < retry_times:
-            try:
-                result = await func(*args, **kwargs)
-                return result
-            except openai.APIConnectionError as e:
-                current_retries += 1
-                if current_retries >= retry_times:
-                    raise e
-                logger.warning(
-                    f"Connect error for {func.__name__}, retry {current_retries} times"
-                )
-            except Exception as e:
-                raise e
-
-    return new_func
-
-
-def ollama_max_retry(func, retry_times=3):
-    @wraps(func)
-    def new_func(*args, **kwargs):
-        current_retries = 0
-        while current_retries < retry_times:
-            try:
-                result = func(*args, **kwargs)
-                return result
-            except httpx.ConnectError as e:
-                current_retries += 1
-                if current_retries >= retry_times:
-                    raise e
-                logger.warning(
-                    f"Connect error for {func.__name__}, retry {current_retries} times"
-                )
-            except Exception as e:
-                raise e
-
-    return new_func
-
-
-def async_ollama_max_retry(func, retry_times=3):
-    @wraps(func)
-    async def new_func(*args, **kwargs):
-        current_retries = 0
-        while current_retries < retry_times:
-            try:
-                result = await func(*args, **kwargs)
-                return result
-            except httpx.ConnectError as e:
-                current_retries += 1
-                if current_retries >= retry_times:
-                    raise e
-                logger.warning(
-                    f"Connect error for {func.__name__}, retry {current_retries} times"
-                )
-            except Exception as e:
-                raise e
-
-    return new_func
-
-
-@openai_max_retry
-def openai_single_create(
-    query,
-    client: OpenAI,
-    model="gpt-3.5-turbo-1106",
-    temperature=0.1,
-    function_messages=[],
-    runtime_options: RuntimeOptions = empty_runtime_options(),
-) -> ChatCompletion:
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": query}] + function_messages,
-        temperature=temperature,
-        response_format={"type": "json_object"},
-        # This is the same type as list[ChatCompletionToolParams] but since we user our own types instead of openai's, we need to ignore this
-        tools=runtime_options["tools"],  # type: ignore
-        tool_choice=runtime_options["tool_choice"],
-    )
-    return response
-
-
-@async_openai_max_retry
-async def openai_single_acreate(
-    query,
-    client: AsyncOpenAI,
-    model="gpt-3.5-turbo-1106",
-    temperature=0.1,
-    function_messages=[],
-    runtime_options: RuntimeOptions = empty_runtime_options(),
-) -> ChatCompletion:
-
-    response = await client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": query}] + function_messages,
-        temperature=temperature,
-        response_format={"type": "json_object"},
-        # This is the same type as list[ChatCompletionToolParams] but since we user our own types instead of openai's, we need to ignore this
-        tools=runtime_options["tools"],  # type: ignore
-        tool_choice=runtime_options["tool_choice"],
-    )
-    return response
-
-
-@ollama_max_retry
-def ollama_single_create(
-    query,
-    client: ollama.Client,
-    model="llama2",
-    temperature=0.1,
-    function_messages=[],
-    runtime_options: RuntimeOptions = empty_runtime_options(),
-) -> ollama.ChatResponse:
-
-    if runtime_options["tools"]:
-        repsonse = client.chat(
-            model=model,
-            messages=[{"role": "user", "content": query}] + function_messages,
-            options={"temperature": temperature},
-            tools=runtime_options["tools"],  # ollama can just take in python functions but it also supports the tool format
-            format=runtime_options["output_schema"],
-        )
-    else:
-        repsonse = client.chat(
-            model=model,
-            messages=[{"role": "user", "content": query}] + function_messages,
-            options={"temperature": temperature},
-            format=runtime_options["output_schema"],
-        )
-
-    return repsonse
-
-
-@async_ollama_max_retry
-async def ollama_single_acreate(
-    query,
-    client: ollama.AsyncClient,
-    model="llama2",
-    temperature=0.1,
-    function_messages=[],
-    runtime_options: RuntimeOptions = empty_runtime_options(),
-) -> ollama.ChatResponse:
-
-    if runtime_options["tools"]:
-        response = await client.chat(
-            model=model,
-            messages=[{"role": "user", "content": query}] + function_messages,
-            options={"temperature": temperature},
-            tools=runtime_options["tools"],  # ollama can just take in python functions but it also supports the tool format
-            format=runtime_options["output_schema"],
-        )
-    else:
-        response = await client.chat(
-            model=model,
-            messages=[{"role": "user", "content": query}] + function_messages,
-            options={"temperature": temperature},
-            format=runtime_options["output_schema"],
-        )
+def __getattr__(name: str):
+    """
+    The functions of the providers live next to their SDK, in `openai_provider` and `ollama_provider`, so importing
+    the package doesn't import the SDKs. They are still reachable from here, e.g. `models.openai_single_create`.
 
-    return response
+    """
+    for sdk in ["openai", "ollama"]:
+        if sdk in name.lower():
+            return getattr(import_module(f".{sdk}_provider", __package__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,226 @@
+from functools import wraps
+from typing import TYPE_CHECKING
+
+import httpx
+import ollama
+
+from .cassette import aplay, play
+from .deadline import apply_deadline, async_apply_deadline, remaining
+from .providers import ProviderFunctions
+from .types import RuntimeOptions, empty_runtime_options
+from .utils import JSONObjectScanner, logger
+
+if TYPE_CHECKING:
+    from .llm_func import LLMFunc
+
+
+def ollama_max_retry(func, retry_times=3):
+    @wraps(func)
+    def new_func(*args, **kwargs):
+        current_retries = 0
+        while current_retries < retry_times:
+            try:
+                result = func(*args, **kwargs)
+                return result
+            except httpx.ConnectError as e:
+                current_retries += 1
+                if current_retries >= retry_times:
+                    raise e
+                remaining()  # No retry past the call deadline
+                logger.warning(
+                    f"Connect error for {func.__name__}, retry {current_retries} times"
+                )
+            except Exception as e:
+                raise e
+
+    return new_func
+
+
+def async_ollama_max_retry(func, retry_times=3):
+    @wraps(func)
+    async def new_func(*args, **kwargs):
+        current_retries = 0
+        while current_retries < retry_times:
+            try:
+                result = await func(*args, **kwargs)
+                return result
+            except httpx.ConnectError as e:
+                current_retries += 1
+                if current_retries >= retry_times:
+                    raise e
+                remaining()  # No retry past the call deadline
+                logger.warning(
+                    f"Connect error for {func.__name__}, retry {current_retries} times"
+                )
+            except Exception as e:
+                raise e
+
+    return new_func
+
+
+def ollama_chat_payload(
+    query,
+    model="llama2",
+    temperature=0.1,
+    function_messages=[],
+    runtime_options: RuntimeOptions = empty_runtime_options(),
+    keep_alive: float | str | None = None,
+    num_ctx: int | None = None,
+) -> dict:
+    """The keyword arguments `ollama_single_create` and `ollama_single_acreate` send to `client.chat`"""
+    options = {"temperature": temperature}
+    if num_ctx is not None:
+        # A context size that changes between requests reloads the model and throws away its prompt cache
+        options["num_ctx"] = num_ctx
+    if runtime_options.get("max_tokens") is not None:
+        options["num_predict"] = runtime_options["max_tokens"]
+    if runtime_options.get("stop"):
+        options["stop"] = runtime_options["stop"]
+
+    payload = dict(
+        model=model,
+        messages=[{"role": "user", "content": query}] + function_messages,
+        options=options,
+        format=runtime_options["output_schema"],
+    )
+    if runtime_options["tools"]:
+        payload["tools"] = runtime_options["tools"]  # ollama can just take in python functions but it also supports the tool format
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive  # How long the model stays loaded after the request, e.g. "30m" or -1 for forever
+    return payload
+
+
+def _streamed_ollama_response(scanner: JSONObjectScanner, chunks: int, last_chunk: ollama.ChatResponse | None) -> ollama.ChatResponse:
+    """Rebuilds a single response from a stream that may have been closed early"""
+    if last_chunk is None:
+        return ollama.ChatResponse(done=True, message=ollama.Message(role="assistant", content=scanner.text))
+
+    return ollama.ChatResponse(
+        model=last_chunk.model,
+        created_at=last_chunk.created_at,
+        done=True,
+        done_reason="stop" if scanner.complete else last_chunk.done_reason,
+        load_duration=last_chunk.load_duration,
+        prompt_eval_count=last_chunk.prompt_eval_count,
+        prompt_eval_duration=last_chunk.prompt_eval_duration,
+        eval_count=last_chunk.eval_count if last_chunk.done else chunks,  # Every chunk is one token
+        message=ollama.Message(role="assistant", content=scanner.text),
+    )
+
+
+def ollama_stream_until_json(client: ollama.Client, payload: dict) -> ollama.ChatResponse:
+    """
+    Streams the response and closes the stream as soon as the first top-level JSON object is complete,
+    so we don't wait for the text small models keep generating after it.
+
+    """
+    stream = client.chat(**payload, stream=True)
+    scanner = JSONObjectScanner()
+    chunks, last_chunk = 0, None
+    try:
+        for chunk in stream:
+            chunks, last_chunk = chunks + 1, chunk
+            if scanner.feed(chunk.message.content or ""):
+                break
+            remaining()  # Closes the stream at the call deadline
+    finally:
+        # Closing the stream closes the connection, which makes ollama stop generating
+        stream.close()
+
+    return _streamed_ollama_response(scanner, chunks, last_chunk)
+
+
+async def ollama_astream_until_json(client: ollama.AsyncClient, payload: dict) -> ollama.ChatResponse:
+    stream = await client.chat(**payload, stream=True)
+    scanner = JSONObjectScanner()
+    chunks, last_chunk = 0, None
+    try:
+        async for chunk in stream:
+            chunks, last_chunk = chunks + 1, chunk
+            if scanner.feed(chunk.message.content or ""):
+                break
+            remaining()  # Closes the stream at the call deadline
+    finally:
+        await stream.aclose()
+
+    return _streamed_ollama_response(scanner, chunks, last_chunk)
+
+
+@ollama_max_retry
+def ollama_single_create(
+    query,
+    client: ollama.Client,
+    model="llama2",
+    temperature=0.1,
+    function_messages=[],
+    runtime_options: RuntimeOptions = empty_runtime_options(),
+    keep_alive: float | str | None = None,
+    stop_at_json: bool = False,
+    num_ctx: int | None = None,
+) -> ollama.ChatResponse:
+    payload = ollama_chat_payload(query, model, temperature, function_messages, runtime_options, keep_alive, num_ctx)
+
+    def send() -> ollama.ChatResponse:
+        # Tool calls don't come as JSON content, so the stream can only be cut when no tool is registered
+        if stop_at_json and not runtime_options["tools"]:
+            return ollama_stream_until_json(client, payload)
+        return client.chat(**payload)
+
+    response = play("ollama", payload, ollama.ChatResponse, send)
+    return response
+
+
+@async_ollama_max_retry
+async def ollama_single_acreate(
+    query,
+    client: ollama.AsyncClient,
+    model="llama2",
+    temperature=0.1,
+    function_messages=[],
+    runtime_options: RuntimeOptions = empty_runtime_options(),
+    keep_alive: float | str | None = None,
+    stop_at_json: bool = False,
+    num_ctx: int | None = None,
+) -> ollama.ChatResponse:
+    payload = ollama_chat_payload(query, model, temperature, function_messages, runtime_options, keep_alive, num_ctx)
+
+    async def send() -> ollama.ChatResponse:
+        if stop_at_json and not runtime_options["tools"]:
+            return await ollama_astream_until_json(client, payload)
+        return await client.chat(**payload)
+
+    response = await aplay("ollama", payload, ollama.ChatResponse, send)
+    return response
+
+
+def ollama_warmup(client: ollama.Client, model="llama2", keep_alive: float | str | None = None, num_ctx: int | None = None):
+    """
+    Loads the model into memory, an empty prompt makes ollama load the model without generating.
+    It is loaded with the num_ctx of the calls, or the first call would reload it.
+
+    """
+    client.generate(model=model, keep_alive=keep_alive, options=None if num_ctx is None else {"num_ctx": num_ctx})
+
+
+async def ollama_awarmup(client: ollama.AsyncClient, model="llama2", keep_alive: float | str | None = None, num_ctx: int | None = None):
+    await client.generate(model=model, keep_alive=keep_alive, options=None if num_ctx is None else {"num_ctx": num_ctx})
+
+
+def ollama_clients(llm_func: "LLMFunc") -> tuple[ollama.Client, ollama.AsyncClient]:
+    if llm_func.ollama_base_url is None:
+        logger.warning("Ollama base url is not set, ollama will use default")
+
+    client = ollama.Client(host=llm_func.ollama_base_url, event_hooks={"request": [apply_deadline]})
+    async_client = ollama.AsyncClient(host=llm_func.ollama_base_url, event_hooks={"request": [async_apply_deadline]})
+    return client, async_client
+
+
+OLLAMA_FUNCTIONS = ProviderFunctions(
+    create=ollama_single_create,
+    acreate=ollama_single_acreate,
+    # Streaming doesn't change the request
+    payload=lambda *args, stop_at_json=False, **options: ollama_chat_payload(*args, **options),
+    clients=ollama_clients,
+    warmup=lambda client, model, keep_alive=None, num_ctx=None, **options: ollama_warmup(client, model, keep_alive, num_ctx),
+    awarmup=lambda client, model, connections=1, keep_alive=None, num_ctx=None, **options: ollama_awarmup(client, model, keep_alive, num_ctx),
+)
@@ -0,0 +1,215 @@
+import asyncio
+import os
+from dataclasses import replace
+from functools import wraps
+from typing import TYPE_CHECKING, Literal
+
+import httpx
+import openai
+from openai import OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient
+from openai.types.chat import ChatCompletion
+
+from .cassette import aplay, play
+from .deadline import apply_deadline, async_apply_deadline, remaining
+from .grammar import grammar_body
+from .providers import ProviderFunctions
+from .transport import AsyncRawChatClient, RawChatClient
+from .types import RuntimeOptions, empty_runtime_options
+from .utils import logger
+
+if TYPE_CHECKING:
+    from .llm_func import LLMFunc
+
+
+def openai_max_retry(func, retry_times=3):
+    @wraps(func)
+    def new_func(*args, **kwargs):
+        current_retries = 0
+        while current_retries < retry_times:
+            try:
+                result = func(*args, **kwargs)
+                return result
+            except openai.APIConnectionError as e:
+                current_retries += 1
+                if current_retries >= retry_times:
+                    raise e
+                remaining()  # No retry past the call deadline
+                logger.warning(
+                    f"Connect error for {func.__name__}, retry {current_retries} times"
+                )
+            except Exception as e:
+                raise e
+
+    return new_func
+
+
+def async_openai_max_retry(func, retry_times=3):
+    @wraps(func)
+    async def new_func(*args, **kwargs):
+        current_retries = 0
+        while current_retries < retry_times:
+            try:
+                result = await func(*args, **kwargs)
+                return result
+            except openai.APIConnectionError as e:
+                current_retries += 1
+                if current_retries >= retry_times:
+                    raise e
+                remaining()  # No retry past the call deadline
+                logger.warning(
+                    f"Connect error for {func.__name__}, retry {current_retries} times"
+                )
+            except Exception as e:
+                raise e
+
+    return new_func
+
+
+def openai_chat_payload(
+    query,
+    model="gpt-3.5-turbo-1106",
+    temperature=0.1,
+    function_messages=[],
+    runtime_options: RuntimeOptions = empty_runtime_options(),
+    json_mode: bool = True,
+    grammar: Literal["llama.cpp", "vllm"] | None = None,
+) -> dict:
+    """The keyword arguments `openai_single_create` and `openai_single_acreate` send to `chat.completions.create`"""
+    payload = dict(
+        model=model,
+        messages=[{"role": "user", "content": query}] + function_messages,
+        temperature=temperature,
+        # This is the same type as list[ChatCompletionToolParams] but since we user our own types instead of openai's, we need to ignore this
+        tools=runtime_options["tools"],
+        tool_choice=runtime_options["tool_choice"],
+    )
+    if runtime_options.get("top_logprobs"):
+        # A classification answered by its first token, read from the logprobs rather than from JSON
+        payload["logprobs"] = True
+        payload["top_logprobs"] = runtime_options["top_logprobs"]
+    elif grammar is not None and not runtime_options["tools"]:
+        # The server decodes only JSON valid against the output schema, a grammar is not sent along with a response format
+        payload["extra_body"] = grammar_body(grammar, runtime_options["output_schema"])
+    elif json_mode:
+        payload["response_format"] = {"type": "json_object"}
+    if runtime_options.get("max_tokens") is not None:
+        payload["max_tokens"] = runtime_options["max_tokens"]
+    if runtime_options.get("stop"):
+        payload["stop"] = runtime_options["stop"]
+    if runtime_options.get("n", 1) > 1:
+        payload["n"] = runtime_options["n"]  # The samples share one prompt evaluation
+    return payload
+
+
+def _within_deadline(client):
+    """Under a call deadline, the SDK doesn't retry (its backoff ignores the deadline), our retry loop does until the deadline"""
+    if isinstance(client, (OpenAI, AsyncOpenAI)) and remaining() is not None:
+        return client.with_options(max_retries=0)
+    return client
+
+
+@openai_max_retry
+def openai_single_create(
+    query,
+    client: OpenAI,
+    model="gpt-3.5-turbo-1106",
+    temperature=0.1,
+    function_messages=[],
+    runtime_options: RuntimeOptions = empty_runtime_options(),
+    json_mode: bool = True,
+    grammar: Literal["llama.cpp", "vllm"] | None = None,
+) -> ChatCompletion:
+    payload = openai_chat_payload(query, model, temperature, function_messages, runtime_options, json_mode, grammar)
+    response = play("openai", payload, ChatCompletion, lambda: _within_deadline(client).chat.completions.create(**payload))
+    return response
+
+
+@async_openai_max_retry
+async def openai_single_acreate(
+    query,
+    client: AsyncOpenAI,
+    model="gpt-3.5-turbo-1106",
+    temperature=0.1,
+    function_messages=[],
+    runtime_options: RuntimeOptions = empty_runtime_options(),
+    json_mode: bool = True,
+    grammar: Literal["llama.cpp", "vllm"] | None = None,
+) -> ChatCompletion:
+    payload = openai_chat_payload(query, model, temperature, function_messages, runtime_options, json_mode, grammar)
+    response = await aplay("openai", payload, ChatCompletion, lambda: _within_deadline(client).chat.completions.create(**payload))
+    return response
+
+
+def openai_warmup(client: OpenAI, model="gpt-3.5-turbo-1106"):
+    """Resolves DNS and opens a pooled TLS connection to the endpoint with a cheap request"""
+    try:
+        client.models.retrieve(model)
+    except openai.APIStatusError as e:
+        # Some OpenAI compatible endpoints don't serve /models, the connection is open all the same
+        logger.debug(f"Warmup request for {model} returned {e.status_code}")
+
+
+async def openai_awarmup(client: AsyncOpenAI, model="gpt-3.5-turbo-1106", connections=1):
+    """Opens `connections` pooled connections of the async client at once"""
+
+    async def warm_one():
+        try:
+            await client.models.retrieve(model)
+        except openai.APIStatusError as e:
+            logger.debug(f"Warmup request for {model} returned {e.status_code}")
+
+    await asyncio.gather(*[warm_one() for _ in range(connections)])
+
+
+def openai_clients(llm_func: "LLMFunc") -> tuple[OpenAI | RawChatClient, AsyncOpenAI | AsyncRawChatClient]:
+    """The clients of an OpenAI compatible endpoint, with the transport of the LLMFunc"""
+    if llm_func.openai_api_key is None:
+        logger.warning("OpenAI api key is not set, will try to use OPENAI_API_KEY env variable instead")
+        llm_func.openai_api_key = os.getenv("OPENAI_API_KEY", "")
+
+    # assert self.openai_api_key != "", "You must have OpenAI api key input, or set OPENAI_API_KEY in your environment."
+
+    api_key, base_url = llm_func.openai_api_key, llm_func.openai_base_url
+    if llm_func.transport == "sdk":
+        # Every request is bounded by the deadline of the call that sends it
+        http_client = DefaultHttpxClient(event_hooks={"request": [apply_deadline]})
+        client: OpenAI | RawChatClient = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+    else:
+        client = RawChatClient(api_key, base_url, event_hooks={"request": [apply_deadline]})
+
+    event_hooks: dict[str, list] = {"request": [async_apply_deadline], "response": []}
+    if llm_func.scheduler is not None and llm_func.scheduler.adaptive is not None:
+        # The response headers and the 429s retried inside the SDK never reach us, see them at the HTTP level
+        scheduler = llm_func.scheduler
+
+        async def observe(response: httpx.Response):
+            scheduler.observe(response.status_code, response.headers)
+
+        event_hooks["response"].append(observe)
+    if llm_func.transport == "sdk":
+        async_http_client = DefaultAsyncHttpxClient(event_hooks=event_hooks)
+        async_client: AsyncOpenAI | AsyncRawChatClient = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=async_http_client)
+    else:
+        async_client = AsyncRawChatClient(api_key, base_url, event_hooks=event_hooks)
+    return client, async_client
+
+
+def openai_compatible_clients(llm_func: "LLMFunc") -> tuple[OpenAI | RawChatClient, AsyncOpenAI | AsyncRawChatClient]:
+    """The clients of a local OpenAI compatible server (vLLM, llama.cpp...), which usually doesn't check the api key"""
+    if llm_func.openai_base_url is None and os.getenv("OPENAI_BASE_URL") is None:
+        raise ValueError("The openai_compatible provider needs the openai_base_url of the server, e.g. http://localhost:8000/v1")
+    if llm_func.openai_api_key is None:
+        llm_func.openai_api_key = os.getenv("OPENAI_API_KEY") or "EMPTY"
+    return openai_clients(llm_func)
+
+
+OPENAI_FUNCTIONS = ProviderFunctions(
+    create=openai_single_create,
+    acreate=openai_single_acreate,
+    payload=openai_chat_payload,
+    clients=openai_clients,
+    warmup=lambda client, model, **options: openai_warmup(client, model),
+    awarmup=lambda client, model, connections=1, **options: openai_awarmup(client, model, connections),
+)
+
+OPENAI_COMPATIBLE_FUNCTIONS = replace(OPENAI_FUNCTIONS, clients=openai_compatible_clients)
@@ -0,0 +1,248 @@
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Callable, Literal
+
+from .usage import Usage
+
+
+@dataclass
+class CallNode:
+    """
+    One node of the call tree: a decorated call, a tool run or a provider request. The times are time.perf_counter() seconds,
+    the queue time, usage and tool calls are the node's own, see `inclusive` for its subtree.
+
+    """
+
+    name: str
+    kind: Literal["call", "tool", "request"]
+    start: float
+    end: float | None = None
+    queue_seconds: float = 0.0  # Waiting for a scheduler slot
+    usage: Usage = field(default_factory=Usage)
+    tool_calls: int = 0
+    error: str | None = None
+    children: list["CallNode"] = field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    @property
+    def self_time(self) -> float:
+        """The wall time not spent in the children, concurrent children can cover all of it"""
+        return max(0.0, self.duration - sum(child.duration for child in self.children))
+
+    def inclusive(self) -> tuple[Usage, float, int]:
+        """The usage, queue time and tool calls of the node and its whole subtree"""
+        usage, queue_seconds, tool_calls = Usage(), self.queue_seconds, self.tool_calls
+        usage.add(self.usage)
+        for child in self.children:
+            child_usage, child_queue, child_tools = child.inclusive()
+            usage.add(child_usage)
+            queue_seconds += child_queue
+            tool_calls += child_tools
+        return usage, queue_seconds, tool_calls
+
+
+class Profiler:
+    """
+    Records the tree of the decorated calls made in a `profile` context: nested calls, even in other asyncio tasks or in
+    the tools' threads, are children of the call that made them. Export it with `chrome_trace` (chrome://tracing, Perfetto)
+    or `collapsed` (flamegraph.pl, speedscope).
+
+    """
+
+    def __init__(self) -> None:
+        self.roots: list[CallNode] = []
+        self._lock = threading.Lock()
+
+    def _add(self, node: CallNode, parent: CallNode | None):
+        with self._lock:
+            (parent.children if parent is not None else self.roots).append(node)
+            if parent is not None and node.kind == "tool":
+                parent.tool_calls += 1
+
+    def _record(self, node: CallNode, usage: Usage | None = None, queue_seconds: float = 0.0):
+        with self._lock:
+            if usage is not None:
+                node.usage.add(usage)
+            node.queue_seconds += queue_seconds
+
+    def nodes(self) -> list[CallNode]:
+        """Every node, parents before their children"""
+        result, stack = [], list(reversed(self.roots))
+        while stack:
+            node = stack.pop()
+            result.append(node)
+            stack.extend(reversed(node.children))
+        return result
+
+    def _lanes(self) -> dict[int, int]:
+        """
+        A track (Chrome trace thread) for every node, so the events of a track are properly nested: concurrent siblings
+        go to different tracks, a node stays on its parent's track when it can.
+
+        """
+        parents = {id(child): node for node in self.nodes() for child in node.children}
+        lanes: list[list[CallNode]] = []  # The open nodes of every track
+        assigned: dict[int, int] = {}
+        for node in sorted(self.nodes(), key=lambda node: (node.start, -node.duration)):
+            parent = parents.get(id(node))
+            candidates = ([assigned[id(parent)]] if parent is not None else []) + list(range(len(lanes)))
+            for lane in candidates:
+                stack = lanes[lane]
+                while stack and stack[-1].start + stack[-1].duration <= node.start:
+                    stack.pop()
+                if not stack or stack[-1].start + stack[-1].duration >= node.start + node.duration:
+                    break
+            else:
+                lanes.append([])
+                lane = len(lanes) - 1
+            lanes[lane].append(node)
+            assigned[id(node)] = lane
+        return assigned
+
+    def chrome_trace(self) -> dict:
+        """The call tree in the Chrome trace event format, one complete ("X") event per node, in microseconds"""
+        nodes = self.nodes()
+        origin = min((node.start for node in nodes), default=0.0)
+        lanes = self._lanes()
+        events = []
+        for node in nodes:
+            usage, queue_seconds, tool_calls = node.inclusive()
+            args = {
+                "queue_seconds": queue_seconds,
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "cached_tokens": usage.cached_tokens,
+                "cost": usage.cost,
+                "tool_calls": tool_calls,
+            }
+            if node.error is not None:
+                args["error"] = node.error
+            events.append(
+                {
+                    "name": node.name,
+                    "cat": node.kind,
+                    "ph": "X",
+                    "ts": (node.start - origin) * 1e6,
+                    "dur": node.duration * 1e6,
+                    "pid": os.getpid(),
+                    "tid": lanes[id(node)],
+                    "args": args,
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def collapsed(self, metric: Literal["wall", "tokens", "cost"] = "wall") -> str:
+        """
+        The call tree as collapsed stacks ("research;ask_question;research 1234" per line), weighted by the self wall time
+        (microseconds), the own tokens or the own cost (micro-USD) of each node. Identical stacks are merged.
+
+        """
+        weights: dict[str, int] = {}
+
+        def walk(node: CallNode, prefix: str):
+            stack = f"{prefix};{node.name}" if prefix else node.name
+            if metric == "wall":
+                weight = node.self_time * 1e6
+            elif metric == "tokens":
+                weight = node.usage.total_tokens
+            else:
+                weight = node.usage.cost * 1e6
+            weights[stack] = weights.get(stack, 0) + round(weight)
+            for child in node.children:
+                walk(child, stack)
+
+        for root in self.roots:
+            walk(root, "")
+        return "\n".join(f"{stack} {weight}" for stack, weight in weights.items() if weight > 0)
+
+
+# The profiler recording the calls of the current context, and the node being run
+_profiler: ContextVar[Profiler | None] = ContextVar("llm_as_function_profiler", default=None)
+_current_node: ContextVar[CallNode | None] = ContextVar("llm_as_function_current_node", default=None)
+
+
+@contextmanager
+def profile(profiler: Profiler | None = None):
+    """
+    Profiles the decorated calls made in this context:
+
+    ```
+    with profile() as profiler:
+        research(topic="...")
+    profiler.write_chrome_trace("trace.json")
+    ```
+
+    """
+    profiler = profiler or Profiler()
+    token = _profiler.set(profiler)
+    node_token = _current_node.set(None)
+    try:
+        yield profiler
+    finally:
+        _current_node.reset(node_token)
+        _profiler.reset(token)
+
+
+@contextmanager
+def span(name: str, kind: Literal["call", "tool", "request"] = "call"):
+    """A node of the call tree for the code run in this context, a no-op when not profiling"""
+    profiler = _profiler.get()
+    if profiler is None:
+        yield
+        return
+
+    node = CallNode(name=name, kind=kind, start=time.perf_counter())
+    profiler._add(node, _current_node.get())
+    token = _current_node.set(node)
+    try:
+        yield
+    except BaseException as e:
+        node.error = type(e).__name__
+        raise
+    finally:
+        node.end = time.perf_counter()
+        _current_node.reset(token)
+
+
+def profiled(name: str, kind: Literal["call", "tool", "request"] = "call"):
+    """Runs every call of the decorated function (sync or async) in a `span`"""
+
+    def decorator(fn: Callable):
+        if inspect.iscoroutinefunction(fn):
+
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, kind):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, kind):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_node(usage: Usage | None = None, queue_seconds: float = 0.0):
+    """Adds the usage or queue time of a request to the node being run, a no-op when not profiling"""
+    profiler, node = _profiler.get(), _current_node.get()
+    if profiler is not None and node is not None:
+        profiler._record(node, usage, queue_seconds)
@@ -0,0 +1,116 @@
+import threading
+from dataclasses import dataclass
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Literal
+
+if TYPE_CHECKING:
+    from .llm_func import LLMFunc
+
+
+@dataclass(frozen=True)
+class ProviderFunctions:
+    """
+    What a provider runs, loaded on its first use. Every function takes the provider's request options as keyword
+    arguments, see `Provider.request_options`.
+
+        * create(query, client, model, temperature, function_messages, runtime_options, **options) -> response
+        * acreate: the async create, awaited
+        * payload(query, model, temperature, function_messages, runtime_options, **options) -> the request (dry runs)
+        * clients(llm_func) -> (client, async_client), made when an LLMFunc is created
+        * warmup(client, model, **options) and awarmup(async_client, model, connections, **options)
+
+    The responses are read like the provider's api ("openai": a `ChatCompletion` with one choice per sample,
+    "ollama": an `ollama.ChatResponse`).
+
+    """
+
+    create: Callable[..., Any]
+    acreate: Callable[..., Awaitable[Any]]
+    payload: Callable[..., dict]
+    clients: Callable[["LLMFunc"], tuple[Any, Any]]
+    warmup: Callable[..., Any]
+    awarmup: Callable[..., Awaitable[Any]]
+
+
+@dataclass(frozen=True)
+class Provider:
+    """
+    A model provider: how an LLMFunc reaches its models.
+
+    api is the format of its requests and responses. functions is a `ProviderFunctions` or "module:attribute", imported
+    on first use so the provider's SDK is only loaded when an LLMFunc uses it. A model whose name starts with one of
+    model_prefixes gets the provider without naming it. options are the LLMFunc fields passed to its functions.
+
+    The capability flags: supports_tools (function calling), supports_n (the samples of `LLMFunc.samples` in one
+    request, otherwise sent as concurrent requests) and supports_json_mode (openai api, sends response_format json_object).
+
+    """
+
+    name: str
+    api: Literal["openai", "ollama"]
+    functions: ProviderFunctions | str
+    model_prefixes: tuple[str, ...] = ()
+    options: tuple[str, ...] = ()
+    supports_tools: bool = True
+    supports_n: bool = True
+    supports_json_mode: bool = True
+
+    def __post_init__(self):
+        assert self.api in ["openai", "ollama"], f"Provider api must in ['openai', 'ollama'], not {self.api}"
+
+    def load(self) -> ProviderFunctions:
+        if isinstance(self.functions, ProviderFunctions):
+            return self.functions
+        with _load_lock:
+            if self.name not in _loaded:
+                module, attribute = self.functions.split(":")
+                _loaded[self.name] = getattr(import_module(module), attribute)
+        return _loaded[self.name]
+
+    def request_options(self, llm_func: "LLMFunc") -> dict[str, Any]:
+        """The keyword arguments of the provider's functions for the requests of an LLMFunc"""
+        options = {name: getattr(llm_func, name) for name in self.options}
+        if self.api == "openai":
+            options["json_mode"] = self.supports_json_mode
+        return options
+
+
+PROVIDERS: dict[str, Provider] = {}
+_loaded: dict[str, ProviderFunctions] = {}
+_load_lock = threading.Lock()
+
+
+def register_provider(provider: Provider):
+    """Registers (or replaces) a provider, LLMFunc(provider=name) then uses it"""
+    PROVIDERS[provider.name] = provider
+    _loaded.pop(provider.name, None)
+
+
+def get_provider(name: str) -> Provider:
+    if name not in PROVIDERS:
+        raise ValueError(f"Provider must in {sorted(PROVIDERS)}, not {name}, see `register_provider`")
+    return PROVIDERS[name]
+
+
+def model_factory(model_name: str) -> str:
+    """The provider of a model from its name, for the LLMFuncs that don't name their provider"""
+    for provider in PROVIDERS.values():
+        if any(model_name.startswith(prefix) for prefix in provider.model_prefixes):
+            return provider.name
+    raise NotImplementedError(f"No provider serves {model_name} by its name, set LLMFunc(provider=...) e.g. 'openai_compatible' for vLLM or llama.cpp servers")
+
+
+register_provider(Provider("openai", "openai", "llm_as_function.openai_provider:OPENAI_FUNCTIONS", model_prefixes=("gpt",)))
+register_provider(
+    Provider(
+        "ollama",
+        "ollama",
+        "llm_as_function.ollama_provider:OLLAMA_FUNCTIONS",
+        model_prefixes=("llama", "krtkygpta/qwq", "qwen"),
+        options=("keep_alive", "stop_at_json", "num_ctx"),
+        supports_n=False,
+    )
+)
+# Any server with an OpenAI compatible /v1/chat/completions (vLLM, llama.cpp, SGLang, LM Studio...) at openai_base_url.
+# Not all of them take `n`, the samples are sent as concurrent requests. LLMFunc(grammar=...) constrains their decoding.
+register_provider(Provider("openai_compatible", "openai", "llm_as_function.openai_provider:OPENAI_COMPATIBLE_FUNCTIONS", options=("grammar",), supports_n=False))
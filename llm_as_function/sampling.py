@@ -0,0 +1,70 @@
+import json
+from collections import Counter
+from typing import TYPE_CHECKING, Callable, Literal
+
+from pydantic import BaseModel, ValidationError
+
+from .errors import InvalidLLMResponse
+
+if TYPE_CHECKING:
+    from .llm_func import Final
+
+# Aggregates the parsed samples of one call (in choice order) into the call result
+Reducer = Callable[[list["Final"], type[BaseModel]], "Final"]
+
+
+def _valid(finals: list["Final"]) -> list["Final"]:
+    """The samples parsed to the output schema, the reducers fall back to the first raw sample (accept_raw mode) when there is none"""
+    if not finals:
+        raise InvalidLLMResponse("No sample could be parsed")
+    return [final for final in finals if final.ok()]
+
+
+def first_valid(finals: list["Final"], output_schema: type[BaseModel]) -> "Final":
+    """The first sample that parsed to the output schema"""
+    valid = _valid(finals)
+    return valid[0] if valid else finals[0]
+
+
+def majority(finals: list["Final"], output_schema: type[BaseModel]) -> "Final":
+    """The most common value of every field over the valid samples, ties go to the earliest sample"""
+    from .llm_func import Final
+
+    valid = _valid(finals)
+    if not valid:
+        return finals[0]
+
+    votes: dict[str, Counter] = {}
+    values: dict[tuple[str, str], object] = {}
+    for final in valid:
+        for key, value in final.pack.items():  # type: ignore
+            canonical = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+            votes.setdefault(key, Counter())[canonical] += 1
+            values.setdefault((key, canonical), value)
+
+    pack = {key: values[(key, counter.most_common(1)[0][0])] for key, counter in votes.items()}
+    try:
+        # Fields voted independently may break a validator across fields
+        return Final(output_schema(**pack).model_dump())
+    except ValidationError:
+        return valid[0]
+
+
+def all_samples(finals: list["Final"], output_schema: type[BaseModel]) -> "Final":
+    """Every valid sample, as {"samples": [...]}"""
+    from .llm_func import Final
+
+    valid = _valid(finals)
+    if not valid:
+        return finals[0]
+    return Final({"samples": [final.pack for final in valid]})
+
+
+REDUCERS: dict[str, Reducer] = {"majority": majority, "first_valid": first_valid, "all": all_samples}
+
+
+def get_reducer(reducer: Literal["majority", "first_valid", "all"] | Reducer) -> Reducer:
+    if callable(reducer):
+        return reducer
+    assert reducer in REDUCERS, f"Reducer must in {list(REDUCERS)}, not {reducer}"
+    return REDUCERS[reducer]
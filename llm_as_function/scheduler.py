@@ -0,0 +1,247 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Mapping
+
+from .errors import LoadShedError
+from .metrics import metrics
+from .profiler import record_node
+
+DEFAULT_PRIORITIES = ("interactive", "default", "batch")
+
+# The (priority, max_queue_wait) of the calls made in the current context, see `call_priority`
+_call_priority: ContextVar[tuple[str, float | None] | None] = ContextVar("llm_as_function_call_priority", default=None)
+
+
+@contextmanager
+def call_priority(priority: str, max_queue_wait: float | None = None):
+    """
+    Sets the priority class (and optionally the load shedding deadline) of every call made in this context,
+    including the tasks it spawns, over the `schedule` of the decorated functions.
+
+    ```
+    with call_priority("batch"):
+        await asyncio.gather(*[classify(text=text) for text in corpus])
+    ```
+
+    """
+    token = _call_priority.set((priority, max_queue_wait))
+    try:
+        yield
+    finally:
+        _call_priority.reset(token)
+
+
+@dataclass(frozen=True)
+class SchedulePolicy:
+    """
+    How the requests of a decorated function are scheduled by its LLMFunc's `Scheduler`.
+
+    priority is the class of the requests, weight the share of the slots the function gets among the functions
+    queued in the same class, and max_queue_wait (seconds) the longest a request may wait for a slot before it fails.
+
+    """
+
+    priority: str = "default"
+    weight: float = 1.0
+    max_queue_wait: float | None = None
+
+    def __post_init__(self):
+        assert self.weight > 0, f"The schedule weight must be positive, not {self.weight}"
+
+
+@dataclass(frozen=True)
+class AdaptiveLimit:
+    """
+    Adjusts the scheduler's concurrency limit at runtime (AIMD), between min_size and max_size.
+
+    While requests queue up for slots, the limit grows by `increase` per limit's worth of successful requests.
+    It is multiplied by `decrease` on a rate limit error (429), and by `latency_decrease` when the latency of a request
+    goes over latency_tolerance times the best latency seen (the provider is saturated). It never goes over the
+    `x-ratelimit-remaining-requests` the provider reports. The limit decreases at most once per request duration.
+
+    """
+
+    min_size: int = 1
+    max_size: int = 64
+    increase: float = 1.0
+    decrease: float = 0.5
+    latency_tolerance: float | None = 2.0
+    latency_decrease: float = 0.9
+
+
+@dataclass(order=True)
+class _Waiter:
+    rank: int
+    finish: float
+    sequence: int
+    start: float = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class Scheduler:
+    """
+    Bounds the concurrent requests to max_size, and decides which queued request gets the next free slot.
+    With adaptive, max_size is only the initial limit, see `AdaptiveLimit`.
+
+    Priority classes are served strictly in order (the first class of priorities first). Within a class, the functions
+    share the slots by weighted fair queuing, so a function flooding the queue doesn't starve the others.
+
+    A request whose estimated queue wait is over its max_queue_wait fails at once with `LoadShedError`, and one that
+    waited max_queue_wait without a slot fails then, instead of piling up behind the queue.
+
+    """
+
+    def __init__(
+        self,
+        max_size: int = 8,
+        priorities: tuple[str, ...] = DEFAULT_PRIORITIES,
+        max_queue_wait: float | None = None,
+        adaptive: AdaptiveLimit | None = None,
+        name: str = "default",
+    ) -> None:
+        self.limit = float(max_size)
+        self.adaptive = adaptive
+        self.name = name
+        self.priorities = priorities
+        self.max_queue_wait = max_queue_wait
+        self.active = 0
+        self._queue: list[_Waiter] = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._finish: dict[str, float] = {}
+        self._service_time: float | None = None  # Moving average of how long a request holds its slot
+        self._best_latency: float | None = None
+        self._last_decrease = 0.0
+        self._set_limit(self.limit)
+
+    @property
+    def max_size(self) -> int:
+        """The current concurrency limit"""
+        return max(1, int(self.limit))
+
+    def _set_limit(self, limit: float):
+        if self.adaptive is not None:
+            limit = min(max(limit, self.adaptive.min_size), self.adaptive.max_size)
+        self.limit = limit
+        metrics.set("llm_concurrency_limit", self.max_size, scheduler=self.name)
+        self._dispatch()
+
+    def _decrease(self, factor: float):
+        now = time.monotonic()
+        if now - self._last_decrease < (self._service_time or 1.0):
+            return  # The requests in flight were sent before the last decrease
+        self._last_decrease = now
+        self._set_limit(self.limit * factor)
+
+    def on_success(self, latency: float):
+        """Feeds the latency of a successful request to the adaptive limit"""
+        if self.adaptive is None:
+            return
+        self._best_latency = latency if self._best_latency is None else min(self._best_latency, latency)
+        if self.adaptive.latency_tolerance is not None and latency > self.adaptive.latency_tolerance * self._best_latency:
+            self._decrease(self.adaptive.latency_decrease)
+        elif self.queued:
+            # Only grow when the limit is what holds the requests back
+            self._set_limit(self.limit + self.adaptive.increase / self.limit)
+
+    def observe(self, status_code: int, headers: Mapping[str, str]):
+        """Feeds a provider response (e.g. from an httpx event hook) to the adaptive limit: 429s and the remaining rate limit"""
+        if self.adaptive is None:
+            return
+        if status_code == 429:
+            metrics.inc("llm_rate_limited", scheduler=self.name)
+            self._decrease(self.adaptive.decrease)
+            return
+        remaining = headers.get("x-ratelimit-remaining-requests")
+        if remaining is not None and remaining.isdigit() and int(remaining) < self.limit:
+            self._set_limit(max(int(remaining), self.adaptive.min_size))
+
+    def _rank(self, priority: str) -> int:
+        if priority not in self.priorities:
+            raise ValueError(f"Priority must in {list(self.priorities)}, not {priority}")
+        return self.priorities.index(priority)
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for waiter in self._queue if not waiter.future.done())
+
+    def estimated_wait(self, rank: int, finish: float) -> float:
+        """Seconds until a request with this rank and finish tag would get a slot, from the requests queued before it"""
+        ahead = sum(1 for waiter in self._queue if not waiter.future.done() and (waiter.rank, waiter.finish) < (rank, finish))
+        busy = self.active + ahead - self.max_size + 1
+        if busy <= 0 or self._service_time is None:
+            return 0.0
+        return busy * self._service_time / self.max_size
+
+    async def acquire(self, flow: str = "default", priority: str = "default", weight: float = 1.0, max_queue_wait: float | None = None):
+        rank = self._rank(priority)
+        start = max(self._virtual_time, self._finish.get(flow, 0.0))
+        finish = start + 1 / weight
+        max_queue_wait = self.max_queue_wait if max_queue_wait is None else max_queue_wait
+
+        if self.active < self.max_size:
+            self.active += 1
+            self._finish[flow] = finish
+            return
+
+        if max_queue_wait is not None and self.estimated_wait(rank, finish) > max_queue_wait:
+            metrics.inc("llm_load_shed", function=flow, priority=priority)
+            raise LoadShedError(f"{flow} would wait over {max_queue_wait}s for a slot")
+
+        self._finish[flow] = finish
+        waiter = _Waiter(rank, finish, next(self._sequence), start, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, waiter)
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter.future, max_queue_wait)
+        except BaseException as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # The slot was given just as the wait ended, give it back
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                metrics.inc("llm_load_shed", function=flow, priority=priority)
+                raise LoadShedError(f"{flow} waited {max_queue_wait}s without a slot") from None
+            raise
+        finally:
+            queue_seconds = time.monotonic() - queued_at
+            metrics.inc("llm_queue_wait_seconds", queue_seconds, function=flow, priority=priority)
+            record_node(queue_seconds=queue_seconds)
+
+    def release(self, service_time: float | None = None):
+        if service_time is not None:
+            self._service_time = service_time if self._service_time is None else 0.8 * self._service_time + 0.2 * service_time
+        self.active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.active < self.max_size and self._queue:
+            waiter = heapq.heappop(self._queue)
+            if waiter.future.done():
+                continue  # Timed out or cancelled
+            self.active += 1
+            self._virtual_time = max(self._virtual_time, waiter.start)
+            waiter.future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, flow: str = "default", priority: str = "default", weight: float = 1.0, max_queue_wait: float | None = None):
+        """Holds a slot for one request"""
+        await self.acquire(flow, priority, weight, max_queue_wait)
+        started = time.monotonic()
+        latency = None
+        try:
+            yield
+            latency = time.monotonic() - started
+        except Exception as e:
+            if getattr(e, "status_code", None) == 429:
+                self.observe(429, {})
+            raise
+        finally:
+            # Also released when the request is cancelled (e.g. at the call deadline), CancelledError isn't an Exception
+            self.release(latency)
+        if latency is not None:
+            self.on_success(latency)
@@ -0,0 +1,278 @@
+import json
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Callable
+
+Tokenizer = Callable[[str], int]
+
+# OpenAI's chat format wraps every message with a few control tokens, and primes the reply with a few more
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_OVERHEAD_TOKENS = 3
+
+# Guesses used when the output schema doesn't bound a value
+DEFAULT_STRING_TOKENS = 16
+DEFAULT_ARRAY_ITEMS = 3
+
+# Plausible upper bounds used when the output schema doesn't bound a value, see `max_schema_tokens`
+MAX_STRING_TOKENS = 256
+MAX_ARRAY_ITEMS = 16
+# Models often pretty print their JSON, and sometimes add a sentence around it
+MAX_TOKENS_MARGIN = 1.5
+MAX_TOKENS_SLACK = 32
+
+_WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def approx_token_count(text: str) -> int:
+    """
+    Fast local approximation of the number of tokens in a text, no tokenizer needed.
+
+    Latin words are counted as one token per 4 characters (at least one), punctuation as one token each
+    and non-ascii words (e.g. CJK) as one token per character.
+
+    """
+    if not text:
+        return 0
+
+    count = 0
+    for match in _WORD_PATTERN.finditer(text):
+        piece = match.group(0)
+        if piece.isascii():
+            count += math.ceil(len(piece) / 4)
+        else:
+            count += len(piece)
+    return count
+
+
+def tiktoken_tokenizer(model: str = "gpt-3.5-turbo") -> Tokenizer:
+    """
+    Returns an exact tokenizer for OpenAI models, backed by `tiktoken` (optional dependency).
+
+    """
+    try:
+        import tiktoken
+    except ImportError as e:
+        raise ImportError("tiktoken is required for exact token counting, install it with `pip install tiktoken`") from e
+
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count(text: str) -> int:
+        return len(encoding.encode(text, disallowed_special=()))
+
+    return count
+
+
+def _content_to_text(content) -> str:
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+    return json.dumps(content, ensure_ascii=False, default=str)
+
+
+def count_message_tokens(messages: list, tokenizer: Tokenizer = approx_token_count) -> int:
+    """Estimates the prompt tokens of a list of chat messages (dicts or provider message objects)"""
+    total = REPLY_OVERHEAD_TOKENS
+    for message in messages:
+        if not isinstance(message, dict):
+            message = message.model_dump(exclude_none=True)
+        total += MESSAGE_OVERHEAD_TOKENS
+        for value in message.values():
+            total += tokenizer(_content_to_text(value))
+    return total
+
+
+def count_payload_tokens(payload: dict, tokenizer: Tokenizer = approx_token_count) -> int:
+    """
+    Estimates the prompt tokens of a rendered provider payload, i.e. the output of
+    `openai_chat_payload` or `ollama_chat_payload`.
+
+    The tool specs are injected into the prompt by the providers, so they are counted as well.
+
+    """
+    total = count_message_tokens(payload["messages"], tokenizer)
+    if payload.get("tools"):
+        total += tokenizer(json.dumps(payload["tools"], ensure_ascii=False))
+    return total
+
+
+def estimate_schema_tokens(schema: dict, tokenizer: Tokenizer = approx_token_count) -> int:
+    """
+    Estimates the number of tokens of a JSON value that follows the given JSON schema.
+
+    Bounded values (`maxLength`, `enum`, `const`, `maxItems`...) are used when available, otherwise
+    `DEFAULT_STRING_TOKENS` and `DEFAULT_ARRAY_ITEMS` are used as a guess.
+
+    """
+    return _schema_tokens(schema, tokenizer, False, schema.get("$defs", {}), frozenset())
+
+
+def max_schema_tokens(schema: dict, tokenizer: Tokenizer = approx_token_count) -> int:
+    """
+    The maximum plausible number of tokens a model needs to answer with the given JSON schema, used as a
+    generation cap. Unbounded strings and arrays are capped by `MAX_STRING_TOKENS` and `MAX_ARRAY_ITEMS`,
+    and so is the nesting of a recursive model by `MAX_STRING_TOKENS`, so tighten the schema (`max_length`,
+    `Literal`, `max_length` on lists...) to get a tighter cap.
+
+    """
+    tokens = _schema_tokens(schema, tokenizer, True, schema.get("$defs", {}), frozenset())
+    return math.ceil(tokens * MAX_TOKENS_MARGIN) + MAX_TOKENS_SLACK
+
+
+def _schema_tokens(schema: dict, tokenizer: Tokenizer, worst_case: bool, defs: dict, visiting: frozenset[str]) -> int:
+    """The tokens of a value of the schema, the refs are followed in `defs` except the ones being visited (recursive models)"""
+    if "$ref" in schema:
+        name = schema["$ref"].split("/")[-1]
+        if name in visiting:
+            # A recursive model ends its nesting with null (or an empty list), its plausible depth is bounded once
+            return 2 + (MAX_STRING_TOKENS if worst_case else 0)
+        return _schema_tokens(defs[name], tokenizer, worst_case, defs, visiting | {name})
+
+    if "const" in schema:
+        return tokenizer(json.dumps(schema["const"], ensure_ascii=False))
+    if "enum" in schema:
+        return max(tokenizer(json.dumps(value, ensure_ascii=False)) for value in schema["enum"])
+
+    options = schema.get("anyOf") or schema.get("oneOf")
+    if options:
+        return max(_schema_tokens(option, tokenizer, worst_case, defs, visiting) for option in options)
+
+    schema_type = schema.get("type", "string")
+    if isinstance(schema_type, list):
+        return max(_schema_tokens({**schema, "type": option}, tokenizer, worst_case, defs, visiting) for option in schema_type)
+
+    if schema_type == "object":
+        # braces, plus the quoted key, colon and comma of every property
+        total = 2
+        for key, value in schema.get("properties", {}).items():
+            total += tokenizer(key) + 3 + _schema_tokens(value, tokenizer, worst_case, defs, visiting)
+        return total
+
+    if schema_type == "array":
+        if worst_case:
+            items = schema.get("maxItems", max(MAX_ARRAY_ITEMS, schema.get("minItems", 0)))
+        else:
+            items = max(schema.get("minItems", 0), min(DEFAULT_ARRAY_ITEMS, schema.get("maxItems", DEFAULT_ARRAY_ITEMS)))
+        return 2 + items * (_schema_tokens(schema.get("items", {}), tokenizer, worst_case, defs, visiting) + 1)
+
+    if schema_type == "string":
+        if worst_case:
+            # Around 2 characters per token for the unusual texts, never less than what's needed for the common ones
+            tokens = math.ceil(schema["maxLength"] / 2) if "maxLength" in schema else MAX_STRING_TOKENS
+        else:
+            tokens = DEFAULT_STRING_TOKENS
+            if "maxLength" in schema:
+                tokens = min(tokens, math.ceil(schema["maxLength"] / 4))
+        return 2 + tokens
+
+    # number, integer, boolean and null
+    return 2
+
+
+def truncate_text(text: str, max_tokens: int, tokenizer: Tokenizer = approx_token_count) -> str:
+    """Returns the longest prefix of the text that fits in max_tokens"""
+    if tokenizer(text) <= max_tokens:
+        return text
+
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if tokenizer(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def truncate_kwargs(kwargs: dict, max_tokens: int, tokenizer: Tokenizer = approx_token_count) -> dict:
+    """
+    Truncates the string kwargs so that together they fit in max_tokens.
+
+    The longest values are cut first, short values that already fit their fair share are kept intact.
+
+    """
+    sizes = {key: tokenizer(value) for key, value in kwargs.items() if isinstance(value, str)}
+    if sum(sizes.values()) <= max_tokens:
+        return kwargs
+
+    truncated = dict(kwargs)
+    budget = max_tokens
+    remaining = sorted(sizes, key=lambda key: sizes[key])
+    while remaining:
+        share = budget // len(remaining)
+        key = remaining.pop(0)
+        if sizes[key] > share:
+            truncated[key] = truncate_text(kwargs[key], share, tokenizer)
+            budget -= share
+        else:
+            budget -= sizes[key]
+    return truncated
+
+
+@dataclass
+class DryRunReport:
+    """What a decorated function would send, without sending it. `payload` is None when the body returned a `Final`"""
+
+    provider: str
+    payload: dict | None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+def _percentile(values: list[int], percent: float) -> int:
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+@dataclass
+class DryRunStats:
+    """Aggregated statistics over many dry runs"""
+
+    reports: list[DryRunReport] = field(default_factory=list)
+
+    @property
+    def calls(self) -> int:
+        return len(self.reports)
+
+    @property
+    def requests(self) -> int:
+        return sum(1 for report in self.reports if report.payload is not None)
+
+    def _tokens(self, kind: str) -> list[int]:
+        return [getattr(report, kind) for report in self.reports if report.payload is not None]
+
+    def total(self, kind: str = "total_tokens") -> int:
+        return sum(self._tokens(kind))
+
+    def mean(self, kind: str = "total_tokens") -> float:
+        values = self._tokens(kind)
+        return sum(values) / len(values) if values else 0.0
+
+    def percentile(self, percent: float, kind: str = "total_tokens") -> int:
+        return _percentile(self._tokens(kind), percent)
+
+    def summary(self) -> dict:
+        return {
+            "calls": self.calls,
+            "requests": self.requests,
+            **{
+                kind: {
+                    "total": self.total(kind),
+                    "mean": self.mean(kind),
+                    "p50": self.percentile(50, kind),
+                    "p95": self.percentile(95, kind),
+                    "max": self.percentile(100, kind),
+                }
+                for kind in ["prompt_tokens", "completion_tokens", "total_tokens"]
+            },
+        }
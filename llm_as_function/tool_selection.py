@@ -0,0 +1,86 @@
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Sequence
+
+from .types import Tool
+
+# Scores every tool document against the query, one score per document (higher is more relevant)
+ToolScorer = Callable[[str, Sequence[str]], Sequence[float]]
+
+_TERM_PATTERN = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+|[^\W\d_A-Za-z]")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased terms, snake_case and camelCase names are split into words and CJK text into characters"""
+    return [term.lower() for term in _TERM_PATTERN.findall(text)]
+
+
+class BM25Index:
+    """A small Okapi BM25 index over a fixed set of documents"""
+
+    def __init__(self, documents: Sequence[str], k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._documents = [Counter(tokenize(document)) for document in documents]
+        self._lengths = [sum(terms.values()) for terms in self._documents]
+        self._average_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+
+        frequencies: Counter = Counter()
+        for terms in self._documents:
+            frequencies.update(terms.keys())
+        count = len(self._documents)
+        self._idf = {term: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5)) for term, frequency in frequencies.items()}
+
+    def scores(self, query: str) -> list[float]:
+        query_terms = set(tokenize(query))
+        result = []
+        for terms, length in zip(self._documents, self._lengths):
+            score = 0.0
+            for term in query_terms & terms.keys():
+                frequency = terms[term]
+                normalization = self.k1 * (1 - self.b + self.b * length / (self._average_length or 1))
+                score += self._idf[term] * frequency * (self.k1 + 1) / (frequency + normalization)
+            result.append(score)
+        return result
+
+
+@dataclass(frozen=True)
+class ToolSelector:
+    """
+    Sends only the top_k tools most relevant to the prompt, instead of every registered tool.
+
+    Tools are ranked by BM25 over their names and descriptions, or by the given scorer. The pinned tools
+    are always sent and don't count in top_k.
+
+    """
+
+    top_k: int
+    pinned: tuple[str, ...] = ()
+    scorer: ToolScorer | None = None
+
+    def index(self, tools: Sequence[tuple[str, str, Tool]]) -> "ToolIndex":
+        """Builds the index once for the (name, description, tool) of a decorated function"""
+        return ToolIndex(self, tuple(tools))
+
+
+class ToolIndex:
+    def __init__(self, selector: ToolSelector, tools: tuple[tuple[str, str, Tool], ...]) -> None:
+        self.selector = selector
+        self.tools = tools
+        self.documents = [f"{name} {description}" for name, description, _ in tools]
+        self._bm25 = BM25Index(self.documents) if selector.scorer is None else None
+
+    def scores(self, query: str) -> Sequence[float]:
+        if self._bm25 is not None:
+            return self._bm25.scores(query)
+        return self.selector.scorer(query, self.documents)  # type: ignore
+
+    def select(self, query: str) -> list[Tool]:
+        """The pinned tools and the top_k most relevant others, in registration order"""
+        pinned = {index for index, (name, _, _) in enumerate(self.tools) if name in self.selector.pinned}
+        scores = self.scores(query)
+        ranked = sorted((index for index in range(len(self.tools)) if index not in pinned), key=lambda index: (-scores[index], index))
+        chosen = pinned | set(ranked[: self.selector.top_k])
+        return [tool for index, (_, _, tool) in enumerate(self.tools) if index in chosen]
@@ -0,0 +1,192 @@
+import json
+import os
+from types import SimpleNamespace
+from typing import Any
+
+import httpx
+import openai
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # Optional, the stdlib json is used without it
+    orjson = None
+
+
+class WireDict(dict):
+    """
+    A JSON object of a raw response, its keys also readable as attributes like the SDK models (None when missing),
+    so a raw chat completion reads like a `ChatCompletion` where the tool loop, the usage and the cassette read it.
+
+    """
+
+    def __getattr__(self, name: str):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return self.get(name)
+
+    @classmethod
+    def wrap(cls, value):
+        if isinstance(value, dict):
+            return cls((key, cls.wrap(item)) for key, item in value.items())
+        if isinstance(value, list):
+            return [cls.wrap(item) for item in value]
+        return value
+
+    @classmethod
+    def model_validate(cls, value: dict) -> "WireDict":
+        return cls.wrap(value)
+
+    def model_dump(self, **kwargs) -> dict:
+        return json.loads(_dumps(self))
+
+
+def _jsonable(value: Any):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", exclude_none=True)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=_jsonable)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_jsonable).encode()
+
+
+def _loads(data: bytes):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+# The serialized payload without its messages, by its fields, see `encode_chat_body`
+_static_bodies: dict[tuple, tuple[Any, bytes]] = {}
+MAX_STATIC_BODIES = 256
+
+
+def encode_chat_body(payload: dict) -> bytes:
+    """
+    The request body of the payload of `openai_chat_payload`. Everything but the messages (the tools specs, the response
+    format...) is the same on every request of a function, it is serialized once and reused. The tools are keyed by
+    identity, they are the frozen tools of a function spec.
+
+    """
+    static = {key: value for key, value in payload.items() if key not in ["messages", "extra_body"]}
+    static.update(payload.get("extra_body") or {})  # The fields the SDK sends as they are, e.g. a grammar
+    key = tuple((name, tuple(map(id, value)) if name == "tools" else repr(value)) for name, value in static.items())
+    cached = _static_bodies.get(key)
+    if cached is None:
+        if len(_static_bodies) >= MAX_STATIC_BODIES:
+            _static_bodies.clear()
+        # The tools are kept with their body, so their ids can't be reused while the body is cached
+        cached = _static_bodies[key] = (static.get("tools"), _dumps(static))
+    return b'{"messages":' + _dumps(payload["messages"]) + b"," + cached[1][1:]
+
+
+def decode_chat_completion(data: bytes) -> WireDict:
+    """Reads the choices (content, tool calls, finish reason, logprobs) and the usage of a raw chat completion, nothing else"""
+    raw = _loads(data)
+    choices = []
+    for choice in raw.get("choices", []):
+        message = choice.get("message") or {}
+        # Only what the next turn of the tool loop sends back
+        lean = WireDict(role="assistant", content=message.get("content"))
+        if message.get("tool_calls"):
+            lean["tool_calls"] = WireDict.wrap(message["tool_calls"])
+        logprobs = WireDict.wrap(choice.get("logprobs"))
+        choices.append(WireDict(index=choice.get("index", 0), finish_reason=choice.get("finish_reason"), message=lean, logprobs=logprobs))
+    usage = raw.get("usage")
+    return WireDict(id=raw.get("id"), model=raw.get("model"), choices=choices, usage=WireDict.wrap(usage) if usage else None)
+
+
+def _raise_for_status(response: httpx.Response):
+    if response.status_code >= 400:
+        try:
+            body = _loads(response.content)
+        except ValueError:
+            body = None
+        error = body.get("error") if isinstance(body, dict) else None
+        message = error.get("message") if isinstance(error, dict) else response.text
+        raise openai.APIStatusError(f"Error code: {response.status_code} - {message}", response=response, body=error)  # type: ignore
+
+
+class _Transport:
+    def __init__(self, api_key: str | None, base_url: str | None) -> None:
+        self.base_url = (base_url or os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1").rstrip("/")
+        self.headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json", "Accept": "application/json"}
+        # Same interface as the SDK client for the create and warmup functions: client.chat.completions.create(**payload)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.models = SimpleNamespace(retrieve=self.retrieve_model)
+
+
+class RawChatClient(_Transport):
+    """
+    A lean OpenAI compatible chat completions client on a pooled httpx client, see `LLMFunc(transport="httpx")`:
+    no request or response models, the body is serialized with `encode_chat_body` and the response read with
+    `decode_chat_completion`. Connection errors and error statuses raise the SDK's exceptions, retried the same way.
+
+    """
+
+    def __init__(
+        self,
+        api_key: str | None,
+        base_url: str | None = None,
+        timeout: float = 600.0,
+        max_connections: int = 100,
+        event_hooks: dict | None = None,
+    ) -> None:
+        super().__init__(api_key, base_url)
+        self.http_client = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            event_hooks=event_hooks,
+        )
+
+    def create(self, **payload) -> WireDict:
+        try:
+            response = self.http_client.post(f"{self.base_url}/chat/completions", content=encode_chat_body(payload), headers=self.headers)
+        except httpx.TransportError as e:
+            raise openai.APIConnectionError(request=e.request) from e  # type: ignore
+        _raise_for_status(response)
+        return decode_chat_completion(response.content)
+
+    def retrieve_model(self, model: str) -> WireDict:
+        response = self.http_client.get(f"{self.base_url}/models/{model}", headers=self.headers)
+        _raise_for_status(response)
+        return WireDict.wrap(_loads(response.content))
+
+    def close(self):
+        self.http_client.close()
+
+
+class AsyncRawChatClient(_Transport):
+    """Async version of `RawChatClient`"""
+
+    def __init__(
+        self,
+        api_key: str | None,
+        base_url: str | None = None,
+        timeout: float = 600.0,
+        max_connections: int = 100,
+        event_hooks: dict | None = None,
+    ) -> None:
+        super().__init__(api_key, base_url)
+        self.http_client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            event_hooks=event_hooks,
+        )
+
+    async def create(self, **payload) -> WireDict:
+        try:
+            response = await self.http_client.post(f"{self.base_url}/chat/completions", content=encode_chat_body(payload), headers=self.headers)
+        except httpx.TransportError as e:
+            raise openai.APIConnectionError(request=e.request) from e  # type: ignore
+        _raise_for_status(response)
+        return decode_chat_completion(response.content)
+
+    async def retrieve_model(self, model: str) -> WireDict:
+        response = await self.http_client.get(f"{self.base_url}/models/{model}", headers=self.headers)
+        _raise_for_status(response)
+        return WireDict.wrap(_loads(response.content))
+
+    async def aclose(self):
+        await self.http_client.aclose()
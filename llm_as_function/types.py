@@ -11,6 +11,13 @@ class RuntimeOptions(TypedDict):
     # For more info check https://platform.openai.com/docs/api-reference/chat/create
     tool_choice: Literal["none", "auto", "required"]
     output_schema: dict
+    # Generation budget, max_tokens is sent as `max_tokens` to OpenAI and `num_predict` to Ollama
+    max_tokens: int | None
+    stop: List[str]
+    # Number of samples per request, sent as `n` to OpenAI, Ollama gets as many concurrent requests
+    n: int
+    # OpenAI only, returns the logprobs of this many most likely tokens at every position, see `LLMFunc.fast_classification`
+    top_logprobs: int | None
 
 
 class LLMFuncConfig(TypedDict):
@@ -25,4 +32,8 @@ def empty_runtime_options() -> RuntimeOptions:
         "tools": [],
         "tool_choice": "auto",
         "output_schema": {},
+        "max_tokens": None,
+        "stop": [],
+        "n": 1,
+        "top_logprobs": None,
     }
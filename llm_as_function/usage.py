@@ -0,0 +1,235 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, fields
+from typing import TYPE_CHECKING, Literal
+
+from .deadline import remaining
+from .errors import DeadlineExceeded, QuotaExceeded
+from .metrics import metrics
+from .utils import logger
+
+if TYPE_CHECKING:
+    import ollama
+    from openai.types.chat import ChatCompletion
+
+
+@dataclass(frozen=True)
+class ModelPrice:
+    """USD per million tokens. The cached prompt tokens are billed at cached_input instead of input"""
+
+    input: float
+    output: float
+    cached_input: float | None = None
+
+
+# Matched by the longest prefix of the model name, models not listed (e.g. the local Ollama models) cost nothing.
+# Add or update your models here, the prices change more often than this library.
+PRICES: dict[str, ModelPrice] = {
+    "gpt-3.5-turbo-1106": ModelPrice(input=1.0, output=2.0),
+    "gpt-3.5-turbo": ModelPrice(input=0.5, output=1.5),
+    "gpt-4o-mini": ModelPrice(input=0.15, output=0.6, cached_input=0.075),
+    "gpt-4o": ModelPrice(input=2.5, output=10.0, cached_input=1.25),
+    "gpt-4-turbo": ModelPrice(input=10.0, output=30.0),
+    "gpt-4": ModelPrice(input=30.0, output=60.0),
+}
+
+
+def model_price(model: str) -> ModelPrice | None:
+    matches = [prefix for prefix in PRICES if model.startswith(prefix)]
+    return PRICES[max(matches, key=len)] if matches else None
+
+
+@dataclass
+class Usage:
+    """The tokens and estimated cost (USD) of one or more requests"""
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0  # The part of prompt_tokens served from the provider's prompt cache
+    cost: float = 0.0
+    requests: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, other: "Usage"):
+        for f in fields(self):
+            setattr(self, f.name, getattr(self, f.name) + getattr(other, f.name))
+
+    def share(self, parts: int) -> "Usage":
+        """An even (possibly fractional) share of the usage, for the calls answered by one request (batching, fusion)"""
+        return Usage(**{f.name: getattr(self, f.name) / parts for f in fields(self)})
+
+    @classmethod
+    def priced(cls, model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> "Usage":
+        price = model_price(model)
+        cost = 0.0
+        if price is not None:
+            cached_input = price.input if price.cached_input is None else price.cached_input
+            cost = ((prompt_tokens - cached_tokens) * price.input + cached_tokens * cached_input + completion_tokens * price.output) / 1e6
+        return cls(prompt_tokens, completion_tokens, cached_tokens, cost, requests=1)
+
+
+def openai_usage(chat_completion: "ChatCompletion", model: str) -> Usage:
+    usage = chat_completion.usage
+    if usage is None:
+        return Usage(requests=1)
+    details = usage.prompt_tokens_details
+    cached_tokens = (details.cached_tokens or 0) if details is not None else 0
+    return Usage.priced(model, usage.prompt_tokens, usage.completion_tokens, cached_tokens)
+
+
+def ollama_usage(chat_response: "ollama.ChatResponse", model: str) -> Usage:
+    # Ollama only counts the prompt tokens it evaluated, the ones reused from its prompt cache aren't reported
+    return Usage.priced(model, chat_response.prompt_eval_count or 0, chat_response.eval_count or 0)
+
+
+# The usage of the call being made in the current context, see `track_usage`
+_call_usage: ContextVar[Usage | None] = ContextVar("llm_as_function_call_usage", default=None)
+_call_usage_lock = threading.Lock()
+
+
+@contextmanager
+def track_usage():
+    """Collects the usage of every request sent in this context (the samples, every turn of the tool loop) into one `Usage`"""
+    usage = Usage()
+    token = _call_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _call_usage.reset(token)
+
+
+def record_usage(usage: Usage, **labels):
+    """Adds the usage of a request to the call tracking it and to the metrics, labeled by function and model"""
+    current = _call_usage.get()
+    if current is not None:
+        with _call_usage_lock:  # The Ollama samples are sent from several threads
+            current.add(usage)
+
+    metrics.inc("llm_prompt_tokens", usage.prompt_tokens, **labels)
+    metrics.inc("llm_completion_tokens", usage.completion_tokens, **labels)
+    metrics.inc("llm_cached_tokens", usage.cached_tokens, **labels)
+    metrics.inc("llm_cost_usd", usage.cost, **labels)
+
+
+def function_usage(function: str) -> Usage:
+    """The usage recorded for every request of a decorated function, over all its models"""
+    snapshot = metrics.snapshot()
+    usage = Usage()
+    for name, attribute in [
+        ("llm_prompt_tokens", "prompt_tokens"),
+        ("llm_completion_tokens", "completion_tokens"),
+        ("llm_cached_tokens", "cached_tokens"),
+        ("llm_cost_usd", "cost"),
+        ("llm_requests", "requests"),
+    ]:
+        total = sum(value for labels, value in snapshot.get(name, []) if labels.get("function") == function)
+        setattr(usage, attribute, total if attribute == "cost" else int(total))
+    return usage
+
+
+class Quota:
+    """
+    A spend limit on the requests: max_cost (USD) and/or max_tokens (prompt + completion), over the last window seconds,
+    or over the quota's lifetime when window is None. Set on one function with `LLMFunc.quota`, or on every function of
+    an LLMFunc with `LLMFunc(shared_quota=...)`. One Quota can be shared by several functions and LLMFuncs.
+
+    Once exhausted, a request fails with `QuotaExceeded` (mode="reject"), or waits until enough of the window's spend
+    has expired (mode="throttle", needs a window). A throttled request that can't be sent before its deadline fails then.
+    The requests in flight are always charged, so the spend can go over the limit by the requests sent just before.
+
+    """
+
+    def __init__(
+        self,
+        max_cost: float | None = None,
+        max_tokens: int | None = None,
+        window: float | None = None,
+        mode: Literal["reject", "throttle"] = "reject",
+    ) -> None:
+        assert mode in ["reject", "throttle"], f"Quota mode must in ['reject', 'throttle'], not {mode}"
+        if mode == "throttle" and window is None:
+            raise ValueError("A throttling quota needs a window, a lifetime quota never refills")
+        self.max_cost = max_cost
+        self.max_tokens = max_tokens
+        self.window = window
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._charges: deque[tuple[float, int, float]] = deque()  # (time, tokens, cost) of the requests within the window
+        self._tokens = 0
+        self._cost = 0.0
+
+    def _expire(self, now: float):
+        while self.window is not None and self._charges and self._charges[0][0] <= now - self.window:
+            _, tokens, cost = self._charges.popleft()
+            self._tokens -= tokens
+            self._cost -= cost
+
+    def _over(self, tokens: float, cost: float) -> bool:
+        return (self.max_tokens is not None and tokens >= self.max_tokens) or (self.max_cost is not None and cost >= self.max_cost)
+
+    def charge(self, usage: Usage):
+        with self._lock:
+            if self.window is not None:
+                self._charges.append((time.monotonic(), usage.total_tokens, usage.cost))
+            self._tokens += usage.total_tokens
+            self._cost += usage.cost
+
+    def spent(self) -> tuple[int, float]:
+        """The tokens and cost counted against the quota now"""
+        with self._lock:
+            self._expire(time.monotonic())
+            return self._tokens, self._cost
+
+    def wait_time(self) -> float:
+        """Seconds until the quota has room for a request again, 0 when it has room now"""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            if not self._over(self._tokens, self._cost):
+                return 0.0
+            if self.window is None:
+                return float("inf")
+            tokens, cost = self._tokens, self._cost
+            for charged_at, charged_tokens, charged_cost in self._charges:
+                tokens, cost = tokens - charged_tokens, cost - charged_cost
+                if not self._over(tokens, cost):
+                    return charged_at + self.window - now
+            return self.window
+
+    def _wait_or_raise(self, function: str) -> float:
+        """How long the request waits for the quota, raises when it can't wait"""
+        wait = self.wait_time()
+        if wait == 0:
+            return 0.0
+        if self.mode == "reject":
+            metrics.inc("llm_quota_rejected", function=function)
+            tokens, cost = self.spent()
+            raise QuotaExceeded(f"The quota of {function} is exhausted: {tokens} tokens, ${cost:.4f} spent")
+        left = remaining()
+        if left is not None and wait > left:
+            raise DeadlineExceeded(f"{function} would wait {wait:.2f}s for its quota, over its deadline")
+        metrics.inc("llm_quota_throttled_seconds", wait, function=function)
+        logger.debug(f"{function} waits {wait:.2f}s for its quota")
+        return wait
+
+    def check(self, function: str = "default"):
+        """Blocks until the quota has room for a request, or raises `QuotaExceeded`"""
+        while wait := self._wait_or_raise(function):
+            time.sleep(wait)
+
+    async def acheck(self, function: str = "default"):
+        while wait := self._wait_or_raise(function):
+            await asyncio.sleep(wait)
+
+    def reset(self):
+        with self._lock:
+            self._charges.clear()
+            self._tokens = 0
+            self._cost = 0.0
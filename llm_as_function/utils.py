@@ -1,11 +1,14 @@
 import os
-import inspect
+import string
 import asyncio
-from functools import wraps
+import contextvars
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from types import UnionType
 from pydantic import BaseModel
-from re import DOTALL, finditer
-from typing import List, Literal, Type, get_args, get_origin
+from re import DOTALL, finditer, match
+from typing import Any, Coroutine, List, Literal, Mapping, Type, get_args, get_origin
 
 import logging
 from rich.logging import RichHandler
@@ -47,6 +50,52 @@ def find_json_response(full_response, extract_type=dict):
     return extracted_str
 
 
+class JSONObjectScanner:
+    """
+    Incrementally scans streamed text and tells when the first top-level JSON object is complete, tracking
+    the brace depth outside of strings. Anything before the first `{` is kept but ignored.
+
+    """
+
+    def __init__(self) -> None:
+        self._parts: list[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.complete = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def feed(self, chunk: str) -> bool:
+        """Adds a chunk of the stream, returns True once the first object is complete (the rest of the chunk is dropped)"""
+        if self.complete:
+            return True
+
+        for index, char in enumerate(chunk):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"' and self._depth > 0:
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(chunk[: index + 1])
+                    self.complete = True
+                    return True
+
+        self._parts.append(chunk)
+        return False
+
+
 def clean_output_parse(llm_output: str) -> str | None:
     """
     Cleans the llms output then tries to extract json from said output returns None if it can't find any
@@ -55,6 +104,26 @@ def clean_output_parse(llm_output: str) -> str | None:
     return find_json_response(llm_output.strip())
 
 
+def fill_placeholders(template: str, values: Mapping[str, Any] = {}) -> str:
+    """
+    Formats a prompt template with the given values, and writes every other field as a <placeholder> naming its
+    expression without conversion or format spec: "{score:.2f}" becomes "<score>", "{user.name}" becomes "<user.name>".
+
+    """
+    formatter = string.Formatter()
+    parts = []
+    for literal, field_name, format_spec, conversion in formatter.parse(template):
+        parts.append(literal)
+        if field_name is None:
+            continue
+        if match(r"[^.\[]*", field_name).group() in values:  # type: ignore
+            field = field_name + (f"!{conversion}" if conversion else "") + (f":{format_spec}" if format_spec else "")
+            parts.append(formatter.vformat("{" + field + "}", (), values))
+        else:
+            parts.append(f"<{field_name}>")
+    return "".join(parts)
+
+
 def generate_schema_prompt(schema: Type[BaseModel]) -> str:
     """
     Converts the pydantic schema into a text representation that can be embedded
@@ -96,27 +165,45 @@ def generate_schema_prompt(schema: Type[BaseModel]) -> str:
     return generate_payload(schema)
 
 
-class LimitAPICalling:
-    """The restriction for accessing the async GPT(acreate) is that only a maximum of max_size GPTs can be accessed at the same time."""
+class LazyProcessPool:
+    """A process pool that only starts its workers on first use"""
+
+    def __init__(self, max_workers: int | None = None) -> None:
+        self.max_workers = max_workers
+        self._pool: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def get(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._pool
 
-    def __init__(self, max_size=8, waiting_time=0.1) -> None:
-        self.max_size = max_size
-        self._current_bin = 0
-        self.waiting_time = waiting_time
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
 
-    def __call__(self, func):
-        assert inspect.iscoroutinefunction(func), "func must be a coroutine function"
 
-        @wraps(func)
-        async def wait_func(*args, **kwargs):
-            while True:
-                if self._current_bin < self.max_size:
-                    self._current_bin += 1
-                    break
-                await asyncio.sleep(self.waiting_time)
-            logger.debug(f"Calling LLM [{self._current_bin}]/[{self.max_size}]")
-            result = await func(*args, **kwargs)
-            self._current_bin -= 1
-            return result
+async def run_in_executor(executor: Executor | None, func, *args, **kwargs):
+    """Runs a blocking function in the executor without blocking the event loop, the contextvars are kept"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, partial(context.run, func, *args, **kwargs))
 
-        return wait_func
+
+def run_sync(coroutine: Coroutine):
+    """
+    Runs a coroutine to completion from sync code, the contextvars are kept. When the thread already runs an event
+    loop (a sync call made from async code), the coroutine runs on its own loop in a dedicated thread.
+
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-func-run-sync") as executor:
+        return executor.submit(context.run, asyncio.run, coroutine).result()
@@ -0,0 +1,118 @@
+import inspect
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Callable
+import pytest
+from openai.types.chat import ChatCompletion
+
+
+def completion_payload(
+    content: str | None = None,
+    tool_calls: list[dict] | None = None,
+    samples: list[str] | None = None,
+    usage: dict | None = None,
+    logprobs: dict | None = None,
+    finish_reason: str = "stop",
+    model: str = "gpt-fake",
+) -> dict:
+    """The JSON of a chat completion: one choice with the content (or tool calls), or one choice per sample"""
+    message = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    messages = [message] if samples is None else [{"role": "assistant", "content": sample} for sample in samples]
+    payload = {
+        "id": "fake",
+        "object": "chat.completion",
+        "created": 0,
+        "model": model,
+        "choices": [{"index": i, "finish_reason": finish_reason, "logprobs": logprobs, "message": message} for i, message in enumerate(messages)],
+    }
+    if usage is not None:
+        payload["usage"] = usage
+    return payload
+
+
+def tool_call(name: str, arguments: dict, id: str = "call_0") -> dict:
+    return {"id": id, "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+
+
+@pytest.fixture()
+def completion() -> Callable[..., ChatCompletion]:
+    """Builds a `ChatCompletion`, `completion.payload` its JSON and `completion.tool_call` the JSON of a tool call"""
+
+    def make(*args, **kwargs) -> ChatCompletion:
+        return ChatCompletion.model_validate(completion_payload(*args, **kwargs))
+
+    make.payload = completion_payload  # type: ignore
+    make.tool_call = tool_call  # type: ignore
+    return make
+
+
+@pytest.fixture()
+def fake_client():
+    """
+    A stand-in for the OpenAI clients: `fake_client(responses, calls, is_async)` answers with the responses in order,
+    or with `responses(**payload)` when it is a function (awaited when async). The payloads are appended to calls.
+
+    """
+
+    def make(responses: list | Callable, calls: list | None = None, is_async: bool = False):
+        def respond(payload: dict):
+            if calls is not None:
+                calls.append(payload)
+            return responses(**payload) if callable(responses) else responses.pop(0)
+
+        def create(**payload):
+            return respond(payload)
+
+        async def acreate(**payload):
+            response = respond(payload)
+            return await response if inspect.isawaitable(response) else response
+
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=acreate if is_async else create)))
+
+    return make
+
+
+class ChatServer:
+    """A local OpenAI compatible endpoint, `answer(body)` returns the completion JSON, or (status, JSON) for errors"""
+
+    def __init__(self, answer: Callable[[dict], dict | tuple[int, dict]]):
+        self.bodies: list[dict] = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server.bodies.append(body)
+                reply = answer(body)
+                status, payload = reply if isinstance(reply, tuple) else (200, reply)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.http_server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.http_server.server_address[1]}/v1"
+
+
+@pytest.fixture()
+def chat_server():
+    """Starts `ChatServer`s for the test, shut down after it"""
+    servers: list[ChatServer] = []
+
+    def start(answer: Callable[[dict], dict | tuple[int, dict]]) -> ChatServer:
+        servers.append(ChatServer(answer))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.http_server.shutdown()
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import re
+from typing import Literal
+import pytest
+from pydantic import BaseModel
+from llm_as_function import LLMFunc, call_priority
+from llm_as_function.deadline import remaining
+from llm_as_function.errors import DeadlineExceeded
+
+
+class Sentiment(BaseModel):
+    label: Literal["positive", "negative"]
+
+
+def label(text):
+    return "positive" if "good" in text else "negative"
+
+
+def answer_batches(completion, broken_batches=False):
+    """Answers batched prompts with one result per input line, and single prompts with one result"""
+
+    def answer(**kwargs):
+        prompt = kwargs["messages"][0]["content"]
+        inputs = [json.loads(line) for line in re.findall(r"^\d+\. (\{.*\})$", prompt, flags=re.MULTILINE)]
+        if inputs:
+            results = [{"label": label(item["text"])} for item in inputs]
+            return completion(json.dumps({"results": results[:-1] if broken_batches else results}))
+        return completion(json.dumps({"label": label(prompt)}))
+
+    return answer
+
+
+def test_micro_batching(completion, fake_client):
+    llm = LLMFunc(openai_api_key="sk-test")
+    calls = []
+    llm.openai_async_client = fake_client(answer_batches(completion), calls, is_async=True)
+
+    @llm.batch(max_size=4, window=0.05).async_call
+    def classify(text) -> Sentiment:  # type: ignore
+        """Classify the sentiment of: {text}"""
+
+    async def main():
+        return await asyncio.gather(*[classify(text=text) for text in ["good", "bad", "so good", "awful", "good day"]])  # type: ignore
+
+    results = asyncio.run(main())
+    assert [result.unpack()["label"] for result in results] == ["positive", "negative", "positive", "negative", "positive"]
+    # 4 calls in the first batch, the fifth one alone
+    assert len(calls) == 2
+    assert "Classify the sentiment of: <text>" in calls[0]["messages"][0]["content"]
+
+
+def test_micro_batching_fallback(completion, fake_client):
+    llm = LLMFunc(openai_api_key="sk-test")
+    calls = []
+    llm.openai_async_client = fake_client(answer_batches(completion, broken_batches=True), calls, is_async=True)
+
+    @llm.batch(max_size=8).async_call
+    def classify(text) -> Sentiment:  # type: ignore
+        """Classify the sentiment of: {text}"""
+
+    async def main():
+        return await asyncio.gather(*[classify(text=text) for text in ["good", "bad", "good"]])  # type: ignore
+
+    results = asyncio.run(main())
+    assert [result.unpack()["label"] for result in results] == ["positive", "negative", "positive"]
+    # The batch, then one request per call
+    assert len(calls) == 4
+
+    with pytest.raises(ValueError):
+
+        @llm.batch()
+        def sync_classify(text) -> Sentiment:  # type: ignore
+            """Classify the sentiment of: {text}"""
+
+
+def test_micro_batching_format_spec(completion, fake_client):
+    llm = LLMFunc(openai_api_key="sk-test")
+    calls = []
+
+    def answer(**kwargs):
+        prompt = kwargs["messages"][0]["content"]
+        inputs = [json.loads(line) for line in re.findall(r"^\d+\. (\{.*\})$", prompt, flags=re.MULTILINE)]
+        results = [{"label": "positive" if item["score"] > 0.5 else "negative"} for item in inputs]
+        return completion(json.dumps({"results": results}))
+
+    llm.openai_async_client = fake_client(answer, calls, is_async=True)
+
+    @llm.batch(max_size=4).async_call
+    def classify(score) -> Sentiment:  # type: ignore
+        """Classify a review scored {score:.2f}"""
+
+    async def main():
+        return await asyncio.gather(*[classify(score=score) for score in [0.9, 0.1, 0.7]])  # type: ignore
+
+    results = asyncio.run(main())
+    assert [result.unpack()["label"] for result in results] == ["positive", "negative", "positive"]
+    assert len(calls) == 1
+    assert "Classify a review scored <score>" in calls[0]["messages"][0]["content"]
+
+
+def test_micro_batching_caller_contexts(completion, fake_client):
+    llm = LLMFunc(openai_api_key="sk-test")
+    calls = []
+    answer = answer_batches(completion)
+
+    async def slow_answer(**kwargs):
+        await asyncio.sleep(0.2)
+        remaining()  # Raises once the deadline of the request's context is over, as the client's request hook does
+        return answer(**kwargs)
+
+    llm.openai_async_client = fake_client(slow_answer, calls, is_async=True)
+
+    @llm.batch(max_size=8).async_call
+    async def classify(text) -> Sentiment:  # type: ignore
+        """Classify the sentiment of: {text}"""
+
+    async def background(text):
+        with call_priority("batch"):
+            return await classify(text=text)  # type: ignore
+
+    async def main():
+        # The first call of the batch gives up early, the batch is still sent for the others
+        pending = [classify(text="good", deadline=0.05), classify(text="bad"), classify(text="so good"), background("good"), background("awful")]  # type: ignore
+        return await asyncio.gather(*pending, return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert isinstance(results[0], DeadlineExceeded)
+    assert [result.unpack()["label"] for result in results[1:]] == ["negative", "positive", "positive", "negative"]
+    # One batch per priority
+    assert len(calls) == 2
+    assert all("1. " in call["messages"][0]["content"] for call in calls)
@@ -0,0 +1,63 @@
+from typing import Literal
+from pydantic import BaseModel, Field
+from llm_as_function import LLMFunc
+from llm_as_function.tokens import MAX_STRING_TOKENS, max_schema_tokens
+
+
+class Label(BaseModel):
+    label: Literal["positive", "negative", "neutral"]
+
+
+class Summary(BaseModel):
+    title: str = Field(max_length=80)
+    tags: list[str] = Field(max_length=5)
+    body: str
+
+
+class Node(BaseModel):
+    label: Label
+    parent: "Node | None" = None
+
+
+def test_schema_caps():
+    assert max_schema_tokens(Label.model_json_schema()) < 64
+    # Bounded fields give a tighter cap than unbounded ones
+    assert max_schema_tokens(Summary.model_json_schema()) < max_schema_tokens(
+        {"type": "object", "properties": {"title": {"type": "string"}, "tags": {"type": "array", "items": {"type": "string"}}, "body": {"type": "string"}}}
+    )
+
+
+def test_recursive_schema_cap():
+    llm = LLMFunc(openai_api_key="sk-test")
+
+    # The default budget caps the generation from the schema when the function is decorated
+    @llm.budget()
+    def tree(text) -> Node:  # type: ignore
+        """Classify {text} and its parts"""
+
+    cap = tree.dry_run(text="great").payload["max_tokens"]  # type: ignore
+    assert cap == max_schema_tokens(Node.model_json_schema())
+    # The nesting of the parents is bounded once
+    assert MAX_STRING_TOKENS < cap < MAX_STRING_TOKENS * 3
+
+
+def test_budget_payload():
+    budget_func = LLMFunc(openai_api_key="sk-test")
+
+    @budget_func.budget(stop=["\n\n"])
+    def classify(text) -> Label:  # type: ignore
+        """Classify the sentiment of {text}"""
+
+    @budget_func.budget(max_tokens=100)
+    def summarize(text) -> Summary:  # type: ignore
+        """Summarize {text}"""
+
+    @budget_func
+    def unbounded(text) -> Summary:  # type: ignore
+        """Summarize {text}"""
+
+    payload = classify.dry_run(text="great").payload  # type: ignore
+    assert payload["max_tokens"] == max_schema_tokens(Label.model_json_schema())
+    assert payload["stop"] == ["\n\n"]
+    assert summarize.dry_run(text="great").payload["max_tokens"] == 100  # type: ignore
+    assert "max_tokens" not in unbounded.dry_run(text="great").payload  # type: ignore
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+import ollama
+import pytest
+from pydantic import BaseModel
+from llm_as_function import LLMFunc, use_cassette
+from llm_as_function.errors import CassetteMiss
+
+
+class Result(BaseModel):
+    summary: str
+
+
+class Query(BaseModel):
+    city: str
+
+
+def get_weather(query: Query) -> str:
+    """Get the weather of a city"""
+    return "sunny"
+
+
+def offline(**kwargs):
+    raise AssertionError("The replay sent a request")
+
+
+def test_record_then_replay_tool_loop(tmp_path, completion, fake_client):
+    path = str(tmp_path / "weather.cassette")
+    llm = LLMFunc(openai_api_key="sk-test", has_tool_support=True)
+    responses = [completion(tool_calls=[completion.tool_call("get_weather", {"city": "Paris"}, id="1")]), completion(json.dumps({"summary": "sunny in Paris"}))]
+
+    def create(**kwargs):
+        time.sleep(0.05)
+        return responses.pop(0)
+
+    llm.openai_client = fake_client(create)
+
+    @llm.func(get_weather)
+    def weather_report(city) -> Result:  # type: ignore
+        """Report the weather of {city}"""
+
+    with use_cassette(path, mode="record") as cassette:
+        recorded = weather_report(city="Paris")
+    assert len(cassette) == 2
+
+    llm.openai_client = fake_client(offline)
+    with use_cassette(path, mode="replay"):
+        start = time.perf_counter()
+        assert weather_report(city="Paris") == recorded
+        assert time.perf_counter() - start < 0.05
+
+        with pytest.raises(CassetteMiss):
+            weather_report(city="Rome")
+
+    with use_cassette(path, mode="replay", latency_scale=1.0):
+        start = time.perf_counter()
+        weather_report(city="Paris")
+        assert time.perf_counter() - start >= 0.1
+
+
+def test_auto_mode_async_ollama(tmp_path):
+    path = str(tmp_path / "ollama.cassette")
+    llm = LLMFunc(model="llama3.1", has_structured_output=True)
+    sent = []
+
+    async def chat(**payload):
+        sent.append(payload)
+        return ollama.ChatResponse(done=True, done_reason="stop", message=ollama.Message(role="assistant", content=json.dumps({"summary": payload["messages"][0]["content"]})))
+
+    llm.ollama_async_client = SimpleNamespace(chat=chat)
+
+    @llm.async_call
+    def echo(text) -> Result:  # type: ignore
+        """{text}"""
+
+    async def main():
+        with use_cassette(path):
+            await echo(text="a")  # type: ignore
+        with use_cassette(path):
+            # "a" is replayed, "b" is sent and added to the cassette
+            return [(await echo(text=text)).unpack()["summary"] for text in ["a", "b"]]  # type: ignore
+
+    assert asyncio.run(main()) == ["a", "b"]
+    assert [payload["messages"][0]["content"] for payload in sent] == ["a", "b"]
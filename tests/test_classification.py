@@ -0,0 +1,107 @@
+import asyncio
+import math
+from enum import Enum
+from typing import Literal
+from pydantic import BaseModel
+from llm_as_function import LLMFunc, metrics
+from llm_as_function.classification import classification_labels, label_probabilities
+
+LABELS = ("positive", "negative", "neutral")
+
+
+class Sentiment(BaseModel):
+    label: Literal["positive", "negative", "neutral"]
+
+
+class Color(str, Enum):
+    red = "red"
+    blue = "blue"
+
+
+class Paint(BaseModel):
+    color: Color
+
+
+class Review(BaseModel):
+    label: Literal["positive", "negative"]
+    score: int
+
+
+def answer(completion, content: str, top_logprobs: list[tuple[str, float]] | None = None):
+    logprobs = None
+    if top_logprobs is not None:
+        tops = [{"token": token, "logprob": logprob, "bytes": None} for token, logprob in top_logprobs]
+        logprobs = {"content": [{**tops[0], "top_logprobs": tops}], "refusal": None}
+    usage = {"prompt_tokens": 20, "completion_tokens": 1, "total_tokens": 21}
+    return completion(content, logprobs=logprobs, usage=usage, finish_reason="length", model="gpt-4o-mini")
+
+
+def test_label_probabilities():
+    assert classification_labels(Sentiment).labels == LABELS  # type: ignore
+    assert classification_labels(Paint).labels == ("red", "blue")  # type: ignore
+    assert classification_labels(Review) is None
+
+    probabilities = label_probabilities([("neg", -2.0), ("pos", -0.1), (" Positive", -3.0), ("ne", -1.5)], LABELS)
+    # "ne" starts two labels, it doesn't count
+    assert probabilities is not None and max(probabilities, key=probabilities.__getitem__) == "positive"
+    assert math.isclose(sum(probabilities.values()), 1.0)
+    assert math.isclose(probabilities["positive"] / probabilities["negative"], (math.exp(-0.1) + math.exp(-3.0)) / math.exp(-2.0))
+    # The most likely token doesn't decide the label
+    assert label_probabilities([("ne", -0.1), ("pos", -2.0)], LABELS) is None
+
+
+def test_fast_path_and_fallback(completion, fake_client):
+    llm = LLMFunc(model="gpt-4o-mini", openai_api_key="sk-test", fast_classification=True)
+    sent = []
+    responses = [
+        answer(completion, "pos", [("pos", -0.05), ("neg", -3.2), ("neutral", -4.0)]),
+        answer(completion, "ne", [("ne", -0.2), ("pos", -1.8)]),
+        answer(completion, '{"label": "neutral"}'),
+    ]
+    llm.openai_client = fake_client(responses, sent)
+
+    @llm
+    def classify(text) -> Sentiment:  # type: ignore
+        """Classify the sentiment of {text}"""
+
+    assert classify.spec.classification is not None  # type: ignore
+    result = classify(text="great")
+    assert result.unpack() == {"label": "positive"}
+    assert result.probabilities["positive"] > 0.9 and math.isclose(sum(result.probabilities.values()), 1.0)  # type: ignore
+    assert result.usage.completion_tokens == 1  # type: ignore
+    assert sent[0]["max_tokens"] == 1 and sent[0]["logprobs"] is True and sent[0]["top_logprobs"] == 20
+    assert "response_format" not in sent[0]
+    assert sent[0]["messages"][0]["content"].endswith("one of these labels and nothing else: positive, negative, neutral")
+
+    fallbacks = metrics.get("llm_classification_fallbacks", function=classify.spec.name, model="gpt-4o-mini")  # type: ignore
+    result = classify(text="fine")
+    assert result.unpack() == {"label": "neutral"} and result.probabilities is None
+    assert result.usage.requests == 2  # type: ignore
+    assert sent[2]["response_format"] == {"type": "json_object"} and "logprobs" not in sent[2]
+    assert metrics.get("llm_classification_fallbacks", function=classify.spec.name, model="gpt-4o-mini") == fallbacks + 1  # type: ignore
+
+
+def test_async_enum_and_opt_out(completion, fake_client):
+    llm = LLMFunc(model="gpt-4o-mini", openai_api_key="sk-test", fast_classification=True)
+    llm.openai_async_client = fake_client(lambda **payload: answer(completion, "blue", [("blue", -0.4), ("red", -1.1)]), is_async=True)
+
+    @llm.async_call
+    def paint(thing) -> Paint:  # type: ignore
+        """The color of {thing}"""
+
+    result = asyncio.run(paint(thing="the sky"))  # type: ignore
+    assert result.unpack() == {"color": Color.blue}
+    assert math.isclose(result.probabilities["blue"], math.exp(-0.4) / (math.exp(-0.4) + math.exp(-1.1)))
+
+    # Not a classifier, and classifiers with samples keep the JSON path
+    @llm
+    def review(text) -> Review:  # type: ignore
+        """Review {text}"""
+
+    @llm.samples(3)
+    def vote(text) -> Sentiment:  # type: ignore
+        """Classify {text}"""
+
+    assert review.spec.classification is None and vote.spec.classification is None  # type: ignore
+    report = asyncio.run(paint.dry_run(thing="grass"))  # type: ignore
+    assert report.payload["top_logprobs"] == 20 and report.completion_tokens == 1
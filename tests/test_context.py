@@ -0,0 +1,32 @@
+from llm_as_function.context import ContextPolicy, compact_history
+from llm_as_function.tokens import count_message_tokens
+
+
+def tool_turn(index, output):
+    return [
+        {"role": "assistant", "content": None, "tool_calls": [{"id": f"call_{index}", "type": "function", "function": {"name": "search", "arguments": "{}"}}]},
+        {"role": "tool", "name": "search", "content": output, "tool_call_id": f"call_{index}"},
+    ]
+
+
+def test_truncate_keeps_latest_turn():
+    history = tool_turn(0, "old result " * 500) + tool_turn(1, "older result " * 500) + tool_turn(2, "latest result " * 500)
+    compacted = compact_history(history, ContextPolicy(max_tokens=1500, truncated_tokens=32))
+
+    assert len(compacted) == len(history)
+    assert compacted[1]["content"].endswith("...[truncated]")
+    assert compacted[-1] == history[-1]
+    assert count_message_tokens(compacted) < count_message_tokens(history)
+    # Compacting again doesn't change the already compacted turns
+    assert compact_history(compacted, ContextPolicy(max_tokens=1500, truncated_tokens=32)) == compacted
+
+
+def test_drop_and_elide():
+    history = tool_turn(0, "old result " * 500) + tool_turn(1, "latest result " * 500)
+
+    dropped = compact_history(history, ContextPolicy(max_tokens=100, strategy="drop"))
+    assert dropped == history[2:]
+
+    elided = compact_history(history, ContextPolicy(max_tokens=100, strategy="elide"))
+    assert elided[1]["content"].startswith("[elided")
+    assert elided[3] == history[3]
@@ -0,0 +1,61 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from pydantic import BaseModel, Field
+from llm_as_function import LLMFunc, deadline
+from llm_as_function.errors import DeadlineExceeded
+
+
+class Result(BaseModel):
+    summary: str = Field(description="The response summary sentence")
+
+
+DELAY = 0.3
+
+
+def test_sync_deadline(completion, chat_server):
+    def answer(body):
+        time.sleep(DELAY)
+        return completion.payload(json.dumps({"summary": "ok"}))
+
+    llm = LLMFunc(openai_api_key="sk-test", openai_base_url=chat_server(answer).base_url)
+
+    @llm
+    def fool(topic) -> Result:  # type: ignore
+        """Summarize {topic}"""
+
+    assert fool(topic="a", deadline=5).unpack() == {"summary": "ok"}
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        fool(topic="a", deadline=0.1)
+    # The retries of the SDK and ours stop at the deadline too
+    assert time.monotonic() - started < DELAY
+
+
+def test_async_deadline_cancels(fake_client):
+    llm = LLMFunc(openai_api_key="sk-test")
+    cancelled = threading.Event()
+
+    async def create(**kwargs):
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    llm.openai_async_client = fake_client(create, is_async=True)
+
+    @llm.async_call
+    def fool(topic) -> Result:  # type: ignore
+        """Summarize {topic}"""
+
+    async def main():
+        with deadline(0.05):
+            await fool(topic="a")  # type: ignore
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(main())
+    assert cancelled.is_set()
@@ -0,0 +1,114 @@
+from typing import Literal
+import ollama
+from pydantic import BaseModel, Field
+from llm_as_function import LLMFunc, Final, metrics
+from llm_as_function.tokens import approx_token_count, estimate_schema_tokens, truncate_kwargs
+
+
+class Result(BaseModel):
+    emoji: str = Field(description="The output emoji", max_length=8)
+    mood: Literal["happy", "sad"]
+
+
+def test_dry_run():
+    dry_func = LLMFunc(openai_api_key="sk-test")
+
+    @dry_func
+    def fool(emotion) -> Result:  # type: ignore
+        """
+        You need to output an emoji, which is {emotion}
+        """
+        if emotion == "none":
+            return Final({"emoji": "", "mood": "sad"})
+
+    report = fool.dry_run(emotion="happy")  # type: ignore
+    assert report.payload["messages"][0]["content"].startswith("You need to output an emoji, which is happy")
+    assert report.payload["model"] == dry_func.model
+    assert report.prompt_tokens > 0
+    assert report.completion_tokens == estimate_schema_tokens(Result.model_json_schema())
+
+    stats = fool.dry_run_many([{"emotion": "happy"}, {"emotion": "none"}, {"emotion": "weird" * 20}])  # type: ignore
+    assert stats.calls == 3
+    assert stats.requests == 2
+    assert stats.percentile(100, "prompt_tokens") > stats.percentile(50, "prompt_tokens")
+
+
+class Place(BaseModel):
+    name: str
+    inside: "Place | None" = None
+
+
+class Trip(BaseModel):
+    places: list[Place]
+
+
+def test_dry_run_recursive_schema():
+    dry_func = LLMFunc(openai_api_key="sk-test")
+
+    @dry_func
+    def plan(city) -> Trip:  # type: ignore
+        """Plan a trip to {city}"""
+
+    # Place refers to itself, its nesting ends with null: the braces and "places" key around a list of 3 places
+    tokens = estimate_schema_tokens(Trip.model_json_schema())
+    assert tokens == estimate_schema_tokens(Place.model_json_schema()) * 3 + 2 + approx_token_count("places") + 3 + 2 + 3
+    assert plan.dry_run(city="Paris").completion_tokens == tokens  # type: ignore
+    assert plan.dry_run_many([{"city": "Paris"}, {"city": "Rome"}]).calls == 2  # type: ignore
+
+
+def test_truncate_kwargs():
+    kwargs = {"short": "a few words", "long": "word " * 1000, "number": 3}
+    truncated = truncate_kwargs(kwargs, 100)
+
+    assert truncated["short"] == kwargs["short"]
+    assert truncated["number"] == 3
+    assert approx_token_count(truncated["short"]) + approx_token_count(truncated["long"]) <= 100
+
+
+def test_keep_alive_payload():
+    keep_alive_func = LLMFunc(model="llama3.1", has_structured_output=True, keep_alive="30m", num_ctx=8192)
+
+    @keep_alive_func
+    def fool(emotion) -> Result:  # type: ignore
+        """
+        You need to output an emoji, which is {emotion}
+        """
+
+    report = fool.dry_run(emotion="happy")  # type: ignore
+    assert report.payload["keep_alive"] == "30m"
+    assert report.payload["options"]["num_ctx"] == 8192
+    assert report.payload["format"] == Result.model_json_schema()
+
+
+class FakeOllamaClient:
+    def __init__(self):
+        self.payloads = []
+
+    def chat(self, **payload):
+        self.payloads.append(payload)
+        return ollama.ChatResponse(
+            done=True,
+            done_reason="stop",
+            prompt_eval_count=120,
+            prompt_eval_duration=30_000_000,
+            load_duration=0,
+            message=ollama.Message(role="assistant", content='{"emoji": ":)", "mood": "happy"}'),
+        )
+
+
+def test_ollama_prompt_eval_metrics():
+    ollama_func = LLMFunc(model="llama3.1", has_structured_output=True, keep_alive=-1, num_ctx=4096)
+    ollama_func.ollama_client = FakeOllamaClient()
+
+    @ollama_func
+    def prompt_eval_fool(emotion) -> Result:  # type: ignore
+        """
+        You need to output an emoji, which is {emotion}
+        """
+
+    assert prompt_eval_fool(emotion="happy").unpack()["mood"] == "happy"  # type: ignore
+    assert ollama_func.ollama_client.payloads[0]["options"]["num_ctx"] == 4096
+
+    labels = dict(function=f"{__name__}.{prompt_eval_fool.__qualname__}", model="llama3.1")
+    assert metrics.get("ollama_prompt_eval_tokens", **labels) == 120
+    assert metrics.get("ollama_prompt_eval_seconds", **labels) == 0.03
@@ -0,0 +1,53 @@
+import asyncio
+from pydantic import BaseModel, Field
+from llm_as_function import LLMFunc, Final, fan_out
+
+
+class Result(BaseModel):
+    value: int = Field(description="The calculated value of the Fibonacci sequence.")
+
+
+def test_fan_out_dedup():
+    fan_out_func = LLMFunc(openai_api_key="sk-test")
+    evaluated = []
+
+    @fan_out_func.async_call
+    async def f(x: int) -> Result:  # type: ignore
+        """Calculate the {x}th term of the Fibonacci sequence."""
+        evaluated.append(x)
+        if x == 1 or x == 0:
+            return Final({"value": x})
+        await asyncio.sleep(0.01)
+        a, b = await fan_out((f, {"x": x - 1}), (f, {"x": x - 2}))
+        return Final({"value": a.unpack()["value"] + b.unpack()["value"]})
+
+    async def main():
+        return await fan_out((f, {"x": 10}))
+
+    (result,) = asyncio.run(main())
+
+    assert result.unpack()["value"] == 55
+    assert sorted(evaluated) == list(range(11))
+
+
+def test_fan_out_call_of_an_ancestor():
+    fan_out_func = LLMFunc(openai_api_key="sk-test")
+    depth = []
+
+    @fan_out_func.async_call
+    async def refine(draft: str) -> Result:  # type: ignore
+        """Refine {draft}"""
+        depth.append(draft)
+        if len(depth) == 3:
+            return Final({"value": len(depth)})
+        # Same function and kwargs as the call running it, waiting for the shared execution would deadlock
+        (result,) = await fan_out((refine, {"draft": draft}))
+        return result
+
+    async def main():
+        return await asyncio.wait_for(fan_out((refine, {"draft": "x"})), timeout=5)
+
+    (result,) = asyncio.run(main())
+
+    assert result.unpack()["value"] == 3
+    assert depth == ["x", "x", "x"]
@@ -0,0 +1,138 @@
+import asyncio
+import json
+from typing import Literal
+import pytest
+from pydantic import BaseModel
+from llm_as_function import LLMFunc, Final, Scheduler
+from llm_as_function.errors import QuotaExceeded
+
+
+class Summary(BaseModel):
+    summary: str
+
+
+class Tags(BaseModel):
+    tags: list[str]
+
+
+class Sentiment(BaseModel):
+    label: Literal["positive", "negative"]
+
+
+def test_fuse(completion, fake_client):
+    llm = LLMFunc(openai_api_key="sk-test")
+    calls = []
+    # The fused answer has an invalid sentiment, which is then called on its own
+    llm.openai_client = fake_client([completion(json.dumps(answer)) for answer in [{"summarize": {"summary": "short"}, "tag": {"tags": ["a", "b"]}, "sentiment": {"label": "meh"}}, {"label": "positive"}]], calls)
+
+    @llm
+    def summarize(document) -> Summary:  # type: ignore
+        """Summarize {document}"""
+
+    @llm
+    def tag(document) -> Tags:  # type: ignore
+        """Tag {document}"""
+
+    @llm
+    def sentiment(document) -> Sentiment:  # type: ignore
+        """Give the sentiment of {document}"""
+
+    views = llm.fuse(summarize, tag, sentiment)
+    results = views(document="A long document " * 50)
+
+    assert results["summarize"].unpack() == {"summary": "short"}
+    assert results["tag"].unpack() == {"tags": ["a", "b"]}
+    assert results["sentiment"].unpack() == {"label": "positive"}
+    assert len(calls) == 2
+    fused_prompt = calls[0]["messages"][0]["content"]
+    assert fused_prompt.count("A long document") == 50
+    assert "Tag <document>" in fused_prompt
+
+
+def test_async_fuse(completion, fake_client):
+    llm = LLMFunc(openai_api_key="sk-test")
+    calls = []
+    llm.openai_async_client = fake_client([completion(json.dumps({"tag": {"tags": ["x"]}}))], calls, is_async=True)
+
+    @llm.async_call
+    async def tag(document) -> Tags:  # type: ignore
+        """Tag {document}"""
+
+    @llm.async_call
+    async def sentiment(document) -> Sentiment:  # type: ignore
+        """Give the sentiment of {document}"""
+        return Final({"label": "negative"})
+
+    results = asyncio.run(llm.fuse(tag, sentiment)(document="doc"))
+    assert results["tag"].unpack() == {"tags": ["x"]}
+    assert results["sentiment"].unpack() == {"label": "negative"}
+    # The body of sentiment returned its Final, only tag is sent
+    assert "### tag" in calls[0]["messages"][0]["content"]
+    assert "### sentiment" not in calls[0]["messages"][0]["content"]
+
+
+def test_fuse_format_spec(completion, fake_client):
+    llm = LLMFunc(openai_api_key="sk-test")
+    calls = []
+    llm.openai_client = fake_client([completion(json.dumps({"tag": {"tags": ["x"]}, "sentiment": {"label": "positive"}}))], calls)
+
+    @llm
+    def tag(score, reviews) -> Tags:  # type: ignore
+        """Tag the {reviews[0]} reviews scored {score:.2f}"""
+
+    @llm
+    def sentiment(score, reviews) -> Sentiment:  # type: ignore
+        """Give the sentiment of a score of {score:>6}, {precision}"""
+        return {"precision": 0.5}
+
+    results = llm.fuse(tag, sentiment)(score=0.912, reviews=[3])
+    assert results["tag"].unpack() == {"tags": ["x"]}
+    assert results["sentiment"].unpack() == {"label": "positive"}
+    fused_prompt = calls[0]["messages"][0]["content"]
+    assert "Tag the <reviews[0]> reviews scored <score>" in fused_prompt
+    assert "a score of <score>, 0.5" in fused_prompt
+
+
+def test_fuse_quota_and_usage(completion, fake_client):
+    llm = LLMFunc(model="gpt-4o", openai_api_key="sk-test")
+    calls = []
+    usage = {"prompt_tokens": 1000, "completion_tokens": 100, "total_tokens": 1100}
+    llm.openai_client = fake_client(lambda **kwargs: completion(json.dumps({"summarize": {"summary": "s"}, "tag": {"tags": ["t"]}}), usage=usage, model="gpt-4o"), calls)
+
+    @llm.quota(max_tokens=1000)
+    def summarize(document) -> Summary:  # type: ignore
+        """Summarize {document}"""
+
+    @llm
+    def tag(document) -> Tags:  # type: ignore
+        """Tag {document}"""
+
+    views = llm.fuse(summarize, tag)
+    results = views(document="doc")
+    # Each function is charged and records half of the fused request
+    assert results["summarize"].usage.total_tokens == 550
+    for fn in [summarize, tag]:
+        total = fn.usage()  # type: ignore
+        assert (total.prompt_tokens, total.completion_tokens, total.requests) == (500, 50, 1)
+
+    views(document="doc")
+    # summarize spent 1100 of its 1000 tokens, the fused request isn't sent
+    with pytest.raises(QuotaExceeded):
+        views(document="doc")
+    assert len(calls) == 2
+    assert tag.usage().requests == 2  # type: ignore
+
+
+def test_fuse_schedule():
+    llm = LLMFunc(openai_api_key="sk-test", scheduler=Scheduler(max_size=1))
+
+    @llm.schedule("batch", max_queue_wait=5)
+    def summarize(document) -> Summary:  # type: ignore
+        """Summarize {document}"""
+
+    @llm.schedule("interactive", weight=2)
+    def tag(document) -> Tags:  # type: ignore
+        """Tag {document}"""
+
+    schedule = llm._fused_spec({"summarize": summarize.spec, "tag": tag.spec}).schedule  # type: ignore
+    assert (schedule.priority, schedule.weight, schedule.max_queue_wait) == ("interactive", 2, 5)
@@ -0,0 +1,84 @@
+import asyncio
+import json
+from typing import Literal
+import pytest
+from pydantic import BaseModel
+from llm_as_function import LLMFunc, metrics
+from llm_as_function.grammar import compile_grammar
+
+class Query(BaseModel):
+    city: str
+
+
+def get_weather(query: Query) -> str:
+    """Get the weather of a city"""
+    return f"sunny in {query.city}"
+
+
+class Place(BaseModel):
+    name: str
+    inside: "Place | None" = None
+
+
+class Result(BaseModel):
+    summary: str
+    mood: Literal["good", "bad"]
+    places: list[Place] = []
+
+
+def test_compile_grammar():
+    schema = Result.model_json_schema()
+    grammar = compile_grammar(schema)
+    rules = dict(line.split(" ::= ", 1) for line in grammar.splitlines())
+
+    assert grammar.startswith("root ::= ")
+    assert rules["root-mood"] == '( "\\"good\\"" | "\\"bad\\"" ) ws'
+    # The required members first, the optional ones may be left out
+    assert rules["root"].startswith('"{" ws "\\"summary\\"" ":" ws string "," ws "\\"mood\\"" ":" ws root-mood ( "," ws root-rest-0 )?')
+    # A recursive model refers to its own rule
+    assert "Place" in rules["Place-def-inside"] and rules["Place"] == "Place-def"
+    # Cached by schema
+    assert compile_grammar(json.loads(json.dumps(schema))) is grammar
+
+
+@pytest.fixture()
+def server(completion, chat_server):
+    """A llama.cpp-like server, calling get_weather with invalid arguments first"""
+
+    def answer(body):
+        tool_outputs = [message["content"] for message in body["messages"] if message["role"] == "tool"]
+        if body.get("tools") and not tool_outputs:
+            return completion.payload(tool_calls=[completion.tool_call("get_weather", {"town": "Paris"}, id="call_1")], model="local")
+        if body["messages"][0]["content"].startswith("These arguments"):
+            return completion.payload('{"city": "Paris"}', model="local")
+        return completion.payload(json.dumps({"summary": tool_outputs[0] if tool_outputs else "ok", "mood": "good"}), model="local")
+
+    return chat_server(answer)
+
+
+@pytest.mark.parametrize("transport,grammar,field", [("sdk", "llama.cpp", "grammar"), ("httpx", "vllm", "guided_grammar")])
+def test_constrained_local_server(server, transport, grammar, field):
+    llm = LLMFunc(model="local", provider="openai_compatible", openai_base_url=server.base_url, transport=transport, grammar=grammar, has_tool_support=True)
+
+    @llm
+    def summarize(text) -> Result:  # type: ignore
+        """{text}"""
+
+    assert summarize(text="hello").unpack()["mood"] == "good"
+    assert server.bodies[0][field] == compile_grammar(Result.model_json_schema())
+    assert "response_format" not in server.bodies[0]
+
+    @llm.func(get_weather)
+    def weather_report(city) -> Result:  # type: ignore
+        """Report the weather of {city}"""
+
+    server.bodies.clear()
+    repaired = metrics.get("tool_arguments_repaired", tool="get_weather")
+    assert asyncio.run(llm.async_call(weather_report)(city="Paris")).unpack()["summary"] == "sunny in Paris"  # type: ignore
+    # The tool turns are constrained by the server from the tools, the invalid arguments are asked again with their grammar
+    assert field not in server.bodies[0] and field not in server.bodies[2]
+    assert server.bodies[1][field] == compile_grammar(Query.model_json_schema())
+    assert metrics.get("tool_arguments_repaired", tool="get_weather") == repaired + 1
+
+    with pytest.raises(AssertionError):
+        LLMFunc(model="gpt-4o", grammar="llama.cpp")
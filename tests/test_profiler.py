@@ -0,0 +1,73 @@
+import asyncio
+import json
+from pydantic import BaseModel
+from llm_as_function import LLMFunc, Scheduler, fan_out, profile
+
+
+class Result(BaseModel):
+    summary: str
+
+
+class Query(BaseModel):
+    city: str
+
+
+def get_weather(query: Query) -> str:
+    """Get the weather of a city"""
+    return "sunny"
+
+
+def test_call_tree(completion, fake_client):
+    llm = LLMFunc(model="gpt-4o", openai_api_key="sk-test", has_tool_support=True, scheduler=Scheduler(max_size=1))
+
+    usage = {"prompt_tokens": 100, "completion_tokens": 10, "total_tokens": 110}
+
+    async def create(**kwargs):
+        await asyncio.sleep(0.01)
+        called_tool = any(message.get("role") == "tool" for message in kwargs["messages"] if isinstance(message, dict))
+        if kwargs["messages"][0]["content"].startswith("Report") and not called_tool:
+            return completion(tool_calls=[completion.tool_call("get_weather", {"city": "Paris"}, id="1")], usage=usage, model="gpt-4o")
+        return completion(json.dumps({"summary": "ok"}), usage=usage, model="gpt-4o")
+
+    llm.openai_async_client = fake_client(create, is_async=True)
+
+    @llm.func(get_weather).async_call
+    def ask_weather(city) -> Result:  # type: ignore
+        """Report the weather of {city}"""
+
+    @llm.async_call
+    async def research(topic) -> Result:  # type: ignore
+        """Summarize the research on {topic}: {answers}"""
+        answers = await fan_out((ask_weather, {"city": "Paris"}), (ask_weather, {"city": "Rome"}))
+        return {"answers": answers}
+
+    async def main():
+        with profile() as profiler:
+            await research(topic="climate")  # type: ignore
+        return profiler
+
+    profiler = asyncio.run(main())
+
+    [root] = profiler.roots
+    assert root.name.endswith("research")
+    children = [child.name for child in root.children]
+    assert sum(name.endswith("ask_weather") for name in children) == 2 and children.count("request") == 1
+
+    ask = next(child for child in root.children if child.name.endswith("ask_weather"))
+    assert [child.name for child in ask.children] == ["request", "get_weather", "request"]
+    assert ask.tool_calls == 1
+
+    usage, queue_seconds, tool_calls = root.inclusive()
+    assert usage.requests == 5 and usage.total_tokens == 550 and tool_calls == 2
+    assert queue_seconds > 0  # The two ask_weather calls share one slot
+
+    events = profiler.chrome_trace()["traceEvents"]
+    assert len(events) == len(profiler.nodes()) == 10
+    # Concurrent siblings are on different tracks
+    asks = [event for event in events if event["name"].endswith("ask_weather")]
+    assert asks[0]["tid"] != asks[1]["tid"]
+
+    stacks = dict(line.rsplit(" ", 1) for line in profiler.collapsed("tokens").splitlines())
+    research_name, ask_name = root.name, ask.name
+    assert stacks[f"{research_name};{ask_name};request"] == "440"  # Both calls, two requests each
+    assert stacks[f"{research_name};request"] == "110"
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import pytest
+from pydantic import BaseModel
+from llm_as_function import LLMFunc
+from llm_as_function.openai_provider import OPENAI_FUNCTIONS
+from llm_as_function.providers import PROVIDERS, Provider, ProviderFunctions, model_factory, register_provider
+
+class Answer(BaseModel):
+    label: str
+
+
+@pytest.fixture()
+def server(completion, chat_server):
+    """A vLLM-like server: one choice per request, whatever the `n`"""
+    usage = {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13}
+    return chat_server(lambda body: completion.payload(json.dumps({"label": "positive"}), usage=usage, model=body["model"]))
+
+
+def test_model_names():
+    assert model_factory("gpt-4o") == "openai"
+    assert model_factory("qwen2:1.5b") == "ollama"
+    with pytest.raises(NotImplementedError):
+        LLMFunc(model="Qwen/Qwen2.5-7B-Instruct")
+    with pytest.raises(ValueError):
+        LLMFunc(model="gpt-4o", provider="unknown")
+
+
+@pytest.mark.parametrize("transport", ["sdk", "httpx"])
+def test_openai_compatible_server(server, transport):
+    llm = LLMFunc(model="Qwen/Qwen2.5-7B-Instruct", provider="openai_compatible", openai_base_url=server.base_url, transport=transport)
+
+    @llm.samples(3, reducer="all")
+    def classify(text) -> Answer:  # type: ignore
+        """Classify {text}"""
+
+    result = classify(text="great")
+    assert [sample["label"] for sample in result.unpack()["samples"]] == ["positive"] * 3
+    assert result.usage.requests == 3  # type: ignore
+    # The samples are concurrent requests without `n`
+    assert len(server.bodies) == 3 and all("n" not in body for body in server.bodies)
+
+    server.bodies.clear()
+    assert asyncio.run(llm.async_call(classify)(text="meh")).unpack()["samples"][0] == {"label": "positive"}  # type: ignore
+    assert len(server.bodies) == 3
+
+    with pytest.raises(ValueError):
+        LLMFunc(model="Qwen/Qwen2.5-7B-Instruct", provider="openai_compatible")
+
+
+def test_registered_provider(completion, fake_client):
+    created = []
+
+    def create(query, client, **options):
+        created.append(options)
+        return client.chat.completions.create()
+
+    client = fake_client(lambda: completion('{"label": "custom"}'))
+    functions = ProviderFunctions(create, OPENAI_FUNCTIONS.acreate, OPENAI_FUNCTIONS.payload, lambda llm_func: (client, client), OPENAI_FUNCTIONS.warmup, OPENAI_FUNCTIONS.awarmup)
+    register_provider(Provider("custom", "openai", functions, model_prefixes=("custom-",), supports_json_mode=False, supports_tools=False))
+    try:
+        llm = LLMFunc(model="custom-1", has_tool_support=True)
+
+        @llm
+        def classify(text) -> Answer:  # type: ignore
+            """Classify {text}"""
+
+        assert classify(text="x").unpack() == {"label": "custom"}
+        assert created[0]["json_mode"] is False and created[0]["model"] == "custom-1"
+        with pytest.raises(NotImplementedError):
+            llm.func(classify)
+    finally:
+        PROVIDERS.pop("custom")
@@ -1,5 +1,6 @@
 import json
 from llm_as_function import gpt35_func
+from llm_as_function.types import empty_runtime_options
 from copy import copy, deepcopy
 from pydantic import BaseModel, Field
 
@@ -43,4 +44,22 @@ def test_func_reset():
         You need to randomly output an emoji
         """
 
-    assert gpt35_func.runtime_options == {}
+    assert gpt35_func.runtime_options == empty_runtime_options()
+
+
+def test_no_tool_leak():
+    @gpt35_func.func(get_current_weather)
+    def with_tool() -> Fool:  # type: ignore
+        """
+        You need to randomly output an emoji
+        """
+
+    @gpt35_func
+    def without_tool() -> Fool:  # type: ignore
+        """
+        You need to randomly output an emoji
+        """
+
+    assert len(with_tool.spec.tools) == 1  # type: ignore
+    assert without_tool.spec.tools == ()  # type: ignore
+    assert gpt35_func.runtime_options == empty_runtime_options()
@@ -0,0 +1,89 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Literal
+import ollama
+from pydantic import BaseModel
+from llm_as_function import LLMFunc, Final
+from llm_as_function.sampling import all_samples, first_valid, majority
+
+
+class Answer(BaseModel):
+    label: Literal["positive", "negative"]
+    score: int
+
+
+def test_reducers():
+    finals = [Final({"label": "positive", "score": 1}), Final(raw_response="oops"), Final({"label": "negative", "score": 2}), Final({"label": "positive", "score": 2})]
+
+    assert majority(finals, Answer).unpack() == {"label": "positive", "score": 2}
+    assert first_valid(finals, Answer).unpack() == {"label": "positive", "score": 1}
+    assert len(all_samples(finals, Answer).unpack()["samples"]) == 3
+    assert first_valid([Final(raw_response="oops")], Answer).unpack() == "oops"
+
+
+def test_openai_samples_in_one_request(completion, fake_client):
+    llm = LLMFunc(openai_api_key="sk-test")
+    calls = []
+    samples = ['{"label": "negative", "score": 3}', '{"label": "positive", "score": 3}', "not json", '{"label": "positive", "score": 1}']
+    llm.openai_client = fake_client([completion(samples=samples)], calls)
+
+    @llm.samples(4, reducer="majority")
+    def classify(text) -> Answer:  # type: ignore
+        """Classify {text}"""
+
+    assert classify(text="great").unpack() == {"label": "positive", "score": 3}
+    assert len(calls) == 1
+    assert calls[0]["n"] == 4
+
+
+class Query(BaseModel):
+    city: str
+
+
+def get_weather(query: Query) -> str:
+    """Get the weather of a city"""
+    return "sunny"
+
+
+def test_samples_of_the_final_answer_only(completion, fake_client):
+    llm = LLMFunc(openai_api_key="sk-test", has_tool_support=True)
+    calls = []
+    responses = [
+        completion(tool_calls=[completion.tool_call("get_weather", {"city": "Paris"})]),
+        completion('{"label": "positive", "score": 1}'),
+        completion(samples=['{"label": "negative", "score": 2}', '{"label": "positive", "score": 3}']),
+    ]
+    llm.openai_async_client = fake_client(responses, calls, is_async=True)
+
+    @llm.samples(3, reducer="all").func(get_weather).async_call
+    def classify(city) -> Answer:  # type: ignore
+        """Classify the weather of {city}"""
+
+    result = asyncio.run(classify(city="Paris"))  # type: ignore
+    assert [sample["score"] for sample in result.unpack()["samples"]] == [1, 2, 3]
+    # The tool turns draw one sample, the other samples of the answer are drawn without tools
+    assert "n" not in calls[0] and "n" not in calls[1]
+    assert calls[2]["n"] == 2 and calls[2]["tool_choice"] == "none"
+    assert calls[2]["messages"] == calls[1]["messages"]
+
+
+def test_ollama_concurrent_samples():
+    llm = LLMFunc(model="llama3.1", has_structured_output=True)
+    payloads = []
+    contents = ['{"label": "negative", "score": 1}', '{"label": "negative", "score": 1}', '{"label": "positive", "score": 2}']
+
+    async def chat(**payload):
+        payloads.append(payload)
+        await asyncio.sleep(0.01)
+        return ollama.ChatResponse(done=True, done_reason="stop", message=ollama.Message(role="assistant", content=contents.pop(0)))
+
+    llm.ollama_async_client = SimpleNamespace(chat=chat)
+
+    @llm.samples(3, reducer="all").async_call
+    def classify(text) -> Answer:  # type: ignore
+        """Classify {text}"""
+
+    result = asyncio.run(classify(text="meh"))  # type: ignore
+    assert len(result.unpack()["samples"]) == 3
+    assert len(payloads) == 3
+    assert "n" not in payloads[0]
@@ -0,0 +1,114 @@
+import asyncio
+import pytest
+from llm_as_function import LLMFunc, Scheduler, call_priority
+from llm_as_function.errors import LoadShedError
+from pydantic import BaseModel
+
+
+class Result(BaseModel):
+    summary: str
+
+
+async def run(scheduler: Scheduler, order: list, flow: str, priority="default", weight=1.0, max_queue_wait=None):
+    async with scheduler.slot(flow, priority, weight, max_queue_wait):
+        order.append(flow)
+        await asyncio.sleep(0.01)
+
+
+def test_priority_and_fair_share():
+    async def main():
+        scheduler = Scheduler(max_size=1)
+        order = []
+        blocker = asyncio.ensure_future(run(scheduler, order, "blocker"))
+        await asyncio.sleep(0)
+        # A batch flood queued before two interactive requests, and two functions sharing the default class 2:1
+        tasks = [run(scheduler, order, "batch", "batch") for _ in range(3)]
+        tasks += [run(scheduler, order, "heavy", weight=2) for _ in range(4)] + [run(scheduler, order, "light") for _ in range(2)]
+        tasks += [run(scheduler, order, "user", "interactive") for _ in range(2)]
+        await asyncio.gather(blocker, *tasks)
+        return order
+
+    order = asyncio.run(main())
+    assert order[:3] == ["blocker", "user", "user"]
+    assert order[3:9] == ["heavy", "heavy", "light", "heavy", "heavy", "light"]
+    assert order[9:] == ["batch"] * 3
+
+
+def test_load_shedding():
+    async def main():
+        scheduler = Scheduler(max_size=1)
+        order = []
+        # Learn the service time of a request
+        await run(scheduler, order, "warm")
+        blockers = [asyncio.ensure_future(run(scheduler, order, "slow")) for _ in range(5)]
+        await asyncio.sleep(0)
+
+        # 4 requests queued of about 10ms each, can't make it in 5ms
+        with pytest.raises(LoadShedError):
+            await run(scheduler, order, "late", max_queue_wait=0.005)
+        await asyncio.gather(*blockers)
+        assert scheduler.active == 0
+        assert "late" not in order
+
+    asyncio.run(main())
+
+
+def test_llm_func_scheduler():
+    llm = LLMFunc(openai_api_key="sk-test", async_max_time=1)
+    assert llm.scheduler is not None and llm.scheduler.max_size == 1
+
+    @llm.schedule(priority="batch").async_call
+    def fool() -> Result:  # type: ignore
+        """Say hi"""
+
+    async def main():
+        async with llm.scheduler.slot():
+            with call_priority("interactive", max_queue_wait=0.01):
+                # The only slot is taken, the call fails at its deadline instead of waiting
+                await fool()  # type: ignore
+
+    with pytest.raises(LoadShedError):
+        asyncio.run(main())
+
+
+def test_cancelled_call_releases_its_slot(completion, fake_client):
+    llm = LLMFunc(openai_api_key="sk-test", async_max_time=1)
+    delays = [1, 0]
+
+    async def create(**kwargs):
+        await asyncio.sleep(delays.pop(0))
+        return completion('{"summary": "ok"}')
+
+    llm.openai_async_client = fake_client(create, is_async=True)
+
+    @llm.async_call
+    def fool() -> Result:  # type: ignore
+        """Say hi"""
+
+    async def main():
+        with pytest.raises(TimeoutError):
+            await fool(deadline=0.1)  # type: ignore
+        assert llm.scheduler.active == 0  # type: ignore
+        return await asyncio.wait_for(fool(), 1)  # type: ignore
+
+    assert asyncio.run(main()).unpack() == {"summary": "ok"}
+
+
+def test_adaptive_limit():
+    from llm_as_function import AdaptiveLimit, metrics
+
+    async def main():
+        scheduler = Scheduler(max_size=2, adaptive=AdaptiveLimit(max_size=8, latency_tolerance=None), name="adaptive-test")
+        # Requests queue up behind the limit, which grows
+        await asyncio.gather(*[run(scheduler, [], "flood") for _ in range(40)])
+        grown = scheduler.limit
+        assert grown > 2
+
+        scheduler.observe(429, {})
+        assert scheduler.limit == grown * 0.5
+
+        scheduler.observe(200, {"x-ratelimit-remaining-requests": "1"})
+        assert scheduler.max_size == 1
+        assert metrics.get("llm_concurrency_limit", scheduler="adaptive-test") == 1
+
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+import asyncio
+from types import SimpleNamespace
+import ollama
+from llm_as_function.ollama_provider import ollama_astream_until_json, ollama_stream_until_json
+from llm_as_function.utils import JSONObjectScanner
+
+# The model keeps talking after its JSON, the last chunk has the stats of the whole generation
+CHUNKS = ["Sure ", '{"emoji": ', '"}"}', " Hope", " this helps", "!"]
+
+
+def chunk(content: str, done: bool = False, done_reason: str | None = None, eval_count: int | None = None) -> ollama.ChatResponse:
+    return ollama.ChatResponse(model="llama3.1", done=done, done_reason=done_reason, eval_count=eval_count, message=ollama.Message(role="assistant", content=content))
+
+
+def stream_chunks(contents: list[str], done_reason: str, events: list):
+    """The chunks of a stream of the contents, the chunks read and the close are recorded in events"""
+    try:
+        for i, content in enumerate(contents):
+            events.append(content)
+            last = i == len(contents) - 1
+            yield chunk(content, done=last, done_reason=done_reason if last else None, eval_count=len(contents) if last else None)
+    finally:
+        events.append("closed")
+
+
+def fake_client(contents: list[str], done_reason: str, events: list, is_async: bool = False):
+    def chat(**payload):
+        assert payload["stream"] is True
+        return stream_chunks(contents, done_reason, events)
+
+    async def achat(**payload):
+        async def stream():
+            chunks = chat(**payload)
+            try:
+                for response in chunks:
+                    yield response
+            finally:
+                chunks.close()
+
+        return stream()
+
+    return SimpleNamespace(chat=achat if is_async else chat)
+
+
+def test_scanner_stops_at_first_object():
+    scanner = JSONObjectScanner()
+    chunks = ["Sure! ", '{"emoji": "}", ', '"nested": {"a": "\\"{"}', '}\nHope this ', "helps!"]
+
+    completed = [scanner.feed(chunk) for chunk in chunks]
+
+    assert completed == [False, False, False, True, True]
+    assert scanner.text == 'Sure! {"emoji": "}", "nested": {"a": "\\"{"}}'
+
+
+def test_scanner_incomplete():
+    scanner = JSONObjectScanner()
+
+    assert not scanner.feed('{"emoji": "a')
+    assert not scanner.complete
+
+
+def test_stream_until_json():
+    events = []
+    response = ollama_stream_until_json(fake_client(CHUNKS, "stop", events), {"model": "llama3.1"})
+
+    # Closed right after the chunk completing the object
+    assert events == CHUNKS[:3] + ["closed"]
+    assert response.message.content == 'Sure {"emoji": "}"}'
+    # One token per chunk read, the generation stopped at the JSON
+    assert response.done and response.done_reason == "stop" and response.eval_count == 3
+
+    events = []
+    response = ollama_stream_until_json(fake_client(['{"emoji": ', '"a'], "length", events), {"model": "llama3.1"})
+    # A stream that ends before the object is complete keeps its own stats
+    assert events == ['{"emoji": ', '"a', "closed"]
+    assert response.message.content == '{"emoji": "a' and response.done_reason == "length" and response.eval_count == 2
+
+
+def test_astream_until_json():
+    events = []
+    response = asyncio.run(ollama_astream_until_json(fake_client(CHUNKS, "stop", events, is_async=True), {"model": "llama3.1"}))
+
+    assert events == CHUNKS[:3] + ["closed"]
+    assert response.message.content == 'Sure {"emoji": "}"}'
+    assert response.done_reason == "stop" and response.eval_count == 3 and response.model == "llama3.1"
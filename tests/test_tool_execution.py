@@ -0,0 +1,188 @@
+import asyncio
+import json
+import os
+import time
+import pytest
+from pydantic import BaseModel, Field
+from llm_as_function import LLMFunc, Final, ToolCache
+
+
+class Result(BaseModel):
+    summary: str = Field(description="The response summary sentence")
+
+
+class ScoreRequest(BaseModel):
+    text: str = Field(description="The text to score")
+
+
+def score_text(request: ScoreRequest):
+    """
+    Score a text, CPU heavy
+    """
+    return json.dumps({"pid": os.getpid(), "score": sum(ord(c) for c in request.text)})
+
+
+def slow_tool(request: ScoreRequest):
+    """
+    Takes too long
+    """
+    time.sleep(1)
+    return "done"
+
+
+async def async_tool(request: ScoreRequest):
+    """
+    An async tool
+    """
+    await asyncio.sleep(0.01)
+    return f"async {request.text}"
+
+
+RUNS = []
+
+
+def counted_tool(request: ScoreRequest):
+    """
+    Counts its runs
+    """
+    RUNS.append(request.text)
+    return f"ran {request.text}"
+
+
+def tool_turn(completion, *calls):
+    """A turn calling the tools with the given (name, arguments)"""
+    return completion(tool_calls=[completion.tool_call(name, arguments, id=f"call_{i}") for i, (name, arguments) in enumerate(calls)])
+
+
+def tool_messages(call):
+    return [message for message in call["messages"] if isinstance(message, dict) and message["role"] == "tool"]
+
+
+def test_process_tool(completion, fake_client):
+    llm = LLMFunc(openai_api_key="sk-test", has_tool_support=True, max_process_workers=1)
+    calls = []
+    llm.openai_client = fake_client([tool_turn(completion, ("score_text", {"text": "abc"})), completion('{"summary": "ok"}')], calls)
+
+    @llm.func(score_text, executor="process")
+    def fool() -> Result:  # type: ignore
+        """Score abc"""
+
+    assert fool().unpack() == {"summary": "ok"}
+    response = json.loads(tool_messages(calls[1])[0]["content"])
+    assert response["score"] == 294
+    assert response["pid"] != os.getpid()
+
+
+def test_async_tools_and_timeout(completion, fake_client):
+    llm = LLMFunc(openai_api_key="sk-test", has_tool_support=True)
+    calls = []
+    llm.openai_async_client = fake_client(
+        [tool_turn(completion, ("async_tool", {"text": "a"}), ("score_text", {"text": "b"})), completion('{"summary": "ok"}')], calls, is_async=True
+    )
+
+    @llm.func(async_tool).func(score_text).async_call
+    def fool() -> Result:  # type: ignore
+        """Score a and b"""
+
+    assert asyncio.run(fool()).unpack() == {"summary": "ok"}  # type: ignore
+    assert [message["content"] for message in tool_messages(calls[1])][0] == "async a"
+
+    llm.openai_client = fake_client([tool_turn(completion, ("slow_tool", {"text": "a"}))], [])
+
+    @llm.func(slow_tool, timeout=0.05)
+    def too_slow() -> Result:  # type: ignore
+        """Run the slow tool"""
+
+    with pytest.raises(TimeoutError):
+        too_slow()
+
+
+def test_sync_tool_loop_in_event_loop(completion, fake_client):
+    llm = LLMFunc(openai_api_key="sk-test", has_tool_support=True)
+    calls = []
+    llm.openai_client = fake_client(
+        lambda **kwargs: completion('{"summary": "ok"}') if tool_messages(kwargs) else tool_turn(completion, ("async_tool", {"text": "a"}), ("score_text", {"text": "b"})),
+        calls,
+    )
+
+    @llm.func(async_tool).func(score_text, timeout=1)
+    def fool() -> Result:  # type: ignore
+        """Score a and b"""
+
+    @llm.async_call
+    def outer() -> Result:  # type: ignore
+        """Unused"""
+        # A sync body runs in the executor, off the event loop
+        return Final(fool().unpack())
+
+    async def main():
+        # A sync call from async code, its async tool can't run on the busy loop
+        assert fool().unpack() == {"summary": "ok"}
+        return await outer()  # type: ignore
+
+    assert fool().unpack() == {"summary": "ok"}
+    assert asyncio.run(main()).unpack() == {"summary": "ok"}
+    assert len(calls) == 6
+    assert all([message["content"] for message in tool_messages(call)][0] == "async a" for call in calls[1::2])
+
+
+def test_blocking_tool_in_async_call(completion, fake_client):
+    llm = LLMFunc(openai_api_key="sk-test", has_tool_support=True)
+
+    async def answer(**kwargs):
+        if "Score slowly" not in kwargs["messages"][0]["content"]:
+            await asyncio.sleep(0.2)  # Still in flight while the slow tool runs
+        elif not tool_messages(kwargs):
+            return tool_turn(completion, ("slow_tool", {"text": "a"}))
+        return completion('{"summary": "ok"}')
+
+    llm.openai_async_client = fake_client(answer, is_async=True)
+    finished = {}
+
+    @llm.func(slow_tool).async_call
+    def slow() -> Result:  # type: ignore
+        """Score slowly"""
+
+    @llm.async_call
+    def quick() -> Result:  # type: ignore
+        """Answer quickly"""
+
+    async def run(name, fn):
+        result = await fn()
+        finished[name] = time.perf_counter() - start
+        return result
+
+    async def main():
+        # The sync tool sleeps in the executor, the event loop keeps serving the other call
+        return await asyncio.gather(run("slow", slow), run("quick", quick))
+
+    start = time.perf_counter()
+    results = asyncio.run(main())
+    assert [result.unpack() for result in results] == [{"summary": "ok"}] * 2
+    assert list(finished) == ["quick", "slow"]
+    assert finished["quick"] < 0.8 and finished["slow"] >= 1
+
+
+def test_process_policy_validation():
+    llm = LLMFunc(openai_api_key="sk-test", has_tool_support=True)
+
+    with pytest.raises(ValueError):
+        llm.func(async_tool, executor="process")
+
+
+def test_tool_cache(completion, fake_client):
+    llm = LLMFunc(openai_api_key="sk-test", has_tool_support=True)
+    cache = ToolCache(maxsize=8)
+    duplicate_turn = tool_turn(completion, ("counted_tool", {"text": "a"}), ("counted_tool", {"text": "a"}), ("counted_tool", {"text": "b"}))
+    llm.openai_async_client = fake_client([duplicate_turn, completion('{"summary": "ok"}'), duplicate_turn, completion('{"summary": "ok"}')], [], is_async=True)
+
+    @llm.func(counted_tool, cache=cache).async_call
+    def fool() -> Result:  # type: ignore
+        """Run the tool"""
+
+    asyncio.run(fool())  # type: ignore
+    assert sorted(RUNS) == ["a", "b"]
+
+    asyncio.run(fool())  # type: ignore
+    assert sorted(RUNS) == ["a", "b"]
+    assert cache.hits == 4 and cache.misses == 2
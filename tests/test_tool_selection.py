@@ -0,0 +1,86 @@
+import pytest
+from pydantic import BaseModel, Field
+from llm_as_function import LLMFunc
+from llm_as_function.fn_calling import tool_name
+from llm_as_function.tool_selection import BM25Index, tokenize
+
+
+class Result(BaseModel):
+    summary: str = Field(description="The response summary sentence")
+
+
+class Query(BaseModel):
+    text: str = Field(description="The query")
+
+
+def get_current_weather(query: Query):
+    """
+    Get the current weather forecast of a city
+    """
+    return "sunny"
+
+
+def search_flights(query: Query):
+    """
+    Search the flights between two airports
+    """
+    return "none"
+
+
+def convert_currency(query: Query):
+    """
+    Convert an amount of money between currencies
+    """
+    return "1.0"
+
+
+def get_time(query: Query):
+    """
+    Get the current time
+    """
+    return "noon"
+
+
+def test_tokenize():
+    assert tokenize("getCurrentWeather search_flights HTTPServer v2") == ["get", "current", "weather", "search", "flights", "http", "server", "v", "2"]
+
+
+def test_bm25_ranking():
+    index = BM25Index(["weather forecast of a city", "flights between airports", "money and currencies"])
+    scores = index.scores("Will it rain in the city tomorrow? Check the forecast")
+    assert scores.index(max(scores)) == 0
+    assert scores[1] == scores[2] == 0
+
+
+def test_select_tools():
+    selecting_func = LLMFunc(openai_api_key="sk-test", has_tool_support=True)
+
+    @selecting_func.func(get_current_weather).func(search_flights).func(convert_currency).func(get_time).select_tools(1, pinned=[get_time])
+    def travel(question) -> Result:  # type: ignore
+        """
+        Answer the question: {question}
+        """
+
+    report = travel.dry_run(question="What is the weather forecast in Paris?")  # type: ignore
+    assert [tool_name(tool) for tool in report.payload["tools"]] == ["get_current_weather", "get_time"]
+
+    report = travel.dry_run(question="Find me flights to the Lisbon airport")  # type: ignore
+    assert [tool_name(tool) for tool in report.payload["tools"]] == ["search_flights", "get_time"]
+
+    # A custom scorer replaces BM25
+    @selecting_func.func(get_current_weather).func(search_flights).func(convert_currency).select_tools(1, scorer=lambda query, documents: [doc.startswith("convert") for doc in documents])
+    def converting(question) -> Result:  # type: ignore
+        """
+        Answer the question: {question}
+        """
+
+    report = converting.dry_run(question="anything")  # type: ignore
+    assert [tool_name(tool) for tool in report.payload["tools"]] == ["convert_currency"]
+
+    with pytest.raises(ValueError):
+
+        @selecting_func.func(get_current_weather).select_tools(1, pinned=["get_time"])
+        def unknown(question) -> Result:  # type: ignore
+            """
+            Answer the question: {question}
+            """
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import openai
+import pytest
+from pydantic import BaseModel
+from llm_as_function import LLMFunc
+from llm_as_function.transport import WireDict, decode_chat_completion, encode_chat_body
+
+class Query(BaseModel):
+    city: str
+
+
+def get_weather(query: Query) -> str:
+    """Get the weather of a city"""
+    return f"sunny in {query.city}"
+
+
+class Result(BaseModel):
+    summary: str
+
+
+@pytest.fixture()
+def server(completion, chat_server):
+    """An OpenAI compatible endpoint calling get_weather once, then answering with the tool output"""
+    usage = {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15, "prompt_tokens_details": {"cached_tokens": 2}}
+
+    def answer(body):
+        if body["messages"][0]["content"].startswith("limit"):
+            return 429, {"error": {"message": "Rate limit reached", "type": "requests"}}
+
+        tool_outputs = [message["content"] for message in body["messages"] if message["role"] == "tool"]
+        if body.get("tools") and not tool_outputs:
+            payload = completion.payload(tool_calls=[completion.tool_call("get_weather", {"city": "Paris"}, id="call_1")], usage=usage)
+        else:
+            payload = completion.payload(json.dumps({"summary": tool_outputs[0] if tool_outputs else "ok"}), usage=usage)
+        payload["choices"][0]["message"]["refusal"] = None
+        return payload
+
+    return chat_server(answer)
+
+
+def test_encode_and_decode():
+    tools = [{"type": "function", "function": {"name": "get_weather", "parameters": {}}}]
+    payload = {"model": "gpt-fake", "messages": [{"role": "user", "content": "hi"}], "temperature": 0.1, "tools": tools}
+    assert json.loads(encode_chat_body(payload)) == payload
+    # The static part is reused, the messages are not
+    payload["messages"] = [{"role": "user", "content": "bye"}]
+    assert json.loads(encode_chat_body(payload)) == payload
+
+    completion = decode_chat_completion(b'{"choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "x", "refusal": null}}]}')
+    message = completion.choices[0].message
+    assert message == {"role": "assistant", "content": "x"} and message.tool_calls is None and completion.usage is None
+    assert isinstance(message, WireDict)
+
+
+def test_tool_loop_over_raw_transport(server):
+    llm = LLMFunc(openai_api_key="sk-test", openai_base_url=server.base_url, has_tool_support=True, transport="httpx")
+
+    @llm.func(get_weather)
+    def weather_report(city) -> Result:  # type: ignore
+        """Report the weather of {city}"""
+
+    result = weather_report(city="Paris")
+    assert result.unpack() == {"summary": "sunny in Paris"}
+    assert result.usage.requests == 2 and result.usage.cached_tokens == 4  # type: ignore
+    # The assistant tool call is sent back with only its content and tool calls
+    assert server.bodies[1]["messages"][1] == {"role": "assistant", "content": None, "tool_calls": server.bodies[1]["messages"][1]["tool_calls"]}
+    assert server.bodies[1]["messages"][2]["tool_call_id"] == "call_1"
+
+    @llm.async_call
+    def summarize(text) -> Result:  # type: ignore
+        """{text}"""
+
+    assert asyncio.run(summarize(text="hello")).unpack() == {"summary": "ok"}  # type: ignore
+
+    with pytest.raises(openai.APIStatusError) as error:
+        asyncio.run(summarize(text="limit"))  # type: ignore
+    assert error.value.status_code == 429
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import time
+import pytest
+from pydantic import BaseModel
+from llm_as_function import LLMFunc, Final, Quota, Usage
+from llm_as_function.errors import QuotaExceeded
+
+
+class Result(BaseModel):
+    summary: str
+
+
+class Query(BaseModel):
+    city: str
+
+
+def get_weather(query: Query) -> str:
+    """Get the weather of a city"""
+    return "sunny"
+
+
+USAGE = {"prompt_tokens": 1000, "completion_tokens": 100, "total_tokens": 1100, "prompt_tokens_details": {"cached_tokens": 400}}
+
+
+@pytest.fixture()
+def answer(completion):
+    return lambda **kwargs: completion(json.dumps({"summary": "ok"}), usage=USAGE, model="gpt-4o")
+
+
+@pytest.fixture()
+def tool_call(completion):
+    return completion(tool_calls=[completion.tool_call("get_weather", {"city": "Paris"}, id="1")], usage=USAGE, model="gpt-4o")
+
+
+def test_usage_of_every_tool_loop_step(fake_client, answer, tool_call):
+    llm = LLMFunc(model="gpt-4o", openai_api_key="sk-test", has_tool_support=True)
+    llm.openai_client = fake_client([tool_call, answer()])
+
+    @llm.func(get_weather)
+    def weather_report(city) -> Result:  # type: ignore
+        """Report the weather of {city}"""
+
+    result = weather_report(city="Paris")
+    # 600 uncached + 400 cached prompt tokens and 100 completion tokens per request, at $2.5, $1.25 and $10 per million
+    assert result.usage == Usage(prompt_tokens=2000, completion_tokens=200, cached_tokens=800, cost=2 * 0.003, requests=2)
+    assert result == Final({"summary": "ok"})  # The usage is not part of the result
+
+    total = weather_report.usage()  # type: ignore
+    assert total.requests == 2 and total.cost == pytest.approx(0.006)
+
+
+def test_usage_by_module(fake_client, answer):
+    llm = LLMFunc(model="gpt-4o", openai_api_key="sk-test")
+    llm.openai_client = fake_client(answer)
+    summaries = []
+    for module in ["billing.reports", "support.reports"]:
+
+        def summarize(text) -> Result:  # type: ignore
+            """Summarize {text}"""
+
+        # The same qualname in two modules
+        summarize.__module__ = module
+        summaries.append(llm(summarize))
+
+    summaries[0](text="a")
+    summaries[0](text="b")
+    summaries[1](text="c")
+    assert summaries[0].spec.name.startswith("billing.reports.")  # type: ignore
+    assert [summarize.usage().requests for summarize in summaries] == [2, 1]  # type: ignore
+
+
+def test_quota_rejects_once_exhausted(fake_client, answer):
+    llm = LLMFunc(model="gpt-4o", openai_api_key="sk-test")
+    llm.openai_client = fake_client(answer)
+
+    @llm.quota(max_tokens=2000)
+    def summarize(text) -> Result:  # type: ignore
+        """Summarize {text}"""
+
+    summarize(text="a")
+    summarize(text="b")
+    with pytest.raises(QuotaExceeded):
+        summarize(text="c")
+
+
+def test_shared_quota_throttles_async_calls(fake_client, answer):
+    quota = Quota(max_tokens=1100, window=0.1, mode="throttle")
+    llm = LLMFunc(model="gpt-4o", openai_api_key="sk-test", shared_quota=quota)
+    llm.openai_async_client = fake_client(answer, is_async=True)
+
+    @llm.async_call
+    def summarize(text) -> Result:  # type: ignore
+        """Summarize {text}"""
+
+    async def main():
+        start = time.perf_counter()
+        await summarize(text="a")  # type: ignore
+        # The quota is exhausted by the first request until it leaves the window
+        await summarize(text="b")  # type: ignore
+        return time.perf_counter() - start
+
+    assert asyncio.run(main()) >= 0.09
+
+    with pytest.raises(ValueError):
+        Quota(max_cost=1, mode="throttle")
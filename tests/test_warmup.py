@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import weakref
+from types import SimpleNamespace
+import pytest
+from pydantic import BaseModel
+from llm_as_function import LLMFunc, warmup_all, async_warmup_all
+from llm_as_function import llm_func as llm_func_module
+
+
+class Result(BaseModel):
+    summary: str
+
+
+class FakeOllamaClient:
+    def __init__(self):
+        self.generated = []
+
+    def generate(self, **payload):
+        self.generated.append(payload)
+
+
+class FakeAsyncOllamaClient(FakeOllamaClient):
+    async def generate(self, **payload):  # type: ignore
+        self.generated.append(payload)
+
+
+def fake_openai_client(retrieved: list, is_async: bool = False):
+    def retrieve(model):
+        retrieved.append(model)
+
+    async def aretrieve(model):
+        retrieved.append(model)
+
+    return SimpleNamespace(models=SimpleNamespace(retrieve=aretrieve if is_async else retrieve))
+
+
+@pytest.fixture()
+def registry(monkeypatch):
+    """Only the LLMFuncs of the test are warmed up by warmup_all"""
+    monkeypatch.setattr(llm_func_module, "_decorating_llm_funcs", weakref.WeakValueDictionary())
+
+
+def test_ollama_warmup():
+    ollama_func = LLMFunc(model="llama3.1", keep_alive="30m", num_ctx=4096)
+    ollama_func.ollama_client = FakeOllamaClient()
+    ollama_func.ollama_async_client = FakeAsyncOllamaClient()
+
+    ollama_func.warmup()
+    asyncio.run(ollama_func.async_warmup())
+
+    # The model is loaded with the num_ctx of the calls, or the first call would reload it
+    payload = {"model": "llama3.1", "keep_alive": "30m", "options": {"num_ctx": 4096}}
+    assert ollama_func.ollama_client.generated == [payload]
+    assert ollama_func.ollama_async_client.generated == [payload]
+
+
+def test_openai_warmup():
+    llm = LLMFunc(model="gpt-4o", openai_api_key="sk-test")
+    retrieved = []
+    llm.openai_client = fake_openai_client(retrieved)
+    llm.openai_async_client = fake_openai_client(retrieved, is_async=True)
+
+    llm.warmup()
+    asyncio.run(llm.async_warmup(connections=3))
+    assert retrieved == ["gpt-4o"] * 4
+
+
+def test_warmup_all(registry, caplog):
+    retrieved = []
+    working = LLMFunc(model="gpt-4o", openai_api_key="sk-test")
+    working.openai_client = fake_openai_client(retrieved)
+    working.openai_async_client = fake_openai_client(retrieved, is_async=True)
+    failing = LLMFunc(model="llama3.1")
+    failing.ollama_client = SimpleNamespace()  # No generate, its warmup raises
+    failing.ollama_async_client = SimpleNamespace()
+
+    @working
+    def summarize(text) -> Result:  # type: ignore
+        """Summarize {text}"""
+
+    @failing
+    def local_summarize(text) -> Result:  # type: ignore
+        """Summarize {text}"""
+
+    with caplog.at_level(logging.WARNING, logger="agent"):
+        warmup_all()
+        asyncio.run(async_warmup_all(connections=2))
+
+    assert retrieved == ["gpt-4o"] * 3
+    failures = [record.getMessage() for record in caplog.records if record.getMessage().startswith("Failed to warm up")]
+    assert len(failures) == 2 and all(failure.startswith("Failed to warm up llama3.1") for failure in failures)